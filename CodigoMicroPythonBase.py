@@ -1,23 +1,84 @@
-import uasyncio as asyncio
+try:
+    import uasyncio as asyncio
+except ImportError:  # CPython (testes com fakes de aioble/network)
+    import asyncio
 import network, time
 import bluetooth, aioble
-import urequests
-import ujson
 import struct
 import machine
 
+# Parser FTMS compartilhado com o backend (copiar bike-dashboard-backend/ftms.py para a placa)
+from ftms import IndoorBikeParser
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    import random
+except ImportError:
+    import urandom as random
+
 # ====== CONFIGURAÇÃO ======
 WIFI_SSID = "Abitah_Bikes"
 WIFI_PSK  = "01020304"
-ENDPOINT_URL = "http://172.20.10.2:8000/api/ftms"
 
-# Filtrar por nome (sem MAC)
-BIKE_NAME_SUBSTR = "BIKE-0775"    # por exemplo: "SmartBike"; ou None para aceitar qualquer FTMS
+# Backend. UPLINK = "http": lotes JSON em /api/ftms/batch (funciona com o
+# backend padrão); "tcp": registros binários na ingestão TCP do backend, que
+# só existe com INGEST_TCP_PORT definido (ver ingest_listener.py).
+BACKEND_HOST = "172.20.10.2"
+UPLINK = "http"
+HTTP_PORT = 8000
+TCP_PORT = 9001
+
+# Filtrar por nome (sem MAC); também é o nome da bike no backend
+BIKE_NAME_SUBSTR = "BIKE-0775"    # por exemplo: "SmartBike"; ou None para aceitar qualquer FTMS (nome = ID da placa)
+
+# True: encaminha a notificação FTMS crua e o backend decodifica (menos CPU e
+# memória na placa); False: decodifica aqui e envia potência/cadência/extras
+RAW_FTMS = False
+
+# Buffer entre o BLE e a rede: leituras guardadas enquanto a rede está fora
+# (cheio → descarta as mais antigas) e tamanho máximo de cada envio
+BUFFER_SIZE = 64
+BATCH_SIZE = 16
+FLUSH_INTERVAL_MS = 500
+
+# Espera entre tentativas de reconexão (dobra a cada falha, com jitter)
+BACKOFF_MIN_MS = 500
+BACKOFF_MAX_MS = 30_000
 
 # UUIDs FTMS (Assigned Numbers)
 FTMS_SERVICE_UUID = bluetooth.UUID(0x1826)
 INDOOR_BIKE_DATA_UUID = bluetooth.UUID(0x2AD2)
 
+if hasattr(asyncio, "sleep_ms"):
+    sleep_ms = asyncio.sleep_ms
+else:
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+if hasattr(time, "ticks_ms"):
+    ticks_ms = time.ticks_ms
+else:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+
+def device_name():
+    """Nome da bike no backend: BIKE_NAME_SUBSTR ou, sem filtro, o ID único da placa."""
+    if BIKE_NAME_SUBSTR:
+        return BIKE_NAME_SUBSTR
+    return "ESP32-" + "".join("{:02X}".format(b) for b in machine.unique_id())
+
+
+def now_ts():
+    # Segundos desde o boot com resolução de ms: o backend só usa diferenças
+    # de ts (ordem e espaçamento das leituras de um lote). time.time() do
+    # ESP32 tem resolução de 1 s e o float de 32 bits não representa epoch em ms.
+    return ticks_ms() / 1000
+
 # ====== REDE ======
 def wifi_connect():
     wlan = network.WLAN(network.STA_IF)
@@ -31,125 +92,248 @@ def wifi_connect():
             time.sleep_ms(200)
     return wlan.isconnected()
 
-# ====== PARSER FTMS ======
-def _u16_le(b, off):
-    # unsigned 16-bit little-endian
-    return (b[off] | (b[off+1] << 8))
-
-def _s16_le(b, off):
-    # signed 16-bit little-endian usando struct (evita signed kwarg em int.from_bytes)
-    return struct.unpack_from("<h", b, off)[0]
-
-def parse_indoor_bike_data(msg: bytes) -> dict:
-    if len(msg) < 2:
-        return {}
-
-    f0 = msg[0]
-    f1 = msg[1]
-
-    flag_more_data            = bool(f0 & 0b00000001)
-    flag_average_speed        = bool(f0 & 0b00000010)
-    flag_instant_cadence      = bool(f0 & 0b00000100)
-    flag_average_cadence      = bool(f0 & 0b00001000)
-    flag_total_distance       = bool(f0 & 0b00010000)
-    flag_resistance_level     = bool(f0 & 0b00100000)
-    flag_instant_power        = bool(f0 & 0b01000000)
-    flag_average_power        = bool(f0 & 0b10000000)
-
-    flag_expended_energy      = bool(f1 & 0b00000001)
-    flag_heart_rate           = bool(f1 & 0b00000010)
-    flag_metabolic_equivalent = bool(f1 & 0b00000100)
-    flag_elapsed_time         = bool(f1 & 0b00001000)
-    flag_remaining_time       = bool(f1 & 0b00010000)
-
-    i = 2
-    out = {}
-
-    if not flag_more_data:
-        if i + 2 <= len(msg):
-            out["instant_speed"] = _u16_le(msg, i) / 100.0
-        i += 2
-
-    if flag_average_speed:
-        if i + 2 <= len(msg):
-            out["average_speed"] = _u16_le(msg, i) / 100.0
-        i += 2
-
-    if flag_instant_cadence:
-        if i + 2 <= len(msg):
-            out["instant_cadence"] = _u16_le(msg, i) / 2.0
-        i += 2
-
-    if flag_average_cadence:
-        if i + 2 <= len(msg):
-            out["average_cadence"] = _u16_le(msg, i) / 2.0
-        i += 2
-
-    if flag_total_distance:
-        if i + 3 <= len(msg):
-            # 24-bit little-endian
-            out["total_distance"] = msg[i] | (msg[i+1] << 8) | (msg[i+2] << 16)
-        i += 3
-
-    if flag_resistance_level:
-        if i + 2 <= len(msg):
-            out["resistance_level"] = _s16_le(msg, i)
-        i += 2
-
-    if flag_instant_power:
-        if i + 2 <= len(msg):
-            out["instant_power"] = _s16_le(msg, i)
-        i += 2
-
-    if flag_average_power:
-        if i + 2 <= len(msg):
-            out["average_power"] = _s16_le(msg, i)
-        i += 2
-
-    if flag_expended_energy:
-        if i + 5 <= len(msg):
-            out["total_energy"]      = _u16_le(msg, i)
-            out["energy_per_hour"]   = _u16_le(msg, i+2)
-            out["energy_per_minute"] = msg[i+4]
-        i += 5
-
-    if flag_heart_rate:
-        if i + 1 <= len(msg):
-            out["heart_rate"] = msg[i]
-        i += 1
-
-    if flag_metabolic_equivalent:
-        if i + 1 <= len(msg):
-            out["metabolic_equivalent"] = msg[i] / 10.0
-        i += 1
-
-    if flag_elapsed_time:
-        if i + 2 <= len(msg):
-            out["elapsed_time"] = _u16_le(msg, i)
-        i += 2
-
-    if flag_remaining_time:
-        if i + 2 <= len(msg):
-            out["remaining_time"] = _u16_le(msg, i)
-        i += 2
-
-    return out
-
-# ====== HTTP ======
-def post_json(payload: dict):
+async def ensure_wifi(wlan, timeout_ms=10_000):
+    """Reconecta o Wi-Fi sem bloquear o loop (o BLE continua recebendo)."""
+    if wlan.isconnected():
+        return
+    print("Wi-Fi desconectado, reconectando...")
     try:
-        headers = {"Content-Type": "application/json"}
-        print(payload)
-        r = urequests.post(ENDPOINT_URL, data=ujson.dumps(payload), headers=headers)
+        wlan.connect(WIFI_SSID, WIFI_PSK)
+    except OSError:
+        pass
+    waited = 0
+    while not wlan.isconnected():
+        if waited >= timeout_ms:
+            raise OSError("Wi-Fi indisponível")
+        await sleep_ms(200)
+        waited += 200
+
+# ====== BUFFER / UPLINK ======
+class RingBuffer:
+    """
+    Fila circular de tamanho fixo. Cheia, sobrescreve a leitura mais antiga
+    (contada em `dropped`). Cada item tem um número de sequência, para que o
+    envio só descarte as leituras que realmente mandou.
+    """
+
+    def __init__(self, size):
+        self.items = [None] * size
+        self.size = size
+        self.head = 0
+        self.count = 0
+        self.pushed = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, item):
+        if self.count == self.size:
+            self.items[self.head] = None
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+            self.dropped += 1
+        self.items[(self.head + self.count) % self.size] = item
+        self.count += 1
+        self.pushed += 1
+
+    def peek(self, n):
+        """Retorna (sequência do primeiro item, até n itens mais antigos) sem remover."""
+        n = min(n, self.count)
+        first = self.pushed - self.count
+        return first, [self.items[(self.head + i) % self.size] for i in range(n)]
+
+    def commit(self, first, n):
+        """Remove os itens [first, first + n) que ainda estiverem na fila."""
+        oldest = self.pushed - self.count
+        remove = min(first + n - oldest, self.count)
+        for _ in range(remove):
+            self.items[self.head] = None
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+
+
+class Backoff:
+    def __init__(self, min_ms, max_ms):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.current = min_ms
+
+    def reset(self):
+        self.current = self.min_ms
+
+    def next_ms(self):
+        delay = self.current
+        self.current = min(self.current * 2, self.max_ms)
+        # jitter de até 25% para as bikes não reconectarem todas juntas
+        return delay + random.getrandbits(16) * delay // (4 * 65536)
+
+
+# Registros binários da ingestão TCP (mesmo formato de ingest_listener.py no backend)
+RECORD_VERSION = 1
+RAW_RECORD_VERSION = 2
+EXTRA_FIELDS = (
+    ("heart_rate", "B", 1),
+    ("resistance_level", "h", 1),
+    ("total_energy", "H", 1),
+    ("elapsed_time", "H", 1),
+    ("instant_speed", "H", 100),
+    ("average_power", "h", 1),
+)
+
+
+def encode_record(name, ts, reading):
+    """`name` em bytes; retorna o registro com o prefixo de tamanho."""
+    mask = 0
+    fmt = "<dHh"
+    values = [ts, int(round(reading.get("instant_cadence", 0) * 2)), int(reading.get("instant_power", 0))]
+    for i, (field, code, scale) in enumerate(EXTRA_FIELDS):
+        value = reading.get(field)
+        if value is not None:
+            mask |= 1 << i
+            fmt += code
+            values.append(int(round(value * scale)))
+    size = 4 + len(name) + struct.calcsize(fmt)
+    return struct.pack("<HBHB", size, RECORD_VERSION, mask, len(name)) + name + struct.pack(fmt, *values)
+
+
+def encode_raw_record(name, ts, payload):
+    """Registro versão 2: a notificação Indoor Bike Data como chegou do BLE."""
+    size = 2 + len(name) + 8 + len(payload)
+    return struct.pack("<HBB", size, RAW_RECORD_VERSION, len(name)) + name + struct.pack("<d", ts) + payload
+
+
+def encode_records(name, batch):
+    # Leituras cruas (RAW_FTMS) ficam no buffer como bytes
+    return b"".join(
+        encode_raw_record(name, ts, r) if isinstance(r, bytes) else encode_record(name, ts, r)
+        for ts, r in batch
+    )
+
+
+class Rejected(Exception):
+    """O backend recusou o lote (4xx que não é 429): reenviar o mesmo lote não adianta."""
+
+
+class TcpUplink:
+    """Conexão TCP persistente com a ingestão binária do backend."""
+
+    def __init__(self, host, port, device):
+        self.host = host
+        self.port = port
+        self.name = device.encode()
+        self.reader = None
+        self.writer = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def send(self, batch):
+        self.writer.write(encode_records(self.name, batch))
+        await self.writer.drain()
+
+    async def close(self):
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is not None:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+class HttpUplink(TcpUplink):
+    """
+    POST de lotes numa conexão HTTP/1.1 keep-alive: JSON em /api/ftms/batch,
+    ou registros binários em /api/ftms/raw quando as leituras são cruas.
+    """
+
+    def __init__(self, host, port, device):
+        super().__init__(host, port, device)
+        self.device = device
+
+    async def send(self, batch):
+        if isinstance(batch[0][1], bytes):
+            path, content_type = "/api/ftms/raw", "application/octet-stream"
+            body = encode_records(self.name, batch)
+        else:
+            path, content_type = "/api/ftms/batch", "application/json"
+            body = json.dumps({"readings": [
+                {"ts": ts, "src": "esp32-ftms", "device": self.device, "reading": r} for ts, r in batch
+            ]}).encode()
+        self.writer.write((
+            "POST {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "Content-Type: {}\r\n"
+            "Content-Length: {}\r\n\r\n"
+        ).format(path, self.host, content_type, len(body)).encode() + body)
+        await self.writer.drain()
+
+        status = await self.reader.readline()
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise OSError("conexão fechada pelo backend")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode().partition(":")
+            key = key.strip().lower()
+            if key == "content-length":
+                length = int(value)
+            elif key == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+        if length:
+            await self.reader.readexactly(length)
+        if not keep_alive:
+            await self.close()
+        parts = status.split()
+        code = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else 0
+        if 200 <= code < 300:
+            return
+        # 429 (limite de taxa, sobrecarga) e 5xx passam: nova tentativa com backoff
+        if 400 <= code < 500 and code != 429:
+            raise Rejected(status.decode().strip())
+        raise OSError("backend respondeu " + status.decode().strip())
+
+
+async def uplink_loop(buffer, uplink, wlan, stats):
+    """
+    Envia o buffer em lotes. Falhas de rede, 429 e 5xx fecham só a conexão
+    de saída: as leituras continuam no buffer e o BLE segue assinado. Um lote
+    recusado (4xx) é descartado, para não travar o envio dos seguintes.
+    """
+    backoff = Backoff(BACKOFF_MIN_MS, BACKOFF_MAX_MS)
+    while True:
+        if len(buffer) < BATCH_SIZE:
+            await sleep_ms(FLUSH_INTERVAL_MS)
+        if not len(buffer):
+            continue
         try:
-            _ = r.text  # consome a resposta (opcional)
-        except:
-            pass
-        r.close()
-        return True
-    except Exception as e:
-        print("POST falhou:", e)
-        return False
+            if not uplink.connected:
+                await ensure_wifi(wlan)
+                await uplink.connect()
+            first, batch = buffer.peek(BATCH_SIZE)
+            await uplink.send(batch)
+            buffer.commit(first, len(batch))
+            stats["sent"] += len(batch)
+            backoff.reset()
+        except Rejected as e:
+            buffer.commit(first, len(batch))
+            stats["rejected"] += len(batch)
+            backoff.reset()
+            print("Lote descartado: backend respondeu {}".format(e))
+        except Exception as e:
+            stats["errors"] += 1
+            delay = backoff.next_ms()
+            print("Envio falhou ({}); nova tentativa em {} ms".format(e, delay))
+            await uplink.close()
+            await sleep_ms(delay)
 
 # ====== BLE / AIOBLE ======
 async def find_and_connect_ftms():
@@ -221,42 +405,58 @@ async def find_and_connect_ftms():
     # Retorna os objetos somente se a configuração foi bem-sucedida
     return conn, ibd, device
 
-async def stream_loop():
-    # Qualquer falha aqui deve explodir até o topo pra provocar soft reboot.
-    if not wifi_connect():
-        raise Exception("Falha ao conectar no Wi‑Fi.")
+async def ble_loop(buffer, stats):
+    """Recebe as notificações FTMS e só as coloca no buffer (nunca espera pela rede)."""
+    parser = IndoorBikeParser()
+    while True:
+        conn = None
+        try:
+            conn, ibd, device = await find_and_connect_ftms()
+            while True:
+                data = await ibd.notified()
+                if RAW_FTMS:
+                    reading = bytes(data) if len(data) >= 2 else None
+                else:
+                    reading = parser.parse(data)
+                if reading:
+                    buffer.push((now_ts(), reading))
+                    stats["received"] += 1
+        except Exception as e:
+            print("BLE:", e, "- reconectando em 3 s")
+            if conn is not None:
+                try:
+                    await conn.disconnect()
+                except Exception:
+                    pass
+            await sleep_ms(3000)
 
-    conn, ibd, device = await find_and_connect_ftms()
 
-    # cache do endereço (se disponível)
-    try:
-        dev_hex = device.addr_hex()
-    except:
-        dev_hex = None
+def make_uplink():
+    if UPLINK == "tcp":
+        return TcpUplink(BACKEND_HOST, TCP_PORT, device_name())
+    return HttpUplink(BACKEND_HOST, HTTP_PORT, device_name())
 
-    while True:
-        # Se qualquer await der erro, deixa subir para o main() e resetar.
-        data = await ibd.notified()
-        reading = parse_indoor_bike_data(data)
-        if reading:
-            payload = {
-                "ts": time.time(),
-                "src": "esp32-ftms",
-                "device": BIKE_NAME_SUBSTR,
-                "reading": reading,
-            }
-            post_json(payload)
+
+async def stream_loop():
+    wifi_connect()  # primeira tentativa; o uplink reconecta sozinho depois
+    wlan = network.WLAN(network.STA_IF)
+    buffer = RingBuffer(BUFFER_SIZE)
+    stats = {"received": 0, "sent": 0, "rejected": 0, "errors": 0}
+    asyncio.create_task(uplink_loop(buffer, make_uplink(), wlan, stats))
+    await ble_loop(buffer, stats)
 
 
 def main():
-    try:
-        asyncio.run(stream_loop())
-    except Exception as e:
-        print("Falha fatal:", e)
-        main()
-    finally:
-        # Mantém compatível com seu padrão atual
-        asyncio.new_event_loop()
+    # Falhas de BLE e de rede são tratadas nas próprias tasks; aqui só sobra
+    # o inesperado, e o laço substitui a antiga recursão de main().
+    while True:
+        try:
+            asyncio.run(stream_loop())
+        except Exception as e:
+            print("Falha fatal:", e)
+            time.sleep(5)
+        finally:
+            asyncio.new_event_loop()
 
 if __name__ == "__main__":
     main()
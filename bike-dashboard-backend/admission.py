@@ -0,0 +1,280 @@
+"""
+Admissão da ingestão: o que entra no estado ao vivo e o que é recusado.
+
+Três camadas, da mais barata para a mais cara:
+
+1. Sobrecarga (`OverloadGuard` + middleware `IngestGate`): com `max_inflight`
+   requisições de ingestão em andamento, ou com o event loop atrasado mais de
+   `max_lag` segundos, as novas respondem 429 (com Retry-After) antes de o
+   corpo ser lido e validado. A latência de quem entra fica limitada, e o
+   ESP32 trata o 429 como falha: recua (backoff) e reenvia o lote depois.
+2. Taxa por device (`RateLimiter`): um balde de fichas por device, `rate`
+   leituras/s com até `burst` acumuladas (o suficiente para o buffer de um
+   ESP32 que passou um tempo sem rede). Leituras sem ficha são descartadas; se
+   nenhuma leitura da requisição entrou, a resposta é 429. Um device em loop
+   de reconexão esgota o próprio balde sem afetar os outros.
+3. Duplicatas e atrasos (`SampleFilter`), na aplicação do lote
+   (`main.apply_readings`): o lote já vem em ordem de `ts`; entre lotes, cada
+   amostra é comparada com o `ts` mais recente do device (`BikeRecord.timestamp`):
+   - mesmo `ts` e mesma leitura de uma amostra aplicada nos últimos `memory` s
+     → duplicata, descartada (retentativa de um POST cuja resposta se perdeu).
+     Só o `ts` não basta: o firmware antigo manda `time.time()` em segundos
+     inteiros, ~4 leituras diferentes por segundo com o mesmo `ts`;
+   - mais velha que a mais recente, dentro de `window` s → aplicada com o `ts`
+     da mais recente (o timestamp da bike não volta e o intervalo já integrado
+     não soma distância de novo);
+   - mais velha que isso → descartada e contada em `stale`, sem mexer na
+     memória de duplicatas nem no `ts` do device (um reenvio atrasado ou uma
+     amostra perdida não apagam o histórico).
+   O relógio do ESP32 novo conta segundos desde o boot, e um reinício volta
+   bem mais que `window`. Só `reset_samples` amostras velhas seguidas, com
+   `ts` estritamente crescente entre si, contam como reinício: a última delas
+   é aplicada, vira o `ts` do device e a memória de duplicatas recomeça (as
+   anteriores, menos de um segundo de leituras, ficam de fora). Uma amostra
+   aceita ou duplicata no meio interrompe a sequência.
+   Como roda na aplicação do lote, que todos os workers fazem na mesma ordem
+   (ver cluster.py), a decisão é a mesma em todas as réplicas, e uma
+   retentativa que cai em outro worker também é descartada. Os endpoints
+   consultam a mesma memória antes de publicar (`drop_seen`), para responder
+   quantas leituras eram duplicatas.
+"""
+
+import json
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class RateLimiter:
+    """Baldes de fichas por device; `rate` <= 0 desliga."""
+
+    def __init__(self, rate: float, burst: float, max_devices: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_devices = max_devices
+        # device → [fichas, instante da última recarga]
+        self.buckets: Dict[str, List[float]] = {}
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _prune(self, now: float):
+        """Remove os baldes que já estariam cheios (devices parados): equivalem a um balde novo."""
+        full_after = self.burst / self.rate
+        self.buckets = {d: b for d, b in self.buckets.items() if now - b[1] < full_after}
+
+    def take(self, device: str, now: float) -> bool:
+        bucket = self.buckets.get(device)
+        if bucket is None:
+            if len(self.buckets) >= self.max_devices:
+                self._prune(now)
+            bucket = self.buckets[device] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True
+        self.limited += 1
+        return False
+
+    def admit(self, readings: List[Tuple[str, Any, Any]], now: float) -> List[Tuple[str, Any, Any]]:
+        """Leituras (device, ts, leitura) que conseguiram ficha, na mesma ordem."""
+        if not self.enabled:
+            return readings
+        return [r for r in readings if self.take(r[0], now)]
+
+    def retry_after(self, devices: Iterable[str]) -> int:
+        """Segundos (inteiros, no mínimo 1) até todos os `devices` terem uma ficha."""
+        wait = 0.0
+        for device in devices:
+            bucket = self.buckets.get(device)
+            if bucket is not None and bucket[0] < 1.0:
+                wait = max(wait, (1.0 - bucket[0]) / self.rate)
+        return max(1, int(wait + 0.999))
+
+
+# (ts, impressão da leitura) de uma amostra
+SampleKey = Tuple[float, int]
+
+
+def sample_key(ts: float, reading: Dict[str, Any]) -> SampleKey:
+    # Na ordem dos campos: a retentativa é o mesmo JSON, na mesma ordem
+    try:
+        return ts, hash(tuple(reading.items()))
+    except TypeError:  # valor não hashable (lista etc.) em algum campo extra
+        return ts, hash(repr(reading))
+
+
+class _DeviceWindow:
+    __slots__ = ("recent", "order", "behind", "behind_ts")
+
+    def __init__(self):
+        # amostras aplicadas nos últimos `memory` segundos (conjunto + ordem de chegada)
+        self.recent: Set[SampleKey] = set()
+        self.order: Deque[SampleKey] = deque()
+        # amostras velhas seguidas (candidatas a reinício do relógio) e o ts da última
+        self.behind = 0
+        self.behind_ts = 0.0
+
+
+class SampleFilter:
+    def __init__(self, window: float = 2.0, memory: float = 30.0, max_recent: int = 256, reset_samples: int = 3):
+        self.window = window
+        self.memory = memory
+        self.max_recent = max_recent
+        self.reset_samples = max(reset_samples, 1)
+        self.devices: Dict[str, _DeviceWindow] = {}
+        self.duplicates = 0
+        self.clamped = 0
+        self.stale = 0
+        self.resets = 0
+
+    def drop_seen(self, readings: List[Tuple[str, float, Dict[str, Any]]]) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Leituras (device, ts, leitura) sem as já aplicadas e sem as repetidas
+        na própria lista; não guarda nada (quem guarda é `admit`).
+        """
+        fresh = []
+        keys = set()
+        devices = self.devices
+        for reading in readings:
+            device = reading[0]
+            key = sample_key(reading[1], reading[2])
+            window = devices.get(device)
+            if (device, key) in keys or (window is not None and key in window.recent):
+                continue
+            keys.add((device, key))
+            fresh.append(reading)
+        self.duplicates += len(readings) - len(fresh)
+        return fresh
+
+    def admit(self, device: str, key: SampleKey, latest: Optional[float]) -> Optional[float]:
+        """
+        `ts` a aplicar (o da amostra ou, se atrasada dentro da janela,
+        `latest`) ou None para descartar (duplicata ou velha demais, ver o
+        docstring do módulo). `latest` é o ts mais recente já aplicado ao
+        device (None se é novo).
+        """
+        window = self.devices.get(device)
+        if window is None:
+            window = self.devices[device] = _DeviceWindow()
+        ts = key[0]
+        if key in window.recent:
+            window.behind = 0
+            self.duplicates += 1
+            return None
+        if latest is not None and latest - ts > self.window:
+            if window.behind and ts > window.behind_ts:
+                window.behind += 1
+            else:
+                window.behind = 1
+            window.behind_ts = ts
+            if window.behind < self.reset_samples:
+                self.stale += 1
+                return None
+            self.resets += 1
+            window.behind = 0
+            window.recent.clear()
+            window.order.clear()
+            self._remember(window, key, ts)
+            return ts
+        window.behind = 0
+        if latest is None or ts >= latest:
+            self._remember(window, key, ts)
+            return ts
+        self._remember(window, key, latest)
+        self.clamped += 1
+        return latest
+
+    def _remember(self, window: _DeviceWindow, key: SampleKey, newest: float):
+        recent, order = window.recent, window.order
+        recent.add(key)
+        order.append(key)
+        horizon = newest - self.memory
+        while order and (order[0][0] < horizon or len(order) > self.max_recent):
+            recent.discard(order.popleft())
+
+    def remove(self, device: str):
+        self.devices.pop(device, None)
+
+    def clear(self):
+        self.devices.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "duplicates": self.duplicates,
+            "clamped": self.clamped,
+            "stale": self.stale,
+            "clock_resets": self.resets,
+        }
+
+
+class OverloadGuard:
+    """
+    Requisições de ingestão em andamento e atraso do event loop. O atraso
+    vem de `lag` (a última medida do monitor de `metrics.py`, em segundos):
+    o guarda não mede nada por conta própria.
+    """
+
+    def __init__(self, max_inflight: int, max_lag: float, lag: Callable[[], float] = lambda: 0.0):
+        self.max_inflight = max_inflight
+        self.max_lag = max_lag
+        self.lag = lag
+        self.inflight = 0
+        self.rejected = 0
+
+    def overloaded(self) -> bool:
+        return (0 < self.max_inflight <= self.inflight) or (0 < self.max_lag < self.lag())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "loop_lag_ms": round(self.lag() * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "overload_rejected": self.rejected,
+        }
+
+
+def too_many_requests(detail: str, retry_after: int) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    body = json.dumps({"detail": detail}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after).encode()),
+    ]
+    return 429, headers, body
+
+
+class IngestGate:
+    """
+    Middleware ASGI: conta as requisições POST em `paths` e recusa as novas
+    com 429 enquanto `guard` indicar sobrecarga, sem ler o corpo.
+    """
+
+    def __init__(self, app, guard: OverloadGuard, paths: Iterable[str], on_reject=None):
+        self.app = app
+        self.guard = guard
+        self.paths = frozenset(paths)
+        self.on_reject = on_reject
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        guard = self.guard
+        if guard.overloaded():
+            guard.rejected += 1
+            if self.on_reject is not None:
+                self.on_reject(scope["path"])
+            status, headers, body = too_many_requests("servidor sobrecarregado, tente de novo", 1)
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        guard.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            guard.inflight -= 1
@@ -0,0 +1,145 @@
+"""
+Benchmark: latência do event loop com consultas SQLite bloqueantes vs. `database.Database`.
+
+Cria um banco sintético, dispara consultas concorrentes equivalentes a
+`list_students` / `broadcast_assignments` e mede, ao mesmo tempo, o atraso de
+uma task que acorda a cada 1 ms (lag do event loop).
+
+    python benchmarks/bench_db_event_loop.py --students 20000 --duration 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, connect  # noqa: E402
+
+QUERIES = (
+    "SELECT * FROM students ORDER BY name",
+    """
+    SELECT ba.device, ba.student_cpf, s.name as student_name, s.weight, s.height
+    FROM bike_assignments ba
+    JOIN students s ON ba.student_cpf = s.cpf
+    """,
+)
+
+
+def create_db(path: str, students: int, bikes: int):
+    conn = connect(path)
+    conn.execute("""
+        CREATE TABLE students (
+            cpf TEXT PRIMARY KEY, name TEXT NOT NULL, weight REAL NOT NULL,
+            height REAL NOT NULL, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE bike_assignments (
+            device TEXT PRIMARY KEY, student_cpf TEXT NOT NULL,
+            assigned_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO students (cpf, name, weight, height) VALUES (?, ?, ?, ?)",
+        ((f"{i:011d}", f"Aluno {rng.randrange(10**6):06d}", 70.0, 175.0) for i in range(students)),
+    )
+    conn.executemany(
+        "INSERT INTO bike_assignments (device, student_cpf) VALUES (?, ?)",
+        ((f"BIKE-{i:04d}", f"{i:011d}") for i in range(bikes)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def probe_lag(samples, stop: asyncio.Event, interval: float = 0.001):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - start - interval) * 1000)
+
+
+async def run(mode: str, path: str, duration: float, concurrency: int):
+    db = Database(path) if mode == "pool" else None
+    count = 0
+
+    async def blocking_query(sql):
+        # Padrão antigo: conexão nova e consulta direto no event loop
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        rows = [dict(r) for r in conn.execute(sql).fetchall()]
+        conn.close()
+        return rows
+
+    async def worker():
+        nonlocal count
+        deadline = time.perf_counter() + duration
+        i = 0
+        while time.perf_counter() < deadline:
+            sql = QUERIES[i % len(QUERIES)]
+            if db:
+                await db.fetchall(sql)
+            else:
+                await blocking_query(sql)
+                await asyncio.sleep(0)
+            count += 1
+            i += 1
+
+    lag = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(lag, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    if db:
+        db.close()
+
+    lag.sort()
+    return {
+        "mode": mode,
+        "queries_per_s": round(count / elapsed, 1),
+        "loop_lag_ms_p50": round(statistics.median(lag), 3),
+        "loop_lag_ms_p99": round(lag[int(len(lag) * 0.99) - 1], 3),
+        "loop_lag_ms_max": round(lag[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--bikes", type=int, default=60)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        create_db(path, args.students, args.bikes)
+        results = [
+            asyncio.run(run(mode, path, args.duration, args.concurrency))
+            for mode in ("blocking", "pool")
+        ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'modo':<10} {'consultas/s':>12} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['queries_per_s']:>12} {r['loop_lag_ms_p50']:>11} "
+              f"{r['loop_lag_ms_p99']:>11} {r['loop_lag_ms_max']:>11}")
+
+
+if __name__ == "__main__":
+    main()
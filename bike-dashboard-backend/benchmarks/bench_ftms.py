@@ -0,0 +1,192 @@
+"""
+Verificação e microbenchmark do parser FTMS (`ftms.py`).
+
+Confere, para todos os 2^13 valores de flags, que `IndoorBikeParser` produz
+exatamente os mesmos valores (e tipos) do parser original campo a campo,
+em notificações completas e em todos os truncamentos, pelos três caminhos
+(`parse`, `parse` com dict reaproveitado e `parse_into`). Depois mede o
+tempo por notificação dos dois parsers.
+
+    python benchmarks/bench_ftms.py --samples 100000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ftms  # noqa: E402
+
+
+def reference_parse(msg):
+    """Parser original do firmware (uma checagem e um unpack por campo)."""
+    if len(msg) < 2:
+        return {}
+    f0, f1 = msg[0], msg[1]
+
+    def u16(off):
+        return msg[off] | (msg[off + 1] << 8)
+
+    def s16(off):
+        return struct.unpack_from("<h", msg, off)[0]
+
+    i = 2
+    out = {}
+    if not f0 & 0x01:
+        if i + 2 <= len(msg):
+            out["instant_speed"] = u16(i) / 100.0
+        i += 2
+    if f0 & 0x02:
+        if i + 2 <= len(msg):
+            out["average_speed"] = u16(i) / 100.0
+        i += 2
+    if f0 & 0x04:
+        if i + 2 <= len(msg):
+            out["instant_cadence"] = u16(i) / 2.0
+        i += 2
+    if f0 & 0x08:
+        if i + 2 <= len(msg):
+            out["average_cadence"] = u16(i) / 2.0
+        i += 2
+    if f0 & 0x10:
+        if i + 3 <= len(msg):
+            out["total_distance"] = msg[i] | (msg[i + 1] << 8) | (msg[i + 2] << 16)
+        i += 3
+    if f0 & 0x20:
+        if i + 2 <= len(msg):
+            out["resistance_level"] = s16(i)
+        i += 2
+    if f0 & 0x40:
+        if i + 2 <= len(msg):
+            out["instant_power"] = s16(i)
+        i += 2
+    if f0 & 0x80:
+        if i + 2 <= len(msg):
+            out["average_power"] = s16(i)
+        i += 2
+    if f1 & 0x01:
+        if i + 5 <= len(msg):
+            out["total_energy"] = u16(i)
+            out["energy_per_hour"] = u16(i + 2)
+            out["energy_per_minute"] = msg[i + 4]
+        i += 5
+    if f1 & 0x02:
+        if i + 1 <= len(msg):
+            out["heart_rate"] = msg[i]
+        i += 1
+    if f1 & 0x04:
+        if i + 1 <= len(msg):
+            out["metabolic_equivalent"] = msg[i] / 10.0
+        i += 1
+    if f1 & 0x08:
+        if i + 2 <= len(msg):
+            out["elapsed_time"] = u16(i)
+        i += 2
+    if f1 & 0x10:
+        if i + 2 <= len(msg):
+            out["remaining_time"] = u16(i)
+        i += 2
+    return out
+
+
+def payload_size(flags):
+    entries = ftms._entries(flags)
+    return entries[-1][3] if entries else 2
+
+
+def make_message(rng, flags):
+    # Bits 13-15 aleatórios: reservados, devem ser ignorados
+    flags |= rng.getrandbits(3) << 13
+    return bytes([flags & 0xFF, flags >> 8]) + bytes(rng.getrandbits(8) for _ in range(payload_size(flags & ftms.FLAGS_MASK) - 2))
+
+
+def typed(d):
+    return {k: (type(v).__name__, v) for k, v in d.items()}
+
+
+def verify(rng, per_flags):
+    parser = ftms.IndoorBikeParser()
+    reused = {}
+    slots = [None] * len(ftms.FIELDS)
+    checked = 0
+    for flags in range(1 << 13):
+        for _ in range(per_flags):
+            full = make_message(rng, flags)
+            for length in range(len(full) + 1):
+                msg = full[:length]
+                expected = typed(reference_parse(msg))
+                got = [
+                    parser.parse(msg),
+                    parser.parse(msg, reused),
+                    {n: v for n, v in zip(ftms.FIELDS, parser.parse_into(msg, slots)) if v is not None},
+                ]
+                for result in got:
+                    if typed(result) != expected:
+                        raise AssertionError(f"flags={flags:#06x} msg={msg.hex()}: {result} != {expected}")
+                checked += 1
+    return checked
+
+
+def timeit(fn, messages, repeat):
+    """Melhor de `repeat` passadas (a VM compartilhada tem bastante ruído)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for msg in messages:
+            fn(msg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5, help="melhor de N passadas")
+    parser.add_argument("--per-flags", type=int, default=2, help="notificações aleatórias por valor de flags")
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    checked = verify(rng, args.per_flags)
+
+    # Notificação típica (cadência, potência, frequência cardíaca) e uma mistura de flags
+    typical = bytes([0x44, 0x02]) + struct.pack("<HHhB", 2850, 170, 210, 142)
+    mixed = [make_message(rng, rng.getrandbits(13)) for _ in range(1024)]
+    mixed = (mixed * (args.samples // len(mixed) + 1))[:args.samples]
+    fast = ftms.IndoorBikeParser()
+    reused = {}
+    slots = [None] * len(ftms.FIELDS)
+
+    report = {"verified_messages": checked, "samples": args.samples}
+    for name, messages in (("typical", [typical] * args.samples), ("mixed", mixed)):
+        ref = timeit(reference_parse, messages, args.repeat)
+        new = timeit(fast.parse, messages, args.repeat)
+        reuse = timeit(lambda m: fast.parse(m, reused), messages, args.repeat)
+        into = timeit(lambda m: fast.parse_into(m, slots), messages, args.repeat)
+        report[name] = {
+            "reference_ns": round(ref / args.samples * 1e9, 1),
+            "parse_ns": round(new / args.samples * 1e9, 1),
+            "parse_reused_ns": round(reuse / args.samples * 1e9, 1),
+            "parse_into_ns": round(into / args.samples * 1e9, 1),
+            "speedup": round(ref / new, 2),
+        }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"✅ {checked} notificações idênticas ao parser original (2^13 flags, todos os truncamentos)")
+        for name in ("typical", "mixed"):
+            r = report[name]
+            print(
+                f"{name:8s} original {r['reference_ns']:7.1f} ns | parse {r['parse_ns']:7.1f} ns "
+                f"| reaproveitado {r['parse_reused_ns']:7.1f} ns | parse_into {r['parse_into_ns']:7.1f} ns "
+                f"| {r['speedup']}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Microbenchmark: caminho escalar (por leitura) vs. `bike_metrics.compute` (NumPy).
+
+Gera N leituras sintéticas de um device, calcula velocidade e distância
+acumulada pelos dois caminhos, confere que os resultados são idênticos e
+mostra o tempo de cada um.
+
+    python benchmarks/bench_metrics.py --samples 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bike_metrics  # noqa: E402
+
+
+def scalar_path(ts, power, cadence):
+    """Mesmo loop de `apply_reading`: velocidade por leitura e distância integrada."""
+    speed = [0.0] * len(ts)
+    distance = [0.0] * len(ts)
+    total = 0.0
+    last = ts[0]
+    for i in range(len(ts)):
+        s = bike_metrics.speed_kmh(power[i], cadence[i])
+        dt = bike_metrics.integration_interval(ts[i] - last)
+        if dt > 0:
+            total += bike_metrics.distance_increment(s, dt)
+        last = ts[i]
+        speed[i] = s
+        distance[i] = total
+    return speed, distance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    n = args.samples
+    intervals = rng.uniform(0.2, 0.3, n)
+    # Algumas pausas longas na transmissão (limitadas a MAX_GAP na integração)
+    intervals[rng.random(n) < 0.001] += 30.0
+    ts = np.cumsum(intervals) + 1.7e9
+    power = rng.integers(0, 600, n).astype(np.float64)
+    cadence = np.round(rng.uniform(0, 130, n), 1)
+
+    ts_l, power_l, cadence_l = ts.tolist(), power.tolist(), cadence.tolist()
+    start = time.perf_counter()
+    speed_s, distance_s = scalar_path(ts_l, power_l, cadence_l)
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = bike_metrics.compute(ts, power, cadence, weight=70.0, height=175.0)
+    vector_s = time.perf_counter() - start
+
+    identical = (
+        np.array_equal(result["speed"], np.array(speed_s))
+        and np.array_equal(result["distance"], np.array(distance_s))
+    )
+    report = {
+        "samples": n,
+        "scalar_s": round(scalar_s, 4),
+        "vectorized_s": round(vector_s, 4),
+        "speedup": round(scalar_s / vector_s, 1),
+        "scalar_ns_per_sample": round(scalar_s / n * 1e9, 1),
+        "vectorized_ns_per_sample": round(vector_s / n * 1e9, 1),
+        "identical": bool(identical),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:<26} {value}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
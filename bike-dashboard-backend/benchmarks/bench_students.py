@@ -0,0 +1,192 @@
+"""
+Benchmark: cadastro de alunos grande — lista completa vs. páginas por cursor e busca indexada.
+
+Cria um banco sintético (padrão: 100 mil alunos com nomes brasileiros, com e
+sem acento) e mede, na mesma base:
+
+- a lista completa ordenada por nome, como o seletor de alunos fazia antes
+  (sem índice; o filtro era feito no navegador sobre esse JSON);
+- a criação dos índices de `students.py` (B-tree por nome e FTS5);
+- páginas por cursor (`students.query`) no começo e no fim da lista, e o
+  OFFSET equivalente;
+- buscas por prefixo do nome (comum, sobrenome acentuado digitado sem
+  acento, primeiro nome sem acento, duas palavras), por
+  prefixo de CPF e por CPF completo, e um termo sem resultado comparado com
+  um LIKE '%...%'.
+
+Também confere pelo EXPLAIN QUERY PLAN que as consultas usam os índices.
+
+    python benchmarks/bench_students.py --students 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import students  # noqa: E402
+from database import connect  # noqa: E402
+
+FIRST_NAMES = (
+    "Ana", "João", "Maria", "José", "Antônio", "Francisca", "Carlos", "Paulo", "Pedro", "Lucas",
+    "Luíza", "Gabriel", "Rafael", "Márcia", "Fernanda", "Juliana", "Letícia", "Mateus", "Ângela",
+    "Sebastião", "Bruna", "Camila", "Débora", "Érica", "Felipe", "Gustavo", "Helena", "Igor",
+    "Júlia", "Kátia", "Leonardo", "Mônica", "Natália", "Otávio", "Patrícia", "Renata", "Sérgio",
+    "Tânia", "Vinícius", "Wagner",
+)
+SURNAMES = (
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima",
+    "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo", "Barbosa", "Cardoso",
+    "Rocha", "Dias", "Conceição", "Simões", "Gonçalves", "Magalhães", "Brandão", "Falcão",
+    "Silveira", "Nóbrega", "Assunção", "Guimarães",
+)
+
+SEARCHES = (
+    ("nome_comum", "ma"),
+    ("sobrenome_acento", "nobre"),
+    ("sem_acento", "sebastiao"),
+    ("duas_palavras", "ana silv"),
+)
+
+
+def synthetic_name(rng: random.Random) -> str:
+    parts = [rng.choice(FIRST_NAMES)]
+    if rng.random() < 0.3:
+        parts.append(rng.choice(FIRST_NAMES))
+    for _ in range(rng.choice((1, 2, 2))):
+        if rng.random() < 0.2:
+            parts.append(rng.choice(("da", "de", "dos")))
+        parts.append(rng.choice(SURNAMES))
+    return " ".join(parts)
+
+
+def synthetic_students(count: int, seed: int = 42):
+    """(cpf, nome, peso, altura) com CPFs distintos de 11 dígitos."""
+    rng = random.Random(seed)
+    cpfs = rng.sample(range(10**11), count)
+    return [
+        (f"{cpf:011d}", synthetic_name(rng), round(rng.uniform(50, 110), 1), round(rng.uniform(150, 195), 1))
+        for cpf in cpfs
+    ]
+
+
+def create_db(path: str, rows) -> None:
+    conn = connect(path)
+    conn.execute("""
+        CREATE TABLE students (
+            cpf TEXT PRIMARY KEY, name TEXT NOT NULL, weight REAL NOT NULL,
+            height REAL NOT NULL, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany("INSERT INTO students (cpf, name, weight, height) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"ms_p50": round(statistics.median(times), 3), "ms_max": round(max(times), 3), "result": result}
+
+
+def response_kib(rows: List[Dict[str, Any]]) -> float:
+    return round(len(json.dumps({"students": rows})) / 1024, 1)
+
+
+def run(path: str, count: int, repeat: int, page: int) -> List[Dict[str, Any]]:
+    conn = connect(path)
+    results = []
+
+    def add(name, fn, rep=repeat):
+        r = timed(fn, rep)
+        rows = r.pop("result")
+        results.append({"benchmark": name, **r, "rows": len(rows), "kib": response_kib(rows)})
+        return rows
+
+    # Antes: tudo, ordenado por nome, sem índice
+    add("lista_completa_antes", lambda: [dict(r) for r in conn.execute("SELECT * FROM students ORDER BY name")], 3)
+
+    start = time.perf_counter()
+    students.init_schema(conn)
+    conn.commit()
+    results.append({"benchmark": "criar_indices", "ms_p50": round((time.perf_counter() - start) * 1000, 1)})
+
+    add("lista_completa_indice", lambda: students.query(conn)[0], 3)
+
+    first, cursor = students.query(conn, limit=page)
+    add("pagina_inicio", lambda: students.query(conn, limit=page)[0])
+    # Cursor perto do fim: mesmo custo do início
+    tail = conn.execute(
+        "SELECT name, cpf FROM students ORDER BY name, cpf LIMIT 1 OFFSET ?", (int(count * 0.9),)
+    ).fetchone()
+    deep = students.encode_cursor(tail["name"], tail["cpf"])
+    add("pagina_fim_cursor", lambda: students.query(conn, after=deep, limit=page)[0])
+    add("pagina_fim_offset", lambda: [dict(r) for r in conn.execute(
+        "SELECT * FROM students ORDER BY name, cpf LIMIT ? OFFSET ?", (page, int(count * 0.9))
+    )])
+    add("pagina_projecao", lambda: students.query(conn, limit=page, fields=("cpf", "name"))[0])
+
+    for name, q in SEARCHES:
+        add(f"busca_{name}", lambda q=q: students.query(conn, q=q, limit=page)[0])
+    # Página seguinte de uma busca comum
+    _, search_cursor = students.query(conn, q="ma", limit=page)
+    add("busca_nome_comum_p2", lambda: students.query(conn, q="ma", after=search_cursor, limit=page)[0])
+    cpf = first[0]["cpf"]
+    add("busca_cpf_prefixo", lambda: students.query(conn, q=f"{cpf[:3]}.{cpf[3]}", limit=page)[0])
+    add("busca_cpf_completo", lambda: students.query(conn, q=cpf, limit=page)[0])
+    # Termo que ninguém tem: o LIKE '%...%' percorre o cadastro inteiro
+    add("busca_sem_resultado", lambda: students.query(conn, q="xyz", limit=page)[0])
+    add("like_sem_resultado", lambda: [dict(r) for r in conn.execute(
+        "SELECT * FROM students WHERE name LIKE ? ORDER BY name, cpf LIMIT ?", ("%xyz%", page)
+    )])
+
+    # Plano das consultas
+    plans = {
+        "pagina": ("SELECT s.name FROM students s WHERE (s.name, s.cpf) > (?, ?) ORDER BY s.name, s.cpf LIMIT 50", ("", "")),
+        "cpf": ("SELECT s.name FROM students s WHERE s.cpf >= ? AND s.cpf < ? ORDER BY s.name LIMIT 50", ("123", "124")),
+    }
+    for name, (sql, params) in plans.items():
+        plan = " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        assert "INDEX" in plan, plan
+        results.append({"benchmark": f"plano_{name}", "plan": plan})
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--page", type=int, default=50, help="alunos por página")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="saída em JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        create_db(path, synthetic_students(args.students))
+        results = run(path, args.students, args.repeat, args.page)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'benchmark':<26} {'ms p50':>10} {'ms max':>10} {'linhas':>8} {'KiB':>9}")
+    for r in results:
+        if "plan" in r:
+            print(f"{r['benchmark']:<26} {r['plan']}")
+            continue
+        print(f"{r['benchmark']:<26} {r['ms_p50']:>10} {r.get('ms_max', ''):>10} "
+              f"{r.get('rows', ''):>8} {r.get('kib', ''):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Verificação das partes puras do firmware (`CodigoMicroPythonBase.py`) no CPython.
+
+`aioble`, `bluetooth`, `network` e `machine` são substituídos por fakes
+mínimos antes do import; o resto roda como na placa. Confere:
+
+- `RingBuffer`: descarte das mais antigas quando cheio, `peek`/`commit` por
+  número de sequência (um `commit` depois de sobrescritas não remove leituras
+  que não foram enviadas);
+- `Backoff`: dobra até o máximo, com jitter de até 25%;
+- registros binários (`encode_records`, normais e crus) decodificados por
+  `ingest_listener.IngestListener.decode` do backend, campo a campo;
+- `device_name`/uplinks com `BIKE_NAME_SUBSTR = None`;
+- `uplink_loop` + `HttpUplink` contra um servidor HTTP local com respostas
+  roteirizadas: 200 envia, 422 descarta o lote, 500 e 429 reenviam o mesmo lote.
+
+    python benchmarks/check_firmware.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import types
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(BACKEND))
+
+import ftms  # noqa: E402
+from ingest_listener import IngestListener  # noqa: E402
+
+
+class FakeWLAN:
+    def __init__(self, *args):
+        self.connected = True
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return self.connected
+
+    def connect(self, *args):
+        self.connected = True
+
+
+def install_fakes():
+    fakes = {
+        "bluetooth": {"UUID": lambda value: ("uuid", value)},
+        "aioble": {},
+        "network": {"WLAN": FakeWLAN, "STA_IF": 0},
+        "machine": {"unique_id": lambda: bytes([0xA4, 0xCF, 0x12, 0x0B, 0x3C, 0x7E])},
+    }
+    for name, attrs in fakes.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+
+
+install_fakes()
+import CodigoMicroPythonBase as fw  # noqa: E402
+
+
+def check_ring_buffer():
+    buf = fw.RingBuffer(3)
+    for i in range(5):
+        buf.push(i)
+    assert len(buf) == 3 and buf.dropped == 2, (len(buf), buf.dropped)
+    first, items = buf.peek(2)
+    assert (first, items) == (2, [2, 3]), (first, items)
+    # Duas leituras novas sobrescrevem as que estavam sendo enviadas
+    buf.push(5)
+    buf.push(6)
+    buf.commit(first, len(items))
+    _, rest = buf.peek(10)
+    assert rest == [4, 5, 6], rest
+    first, items = buf.peek(10)
+    buf.commit(first, len(items))
+    assert len(buf) == 0
+
+
+def check_backoff():
+    backoff = fw.Backoff(100, 1000)
+    delays = [backoff.next_ms() for _ in range(6)]
+    for delay, base in zip(delays, (100, 200, 400, 800, 1000, 1000)):
+        assert base <= delay <= base * 1.25, delays
+    backoff.reset()
+    assert backoff.next_ms() <= 125
+
+
+def check_records():
+    reading = {"instant_power": 210, "instant_cadence": 85.5, "heart_rate": 142, "instant_speed": 31.25}
+    raw = ftms.encode_indoor_bike_data({"instant_speed": 30.0, "instant_cadence": 90.0, "instant_power": 250})
+    data = fw.encode_records(b"BIKE-0001", [(12.5, reading), (13.0, raw)])
+    records, consumed = IngestListener(lambda records, transport: None).decode(data)
+    assert consumed == len(data)
+    assert records[0] == ("BIKE-0001", 12.5, reading), records[0]
+    assert records[1] == ("BIKE-0001", 13.0, ftms.parse_indoor_bike_data(raw)), records[1]
+
+
+def check_device_name():
+    saved = fw.BIKE_NAME_SUBSTR
+    try:
+        fw.BIKE_NAME_SUBSTR = None
+        assert fw.device_name() == "ESP32-A4CF120B3C7E", fw.device_name()
+        for uplink in ("http", "tcp"):
+            fw.UPLINK = uplink
+            assert fw.make_uplink().name == b"ESP32-A4CF120B3C7E"
+        fw.BIKE_NAME_SUBSTR = "BIKE-0775"
+        assert fw.device_name() == "BIKE-0775"
+    finally:
+        fw.BIKE_NAME_SUBSTR = saved
+        fw.UPLINK = "http"
+
+
+async def scripted_server(statuses):
+    """Servidor HTTP/1.1 keep-alive que responde `statuses` em ordem e guarda os lotes recebidos."""
+    received = []
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header == b"\r\n":
+                        break
+                    key, _, value = header.decode().partition(":")
+                    if key.lower() == "content-length":
+                        length = int(value)
+                body = json.loads(await reader.readexactly(length))
+                received.append([r["ts"] for r in body["readings"]])
+                status = statuses.pop(0) if statuses else 200
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Length: 2\r\n\r\n{{}}".encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1], received
+
+
+async def check_http_uplink():
+    fw.BATCH_SIZE = 2
+    fw.FLUSH_INTERVAL_MS = 1
+    fw.BACKOFF_MIN_MS = 1
+    fw.BACKOFF_MAX_MS = 4
+    server, port, received = await scripted_server([200, 422, 500, 429, 200])
+    buffer = fw.RingBuffer(16)
+    for ts in range(6):
+        buffer.push((float(ts), {"instant_power": 100, "instant_cadence": 80}))
+    stats = {"received": 0, "sent": 0, "rejected": 0, "errors": 0}
+    uplink = fw.HttpUplink("127.0.0.1", port, "BIKE-0001")
+    task = asyncio.create_task(fw.uplink_loop(buffer, uplink, FakeWLAN(), stats))
+    for _ in range(500):
+        if not len(buffer):
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await uplink.close()
+    server.close()
+    await server.wait_closed()
+    # 200 envia [0, 1]; 422 descarta [2, 3]; 500 e 429 reenviam [4, 5] até o 200
+    assert received == [[0.0, 1.0], [2.0, 3.0], [4.0, 5.0], [4.0, 5.0], [4.0, 5.0]], received
+    assert stats == {"received": 0, "sent": 4, "rejected": 2, "errors": 2}, stats
+    assert not len(buffer)
+
+
+def main():
+    checks = [check_ring_buffer, check_backoff, check_records, check_device_name]
+    for check in checks:
+        check()
+    asyncio.run(check_http_uplink())
+    print(f"✅ firmware: {len(checks) + 1} verificações (buffer, backoff, registros, nome, uplink HTTP)")
+
+
+if __name__ == "__main__":
+    main()
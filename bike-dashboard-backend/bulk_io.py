@@ -0,0 +1,369 @@
+"""
+Importação e exportação em massa (CSV e NDJSON), em streaming.
+
+Importação de alunos (`POST /api/students/import`): o corpo da requisição é
+lido em pedaços e dividido em linhas à medida que chega; cada linha válida
+entra num lote, e cada lote de `IMPORT_CHUNK` alunos é gravado numa única
+transação (upsert pelo CPF). O próximo pedaço do corpo só é lido depois que
+o lote foi gravado: a memória usada não depende do tamanho do arquivo. Linhas
+inválidas não interrompem a importação; voltam no relatório com o número da
+linha e o motivo.
+
+- CSV: cabeçalho obrigatório com `cpf`, `name`, `weight`, `height` (ou
+  `nome`, `peso`, `altura`), em qualquer ordem; separador `,` ou `;` (deduzido
+  do cabeçalho; com `;` o decimal pode vir com vírgula). Um registro por
+  linha: campos com quebra de linha não são aceitos.
+- NDJSON: um objeto JSON por linha, com as mesmas chaves.
+
+Exportação: geradores assíncronos que leem o banco em páginas por chave
+(`EXPORT_BATCH` linhas por consulta, keyset) e entregam o CSV/NDJSON de cada
+página. Nada é montado inteiro em memória.
+"""
+
+import codecs
+import csv
+import io
+import json
+import math
+import re
+import sqlite3
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+FORMATS = ("csv", "ndjson")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+IMPORT_COLUMNS = ("cpf", "name", "weight", "height")
+COLUMN_ALIASES = {"nome": "name", "peso": "weight", "altura": "height"}
+IMPORT_CHUNK = 500
+EXPORT_BATCH = 1000
+MAX_LINE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+
+StudentRow = Tuple[str, str, float, float]
+
+_CPF_PUNCTUATION = re.compile(r"[\s.\-/]")
+
+UPSERT_SQL = """
+    INSERT INTO students (cpf, name, weight, height) VALUES (?, ?, ?, ?)
+    ON CONFLICT(cpf) DO UPDATE SET
+        name = excluded.name, weight = excluded.weight, height = excluded.height
+"""
+
+
+class RowError(ValueError):
+    pass
+
+
+class BulkImportError(ValueError):
+    """Erro que impede a importação inteira (formato, cabeçalho, codificação)."""
+
+
+def negotiate_format(fmt: Optional[str], content_type: Optional[str]) -> str:
+    """`format` explícito, senão pelo Content-Type (padrão: CSV)."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise BulkImportError(f"formato inválido: {fmt} (válidos: {list(FORMATS)})")
+        return fmt
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json-seq" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+# ──────────────────────────────────────────
+# Importação
+# ──────────────────────────────────────────
+class LineSplitter:
+    """Divide um stream de bytes em linhas (sem o `\\n`), com limite de tamanho."""
+
+    def __init__(self, max_line: int = MAX_LINE):
+        self.max_line = max_line
+        self.buffer = b""
+        self.skipping = False
+
+    def feed(self, chunk: bytes) -> List[Optional[bytes]]:
+        """Linhas completas; None no lugar de uma linha que passou do limite."""
+        data = self.buffer + chunk
+        lines: List[Optional[bytes]] = []
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            if self.skipping:
+                self.skipping = False
+            else:
+                lines.append(data[start:end] if end - start <= self.max_line else None)
+            start = end + 1
+        self.buffer = data[start:]
+        if len(self.buffer) > self.max_line:
+            # Linha longa demais ainda sem fim: descartada até o próximo \n
+            if not self.skipping:
+                lines.append(None)
+            self.skipping = True
+            self.buffer = b""
+        return lines
+
+    def finish(self) -> List[Optional[bytes]]:
+        tail, self.buffer = self.buffer, b""
+        return [tail] if tail and not self.skipping else []
+
+
+def _number(value: Any, field: str, decimal_comma: bool) -> float:
+    if isinstance(value, bool):
+        raise RowError(f"{field} inválido")
+    if isinstance(value, str):
+        text = value.strip()
+        if decimal_comma:
+            text = text.replace(",", ".")
+        try:
+            value = float(text)
+        except ValueError:
+            raise RowError(f"{field} inválido: {value!r}")
+    if not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise RowError(f"{field} inválido: {value!r}")
+    return float(value)
+
+
+def validate_student(record: Dict[str, Any], decimal_comma: bool = False) -> StudentRow:
+    """(cpf, nome, peso, altura) normalizados, ou RowError."""
+    missing = [c for c in IMPORT_COLUMNS if record.get(c) in (None, "")]
+    if missing:
+        raise RowError(f"campos ausentes: {missing}")
+    cpf = _CPF_PUNCTUATION.sub("", str(record["cpf"]))
+    if len(cpf) != 11 or not cpf.isascii() or not cpf.isdigit():
+        raise RowError(f"CPF inválido: {record['cpf']!r}")
+    name = record["name"]
+    if not isinstance(name, str) or not name.strip():
+        raise RowError("nome inválido")
+    return (
+        cpf,
+        " ".join(name.split()),
+        _number(record["weight"], "weight", decimal_comma),
+        _number(record["height"], "height", decimal_comma),
+    )
+
+
+class StudentParser:
+    """Converte linhas de texto em alunos validados (CSV com cabeçalho ou NDJSON)."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.columns: Optional[List[Optional[str]]] = None
+        self.delimiter = ","
+
+    def header(self, line: str):
+        self.delimiter = ";" if line.count(";") > line.count(",") else ","
+        names = [c.strip().lower() for c in next(csv.reader([line], delimiter=self.delimiter))]
+        self.columns = [COLUMN_ALIASES.get(n, n) if COLUMN_ALIASES.get(n, n) in IMPORT_COLUMNS else None
+                        for n in names]
+        missing = [c for c in IMPORT_COLUMNS if c not in self.columns]
+        if missing:
+            raise BulkImportError(f"cabeçalho CSV sem as colunas {missing}")
+
+    def parse(self, line: str) -> Optional[StudentRow]:
+        """Aluno da linha, None para a linha de cabeçalho; RowError se inválida."""
+        if self.fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise RowError(f"JSON inválido: {e}")
+            if not isinstance(record, dict):
+                raise RowError("esperado um objeto JSON")
+            record = {COLUMN_ALIASES.get(k, k): v for k, v in record.items()}
+            return validate_student(record)
+        if self.columns is None:
+            self.header(line)
+            return None
+        try:
+            values = next(csv.reader([line], delimiter=self.delimiter))
+        except csv.Error as e:
+            raise RowError(f"CSV inválido: {e}")
+        if len(values) != len(self.columns):
+            raise RowError(f"esperadas {len(self.columns)} colunas, vieram {len(values)}")
+        record = {c: v.strip() for c, v in zip(self.columns, values) if c is not None}
+        return validate_student(record, decimal_comma=self.delimiter == ";")
+
+
+def upsert_students(conn: sqlite3.Connection, rows: Sequence[StudentRow]) -> List[bool]:
+    """Grava o lote (na transação de quem chama); retorna, por linha, se o CPF já existia."""
+    cpfs = list({row[0] for row in rows})
+    existing = {
+        r[0] for r in conn.execute(
+            f"SELECT cpf FROM students WHERE cpf IN ({', '.join('?' * len(cpfs))})", cpfs
+        )
+    }
+    conn.executemany(UPSERT_SQL, rows)
+    updated = []
+    for row in rows:
+        updated.append(row[0] in existing)
+        existing.add(row[0])
+    return updated
+
+
+class ImportReport:
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.failed = 0
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format": self.fmt,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_students(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    write: Callable[[List[StudentRow]], Awaitable[List[bool]]],
+    encoding: str = "utf-8",
+    chunk_rows: int = IMPORT_CHUNK,
+) -> ImportReport:
+    """
+    Lê o corpo em streaming e chama `write(lote)` a cada `chunk_rows` alunos
+    válidos (`write` grava numa transação e retorna upsert_students).
+    Levanta BulkImportError se o arquivo não puder ser lido (nada é gravado
+    antes do cabeçalho CSV ser validado).
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise BulkImportError(f"codificação desconhecida: {encoding}")
+    report = ImportReport(fmt)
+    parser = StudentParser(fmt)
+    splitter = LineSplitter()
+    pending: List[StudentRow] = []
+    line_no = 0
+
+    async def flush():
+        for updated in await write(pending):
+            if updated:
+                report.updated += 1
+            else:
+                report.inserted += 1
+        pending.clear()
+
+    def handle(lines: Iterable[Optional[bytes]]):
+        nonlocal line_no
+        for raw in lines:
+            line_no += 1
+            if raw is None:
+                report.rows += 1
+                report.error(line_no, f"linha maior que {MAX_LINE} bytes")
+                continue
+            try:
+                text = raw.decode(encoding).rstrip("\r")
+            except UnicodeDecodeError:
+                report.rows += 1
+                report.error(line_no, f"texto fora da codificação {encoding}")
+                continue
+            if line_no == 1:
+                text = text.lstrip("\ufeff")
+            if not text.strip():
+                continue
+            try:
+                row = parser.parse(text)
+            except RowError as e:
+                report.rows += 1
+                report.error(line_no, str(e))
+                continue
+            if row is not None:
+                report.rows += 1
+                pending.append(row)
+
+    async for chunk in chunks:
+        handle(splitter.feed(chunk))
+        if len(pending) >= chunk_rows:
+            await flush()
+    handle(splitter.finish())
+    if parser.fmt == "csv" and parser.columns is None:
+        raise BulkImportError("arquivo CSV vazio (sem cabeçalho)")
+    if pending:
+        await flush()
+    return report
+
+
+# ──────────────────────────────────────────
+# Exportação
+# ──────────────────────────────────────────
+async def keyset_pages(
+    read: Callable[[Callable[[sqlite3.Connection], Any]], Awaitable[Any]],
+    select: str,
+    keys: Sequence[str],
+    where: str = "",
+    params: Sequence[Any] = (),
+    batch: int = EXPORT_BATCH,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Páginas de `select` em ordem de `keys` (expressões SQL; o nome da coluna
+    no resultado é o trecho depois do último "."), uma consulta por página.
+    `read` é `Database.read`.
+    """
+    names = [k.rsplit(".", 1)[-1] for k in keys]
+    order = ", ".join(keys)
+    after: Optional[Tuple[Any, ...]] = None
+    while True:
+        conditions = [where] if where else []
+        args = list(params)
+        if after is not None:
+            conditions.append(f"({order}) > ({', '.join('?' * len(keys))})")
+            args.extend(after)
+        sql = select
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order} LIMIT ?"
+        args.append(batch)
+        rows = await read(lambda conn: [dict(r) for r in conn.execute(sql, args)])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch:
+            return
+        after = tuple(rows[-1][n] for n in names)
+
+
+async def encode_rows(
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    fmt: str,
+    columns: Sequence[str],
+    json_columns: Sequence[str] = (),
+) -> AsyncIterator[str]:
+    """
+    CSV (com cabeçalho) ou NDJSON de cada página. `json_columns` guardam JSON
+    em texto: no NDJSON saem como valor, no CSV como o texto original.
+    """
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        yield out.getvalue()
+        async for rows in pages:
+            out.seek(0)
+            out.truncate()
+            writer.writerows([[row[c] for c in columns] for row in rows])
+            yield out.getvalue()
+        return
+    async for rows in pages:
+        lines = []
+        for row in rows:
+            record = {c: row[c] for c in columns}
+            for c in json_columns:
+                if record[c] is not None:
+                    record[c] = json.loads(record[c])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield "\n".join(lines) + "\n"
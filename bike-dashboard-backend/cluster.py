@@ -0,0 +1,266 @@
+"""
+Vários workers (`uvicorn --workers N`) com o mesmo estado ao vivo.
+
+Cada worker mantém uma réplica completa do estado das bikes. Tudo que muda
+esse estado — lotes de leituras, remoções por inatividade, início e fim de
+aula, mudanças de vínculos — é publicado num barramento que entrega as
+mensagens a todos os workers, inclusive a quem publicou, na mesma ordem.
+Como cada lote leva o `current_time` de quem o recebeu, a integração da
+distância dá o mesmo resultado em todas as réplicas. A ingestão e o fan-out
+do WebSocket ficam distribuídos: cada worker recebe parte das requisições e
+atende só os seus clientes.
+
+`BrokerBus`: broker TCP em 127.0.0.1:CLUSTER_PORT, embutido no primeiro
+worker que consegue abrir a porta (o "líder"); os demais se conectam como
+clientes. Se o líder cair, os outros disputam a porta de novo. Ao conectar
+(ou reconectar), o worker pede o estado atual a um par já sincronizado e
+aplica por cima dele as mensagens que chegaram depois do pedido. Frames:
+u32 tamanho + JSON. Qualquer broker que entregue as mensagens a todos na
+mesma ordem pode substituir o embutido.
+
+`LocalBus` (sem CLUSTER_PORT): entrega na hora, no próprio processo — um
+worker, como antes.
+"""
+
+import asyncio
+import json
+import os
+import struct
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+Message = Dict[str, Any]
+# handler(mensagem, publicada_por_este_worker)
+Handler = Callable[[Message, bool], None]
+
+_LENGTH = struct.Struct("<I")
+
+
+def _frame(message: Message) -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode()
+    return _LENGTH.pack(len(body)) + body
+
+
+class LocalBus:
+    """Um único processo: `publish` aplica a mensagem imediatamente."""
+
+    leader = True
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler, snapshot: Callable[[], Any], restore: Callable[[Any], None]):
+        self._handler = handler
+
+    def publish(self, message: Message):
+        self._handler(message, True)
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "local", "worker": os.getpid(), "leader": True}
+
+
+class Broker:
+    """Repassa cada frame recebido a todos os workers conectados, na ordem de chegada."""
+
+    def __init__(self, max_buffer: int):
+        self.max_buffer = max_buffer
+        self.clients: set = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @classmethod
+    async def listen(cls, host: str, port: int, max_buffer: int = 16 * 1024 * 1024) -> Optional["Broker"]:
+        """Broker escutando em host:port, ou None se outro worker já tem a porta."""
+        broker = cls(max_buffer)
+        try:
+            broker.server = await asyncio.start_server(broker._handle, host, port)
+        except OSError:
+            return None
+        return broker
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(_LENGTH.size)
+                frame = header + await reader.readexactly(_LENGTH.unpack(header)[0])
+                for client in list(self.clients):
+                    if client.transport.get_write_buffer_size() > self.max_buffer:
+                        # Worker travado: desconecta; ele reconecta e pede o estado de novo
+                        self.clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def close(self):
+        self.server.close()
+        for client in list(self.clients):
+            client.close()
+        await self.server.wait_closed()
+
+
+class BrokerBus:
+    """
+    Cliente do broker (e broker, se conseguir a porta). Mensagens publicadas
+    sem conexão ficam numa fila limitada e são enviadas ao reconectar.
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", sync_timeout: float = 1.0, max_queue: int = 10000):
+        self.host = host
+        self.port = port
+        self.sync_timeout = sync_timeout
+        self.worker = f"{os.getpid()}-{id(self):x}"
+        self.leader = False
+        self.connected = False
+        self.synced = False
+        self.published = 0
+        self.received = 0
+        self.syncs = 0
+        self.dropped = 0
+        self._queue: deque = deque(maxlen=max_queue)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._broker: Optional[Broker] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sync_id = 0
+        self._sync_buffer: Optional[list] = None
+        self._synced_event = asyncio.Event()
+
+    async def start(self, handler: Handler, snapshot: Callable[[], Any], restore: Callable[[Any], None]):
+        """Conecta e espera a primeira sincronização (limitada a alguns segundos)."""
+        self._handler = handler
+        self._snapshot = snapshot
+        self._restore = restore
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._synced_event.wait(), timeout=self.sync_timeout * 5)
+        except asyncio.TimeoutError:
+            print("⚠️ Cluster: sem sincronização inicial, seguindo com o estado local")
+
+    def publish(self, message: Message):
+        frame = _frame({**message, "w": self.worker})
+        self.published += 1
+        if self._writer is not None:
+            self._writer.write(frame)
+        else:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(frame)
+
+    async def _run(self):
+        delay = 0.05
+        while True:
+            if self._broker is None:
+                self._broker = await Broker.listen(self.host, self.port)
+                if self._broker is not None:
+                    self.leader = True
+                    print(f"Cluster: este worker hospeda o broker em {self.host}:{self.port}")
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2.0)
+                continue
+            delay = 0.05
+            self._writer = writer
+            self.connected = True
+            self._request_sync()
+            while self._queue:
+                writer.write(self._queue.popleft())
+            try:
+                while True:
+                    header = await reader.readexactly(_LENGTH.size)
+                    body = await reader.readexactly(_LENGTH.unpack(header)[0])
+                    self.received += 1
+                    self._dispatch(json.loads(body))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print("⚠️ Cluster: conexão com o broker perdida, reconectando")
+            finally:
+                self._writer = None
+                self.connected = False
+                writer.close()
+
+    # Sincronização --------------------------------------------------
+    def _request_sync(self):
+        self._sync_id += 1
+        self.synced = False
+        self._sync_buffer = None
+        self._writer.write(_frame({"type": "sync_request", "req": self._sync_id, "w": self.worker}))
+
+    def _finish_sync(self):
+        buffered, self._sync_buffer = self._sync_buffer or [], None
+        self.synced = True
+        self.syncs += 1
+        for message, origin in buffered:
+            self._apply(message, origin)
+        self._synced_event.set()
+
+    def _sync_timeout(self, req: int):
+        # Nenhum par respondeu: primeiro worker (ou todos reiniciando) — vale o estado local
+        if req == self._sync_id and not self.synced:
+            self._finish_sync()
+
+    def _dispatch(self, message: Message):
+        kind = message["type"]
+        origin = message.get("w") == self.worker
+        if kind == "sync_request":
+            if origin:
+                if message["req"] == self._sync_id:
+                    # Daqui em diante as mensagens ficam guardadas até o estado chegar
+                    self._sync_buffer = []
+                    asyncio.get_running_loop().call_later(self.sync_timeout, self._sync_timeout, self._sync_id)
+            elif self.synced:
+                self.publish({"type": "sync", "to": message["w"], "req": message["req"], "state": self._snapshot()})
+            return
+        if kind == "sync":
+            if message["to"] == self.worker and message["req"] == self._sync_id and not self.synced:
+                self._restore(message["state"])
+                self._finish_sync()
+            return
+        if self.synced:
+            self._apply(message, origin)
+        elif self._sync_buffer is not None:
+            self._sync_buffer.append((message, origin))
+        # Antes do eco do próprio pedido: já incluída no estado que o par vai enviar
+
+    def _apply(self, message: Message, origin: bool):
+        try:
+            self._handler(message, origin)
+        except Exception as e:
+            print(f"⚠️ Cluster: erro ao aplicar {message.get('type')}: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        if self._broker is not None:
+            await self._broker.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "broker",
+            "worker": self.worker,
+            "leader": self.leader,
+            "connected": self.connected,
+            "synced": self.synced,
+            "published": self.published,
+            "received": self.received,
+            "syncs": self.syncs,
+            "queued": len(self._queue),
+            "dropped": self.dropped,
+        }
+
+
+def create_bus():
+    """BrokerBus com CLUSTER_PORT definido; senão LocalBus."""
+    port = os.getenv("CLUSTER_PORT")
+    if port:
+        return BrokerBus(int(port), host=os.getenv("CLUSTER_HOST", "127.0.0.1"))
+    return LocalBus()
@@ -0,0 +1,238 @@
+"""
+Conexões WebSocket com fila de saída própria por cliente.
+
+Cada cliente tem uma fila limitada e uma task escritora. O broadcast apenas
+enfileira (não espera nenhum socket), então um tablet lento não atrasa os
+outros dashboards nem a ingestão.
+
+Frames de estado ("updates") podem ser descartados: quando a fila enche, os
+frames de estado pendentes são removidos e o cliente recebe, na vez dele, um
+snapshot com o estado mais recente de todas as bikes. Frames de controle
+(initial, assignments, pong) nunca são mesclados.
+
+Cada cliente fala um protocolo (ver `protocol.py`); o broadcast pode receber
+um frame por protocolo, e clientes cujo protocolo não está no dicionário são
+ignorados. Cada cliente também tem as suas assinaturas de bikes e canais
+(ver `subscriptions.py`).
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Collection, Deque, Dict, List, Optional, Set, Tuple, Union
+
+from fastapi import WebSocket
+
+import metrics
+from subscriptions import TELEMETRY, Group, SubscriptionIndex
+
+Message = Union[str, bytes]
+Frames = Union[Message, Dict[str, Message]]
+
+_client_ids = itertools.count(1)
+
+
+class ClientConnection:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        manager: "ConnectionManager",
+        max_queue: int,
+        protocol: str,
+    ):
+        self.id = next(_client_ids)
+        self.websocket = websocket
+        self.protocol = protocol
+        self.manager = manager
+        self.max_queue = max_queue
+        self.pending: Deque[Tuple[bool, Message]] = deque()
+        self.wakeup = asyncio.Event()
+        self.needs_resync = False
+        self.lagging_since: Optional[float] = None
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+        # Assinaturas (preenchidas por SubscriptionIndex.add)
+        self.devices: Optional[Set[str]] = None
+        self.page: Optional[Tuple[int, int]] = None
+        self.group: Optional[Group] = None
+        self.channels: Set[str] = set()
+
+    def enqueue(self, message: Message, mergeable: bool = False):
+        """Enfileira um frame sem bloquear. Retorna False se o cliente foi removido."""
+        if self.closed:
+            return False
+
+        if len(self.pending) >= self.max_queue:
+            # Fila cheia: descarta os frames de estado pendentes e agenda um snapshot
+            kept = deque(item for item in self.pending if not item[0])
+            self._drop(len(self.pending) - len(kept))
+            self.pending = kept
+            if self.lagging_since is None:
+                self.lagging_since = time.monotonic()
+            elif time.monotonic() - self.lagging_since > self.manager.max_lag:
+                self.manager.evict(self, "cliente lento")
+                return False
+
+            if mergeable:
+                self.needs_resync = True
+                self._drop(1)
+                self.wakeup.set()
+                return True
+            if len(self.pending) >= self.max_queue:
+                self.pending.popleft()
+                self._drop(1)
+
+        self.pending.append((mergeable, message))
+        self.wakeup.set()
+        return True
+
+    def _drop(self, count: int):
+        if count:
+            self.dropped += count
+            metrics.WS_DROPPED_FRAMES.inc(self.protocol, amount=count)
+
+    def _next_message(self) -> Optional[Message]:
+        if self.needs_resync:
+            # Frames de estado antigos já foram descartados: envia só o mais recente
+            self.needs_resync = False
+            self.resyncs += 1
+            metrics.WS_RESYNCS.inc(self.protocol)
+            self.pending = deque(item for item in self.pending if not item[0])
+            return self.manager.snapshot(self)
+        if self.pending:
+            return self.pending.popleft()[1]
+        return None
+
+    async def run_writer(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while True:
+                    message = self._next_message()
+                    if message is None:
+                        break
+                    if isinstance(message, bytes):
+                        send = self.websocket.send_bytes(message)
+                    else:
+                        send = self.websocket.send_text(message)
+                    if metrics.ENABLED:
+                        start = time.perf_counter()
+                        await asyncio.wait_for(send, timeout=self.manager.send_timeout)
+                        metrics.WS_SEND_SECONDS.observe(time.perf_counter() - start, self.protocol)
+                    else:
+                        await asyncio.wait_for(send, timeout=self.manager.send_timeout)
+                    self.sent += 1
+                self.lagging_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.manager.evict(self, f"falha no envio ({type(e).__name__})")
+
+    def stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "id": self.id,
+            "client": f"{client.host}:{client.port}" if client else None,
+            "protocol": self.protocol,
+            "connected_for": round(time.time() - self.connected_at, 1),
+            "queue_depth": len(self.pending),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "lagging_for": round(time.monotonic() - self.lagging_since, 1) if self.lagging_since else 0.0,
+            "channels": sorted(self.channels),
+            "devices": len(self.devices) if self.devices is not None else "*",
+            "page": self.page,
+        }
+
+
+class ConnectionManager:
+    """
+    Mantém os clientes WebSocket ativos e distribui frames para as filas deles.
+    `snapshot(client)` gera o frame de estado completo, no protocolo do cliente,
+    usado quando ele fica para trás.
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[ClientConnection], Message],
+        max_queue: int = 32,
+        max_lag: float = 10.0,
+        send_timeout: float = 5.0,
+    ):
+        self.snapshot = snapshot
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.send_timeout = send_timeout
+        self.clients: Set[ClientConnection] = set()
+        self.subscriptions = SubscriptionIndex()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def connect(self, websocket: WebSocket, protocol: str) -> ClientConnection:
+        client = ClientConnection(websocket, self, self.max_queue, protocol)
+        client.writer = asyncio.create_task(client.run_writer())
+        self.clients.add(client)
+        self.subscriptions.add(client)
+        return client
+
+    def disconnect(self, client: ClientConnection):
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.discard(client)
+        self.subscriptions.remove(client)
+        if client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def evict(self, client: ClientConnection, reason: str):
+        if client.closed:
+            return
+        self.disconnect(client)
+        self.evicted += 1
+        metrics.WS_EVICTIONS.inc(reason.split(" (")[0])
+        print(f"Cliente {client.id} removido: {reason}. Conexões ativas: {len(self.clients)}")
+        asyncio.create_task(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013 = "try again later"; o frontend reconecta sozinho
+            await asyncio.wait_for(websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    def protocols(self) -> Set[str]:
+        return {client.protocol for client in self.clients}
+
+    def broadcast(self, message: Frames, mergeable: bool = False, channel: Optional[str] = None):
+        """Só para os clientes que assinam `channel` (None = todos)."""
+        clients = [c for c in self.clients if channel is None or channel in c.channels]
+        if not isinstance(message, dict):
+            for client in clients:
+                client.enqueue(message, mergeable)
+            return
+        for client in clients:
+            frame = message.get(client.protocol)
+            if frame is not None:
+                client.enqueue(frame, mergeable)
+
+    def route(self, devices: Collection[str]) -> Tuple[List[ClientConnection], Dict[Group, Collection[str]]]:
+        """
+        Destinatários de um tick com as bikes `devices`: os clientes do canal
+        telemetry que recebem todas as bikes e {grupo de assinatura: as bikes
+        que ele assina} (ver SubscriptionIndex.route). Nos grupos o canal de
+        cada cliente é conferido por quem envia, sem copiar os grupos a cada tick.
+        """
+        everyone = [c for c in self.subscriptions.everything if TELEMETRY in c.channels]
+        return everyone, self.subscriptions.route(devices)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [client.stats() for client in self.clients]
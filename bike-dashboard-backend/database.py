@@ -0,0 +1,113 @@
+"""
+Acesso assíncrono ao SQLite.
+
+As consultas rodam em threads dedicadas (nunca no event loop):
+- leituras: pool pequeno de threads, cada uma com sua própria conexão;
+- escritas: uma única thread/conexão, já que o SQLite tem um só escritor.
+
+O banco opera em modo WAL (leitores não bloqueiam o escritor) com pragmas
+ajustados, e cada conexão mantém um cache de statements preparados
+(`cached_statements`), reaproveitados porque o SQL é sempre o mesmo texto.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class Database:
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run_read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return fn(self._conn())
+
+    def _run_write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        conn = self._conn()
+        try:
+            result = fn(conn)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+
+    async def read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Executa `fn(conn)` em uma thread de leitura."""
+        loop = asyncio.get_running_loop()
+        if not metrics.ENABLED:
+            return await loop.run_in_executor(self._readers, self._run_read, fn)
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._readers, self._run_read, fn)
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - start, metrics.current_endpoint.get(), "read")
+
+    async def transaction(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Executa `fn(conn)` na thread de escrita, dentro de uma transação (commit/rollback)."""
+        loop = asyncio.get_running_loop()
+        if not metrics.ENABLED:
+            return await loop.run_in_executor(self._writer, self._run_write, fn)
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._writer, self._run_write, fn)
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - start, metrics.current_endpoint.get(), "write")
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        return await self.read(lambda c: [dict(r) for r in c.execute(sql, params).fetchall()])
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        def run(c):
+            row = c.execute(sql, params).fetchone()
+            return dict(row) if row else None
+        return await self.read(run)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Executa uma escrita e retorna `rowcount`."""
+        return await self.transaction(lambda c: c.execute(sql, params).rowcount)
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,191 @@
+"""
+Decodificação da característica Indoor Bike Data (0x2AD2) do FTMS.
+
+Usado pelo firmware (copiar este arquivo para o ESP32 junto com
+`CodigoMicroPythonBase.py`) e pelo backend, então só depende de `struct` e
+roda igual em MicroPython e CPython.
+
+Os campos presentes dependem das 13 flags dos dois primeiros bytes. O layout
+de cada valor de flags (formato struct, nomes e divisores) é montado uma vez
+e guardado; cada notificação é lida com um único `unpack_from`, sem os
+`bool` por flag e as chamadas por campo do parser antigo.
+
+Uma notificação truncada traz só os campos que cabem inteiros nela (o bloco
+de energia, 5 bytes, é tudo ou nada), como antes.
+"""
+
+import struct
+
+FLAGS_MASK = 0x1FFF
+
+# Por flag, na ordem da especificação: (nome, formato struct, divisor).
+# Divisor 1 → valor inteiro; None → u24 lido como "3s". O bit 0 ("More Data")
+# é invertido: a velocidade instantânea vem quando ele está zerado.
+FLAG_FIELDS = (
+    (("instant_speed", "H", 100.0),),
+    (("average_speed", "H", 100.0),),
+    (("instant_cadence", "H", 2.0),),
+    (("average_cadence", "H", 2.0),),
+    (("total_distance", "3s", None),),
+    (("resistance_level", "h", 1),),
+    (("instant_power", "h", 1),),
+    (("average_power", "h", 1),),
+    (("total_energy", "H", 1), ("energy_per_hour", "H", 1), ("energy_per_minute", "B", 1)),
+    (("heart_rate", "B", 1),),
+    (("metabolic_equivalent", "B", 10.0),),
+    (("elapsed_time", "H", 1),),
+    (("remaining_time", "H", 1),),
+)
+
+# Todos os campos possíveis; índice de cada um em `parse_into`
+FIELDS = tuple(name for group in FLAG_FIELDS for name, _, _ in group)
+_EMPTY = (None,) * len(FIELDS)
+
+try:
+    _Struct = struct.Struct
+except AttributeError:  # MicroPython sem struct.Struct
+    class _Struct:
+        def __init__(self, fmt):
+            self.format = fmt
+            self.size = struct.calcsize(fmt)
+
+        def unpack_from(self, buf, offset=0):
+            return struct.unpack_from(self.format, buf, offset)
+
+
+def _entries(flags):
+    """(nome, formato, divisor, fim) de cada campo presente; `fim` é o byte final do seu grupo."""
+    entries = []
+    end = 2
+    for bit, group in enumerate(FLAG_FIELDS):
+        present = flags & (1 << bit)
+        if (not present) if bit else present:
+            continue
+        for _, fmt, _ in group:
+            end += struct.calcsize("<" + fmt)
+        for name, fmt, divisor in group:
+            entries.append((name, fmt, divisor, end))
+    return entries
+
+
+class IndoorBikeParser:
+    """
+    Parser com cache de layouts por flags. `parse` devolve um dict (ou
+    preenche `out`, reaproveitado entre notificações); `parse_into` escreve
+    numa lista pré-alocada de len(FIELDS) posições.
+    """
+
+    def __init__(self):
+        # flags → layout da notificação completa; (flags, tamanho) → layout truncado
+        self._layouts = {}
+        self._truncated = {}
+
+    def layout(self, flags, length):
+        """
+        Layout para `flags` lendo até `length` bytes: (tamanho, struct, nomes,
+        índices em FIELDS, ((posição, divisor), ...) dos campos escalados,
+        posição do u24 da distância ou -1).
+        """
+        layout = self._layouts.get(flags)
+        if layout is None:
+            layout = self._layouts[flags] = self._build(flags, None)
+        if layout[0] <= length:
+            return layout
+        key = (flags, length)
+        layout = self._truncated.get(key)
+        if layout is None:
+            if len(self._truncated) >= 1024:
+                self._truncated.clear()
+            layout = self._truncated[key] = self._build(flags, length)
+        return layout
+
+    @staticmethod
+    def _build(flags, length):
+        fmt = "<"
+        names = []
+        scaled = []
+        u24 = -1
+        for name, code, divisor, end in _entries(flags):
+            if length is not None and end > length:
+                break
+            fmt += code
+            if divisor is None:
+                u24 = len(names)
+            elif divisor != 1:
+                scaled.append((len(names), divisor))
+            names.append(name)
+        s = _Struct(fmt)
+        return 2 + s.size, s, tuple(names), tuple(FIELDS.index(n) for n in names), tuple(scaled), u24
+
+    def _unpack(self, msg):
+        flags = (msg[0] | (msg[1] << 8)) & FLAGS_MASK
+        layout = self._layouts.get(flags)
+        if layout is None or layout[0] > len(msg):
+            layout = self.layout(flags, len(msg))
+        return layout, layout[1].unpack_from(msg, 2)
+
+    def parse(self, msg, out=None):
+        if out is None:
+            out = {}
+        else:
+            out.clear()
+        if len(msg) < 2:
+            return out
+        (_, _, names, _, scaled, u24), values = self._unpack(msg)
+        out.update(zip(names, values))
+        for i, divisor in scaled:
+            out[names[i]] = values[i] / divisor
+        if u24 >= 0:
+            out[names[u24]] = int.from_bytes(values[u24], "little")
+        return out
+
+    def parse_into(self, msg, values):
+        """
+        Escreve cada campo de FIELDS em `values[índice]` (None se ausente);
+        `values` deve ter len(FIELDS) posições. Retorna `values`.
+        """
+        values[:] = _EMPTY
+        if len(msg) < 2:
+            return values
+        (_, _, _, indexes, scaled, u24), raw = self._unpack(msg)
+        for index, value in zip(indexes, raw):
+            values[index] = value
+        for i, divisor in scaled:
+            values[indexes[i]] = raw[i] / divisor
+        if u24 >= 0:
+            values[indexes[u24]] = int.from_bytes(raw[u24], "little")
+        return values
+
+
+def encode_indoor_bike_data(reading):
+    """
+    Notificação Indoor Bike Data com os campos de `reading` (simuladores e
+    testes). Um grupo só entra se todos os seus campos estiverem presentes.
+    """
+    flags = 0
+    fmt = "<H"
+    values = []
+    for bit, group in enumerate(FLAG_FIELDS):
+        present = all(reading.get(name) is not None for name, _, _ in group)
+        if bit == 0 and not present:
+            flags |= 1  # "More Data": sem velocidade instantânea
+        if not present:
+            continue
+        if bit:
+            flags |= 1 << bit
+        for name, code, divisor in group:
+            value = reading[name]
+            fmt += code
+            if divisor is None:
+                values.append(int(value).to_bytes(3, "little"))
+            else:
+                values.append(int(round(value * divisor)))
+    return struct.pack(fmt, flags, *values)
+
+
+_parser = IndoorBikeParser()
+
+
+def parse_indoor_bike_data(msg):
+    """Dict com os campos presentes em `msg` (vazio se tiver menos de 2 bytes)."""
+    return _parser.parse(msg)
@@ -0,0 +1,132 @@
+"""
+Emissor de teste para a ingestão binária (UDP/TCP) — faz o papel dos
+gateways ESP32 sem hardware.
+
+Envia leituras de N bikes simuladas no formato de `ingest_listener.py`; no
+UDP agrupa os registros de cada rodada em datagramas de até MAX_DATAGRAM
+bytes, no TCP usa uma única conexão persistente. Com `--raw` envia a
+notificação FTMS crua (registros versão 2), decodificada pelo backend. Com
+`--check` confere, ao final, se todas as bikes aparecem em `/api/bikes`.
+
+    # backend com INGEST_UDP_PORT=9000 INGEST_TCP_PORT=9001
+    python ftms_sender.py --udp 9000 --bikes 50 --hz 4 --duration 10 --check
+    python ftms_sender.py --tcp 9001 --bikes 50 --extras --check
+    python ftms_sender.py --tcp 9001 --bikes 50 --extras --raw --check
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import sys
+import time
+import urllib.request
+
+from ftms import encode_indoor_bike_data
+from ingest_listener import MAX_DATAGRAM, encode_raw_record, encode_record
+
+
+def make_reading(rng: random.Random, extras: bool) -> dict:
+    power = rng.randint(80, 300)
+    reading = {"instant_power": power, "instant_cadence": round(rng.uniform(60, 110) * 2) / 2}
+    if extras:
+        reading["heart_rate"] = rng.randint(90, 180)
+        reading["resistance_level"] = rng.randint(1, 20)
+        reading["total_energy"] = rng.randint(0, 500)
+        reading["energy_per_hour"] = rng.randint(300, 900)
+        reading["energy_per_minute"] = rng.randint(5, 15)
+    return reading
+
+
+def make_record(device: str, ts: float, reading: dict, raw: bool) -> bytes:
+    if raw:
+        return encode_raw_record(device, ts, encode_indoor_bike_data(reading))
+    return encode_record(device, ts, reading)
+
+
+def datagrams(records):
+    """Agrupa registros em datagramas de até MAX_DATAGRAM bytes."""
+    current = bytearray()
+    for record in records:
+        if current and len(current) + len(record) > MAX_DATAGRAM:
+            yield bytes(current)
+            current = bytearray()
+        current += record
+    if current:
+        yield bytes(current)
+
+
+async def run(args) -> int:
+    rng = random.Random(args.seed)
+    devices = [f"{args.prefix}{i:04d}" for i in range(1, args.bikes + 1)]
+    interval = 1.0 / args.hz
+
+    if args.tcp:
+        _, writer = await asyncio.open_connection(args.host, args.tcp)
+        sock = None
+    else:
+        writer = None
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((args.host, args.udp))
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + args.duration
+    next_round = loop.time()
+    sent = packets = 0
+    while loop.time() < deadline:
+        now = time.time()
+        records = [make_record(d, now, make_reading(rng, args.extras), args.raw) for d in devices]
+        if writer:
+            writer.write(b"".join(records))
+            await writer.drain()
+            packets += 1
+        else:
+            for datagram in datagrams(records):
+                sock.send(datagram)
+                packets += 1
+        sent += len(records)
+        next_round += interval
+        await asyncio.sleep(max(0.0, next_round - loop.time()))
+
+    if writer:
+        writer.close()
+        await writer.wait_closed()
+    else:
+        sock.close()
+    print(f"{sent} leituras enviadas em {packets} {'escritas TCP' if writer else 'datagramas UDP'}")
+
+    if not args.check:
+        return 0
+    await asyncio.sleep(0.5)
+    with urllib.request.urlopen(f"{args.url}/api/bikes", timeout=5) as response:
+        bikes = json.load(response)["bikes"]
+    missing = [d for d in devices if d not in bikes]
+    if missing:
+        print(f"❌ {len(missing)} bikes não chegaram ao backend (ex.: {missing[:3]})")
+        return 1
+    print(f"✅ Todas as {len(devices)} bikes aparecem em /api/bikes")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--udp", type=int, metavar="PORTA")
+    target.add_argument("--tcp", type=int, metavar="PORTA")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--bikes", type=int, default=20)
+    parser.add_argument("--hz", type=float, default=4.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--extras", action="store_true", help="inclui frequência cardíaca, resistência e energia")
+    parser.add_argument("--raw", action="store_true", help="envia a notificação FTMS crua (registro versão 2)")
+    parser.add_argument("--prefix", default="BIKE-")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="confere /api/bikes ao final")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
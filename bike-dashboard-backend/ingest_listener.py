@@ -0,0 +1,271 @@
+"""
+Ingestão leve por UDP e TCP para gateways ESP32 (opcional).
+
+Em vez de um POST HTTP com JSON por notificação FTMS, o gateway envia
+registros binários compactos, por datagrama UDP ou por uma conexão TCP
+persistente. Os registros alimentam o mesmo pipeline do `/api/ftms`
+(`apply_readings` → estado, sessão, telemetria, broadcast); o HTTP continua
+disponível para compatibilidade.
+
+Cada registro é precedido do seu tamanho, e um datagrama (ou um trecho do
+stream TCP) pode trazer vários registros. Tudo em little-endian:
+
+    u16 tamanho do registro (sem contar estes 2 bytes)
+    u8  versão (1)
+    u16 máscara de campos extras (bit i → EXTRA_FIELDS[i])
+    u8  n = tamanho do nome do device
+    n   nome do device (UTF-8)
+    f64 ts (s; 0 = usar o relógio do servidor)
+    u16 cadência (unidades de 0,5 rpm, como no FTMS)
+    i16 potência (W)
+    ... extras presentes, na ordem dos bits
+
+A versão 2 leva a notificação Indoor Bike Data crua, decodificada aqui com
+o mesmo parser do firmware (`ftms.py`):
+
+    u16 tamanho do registro
+    u8  versão (2)
+    u8  n = tamanho do nome do device
+    n   nome do device (UTF-8)
+    f64 ts
+    ... payload FTMS (o resto do registro)
+
+Um datagrama com qualquer registro inválido é descartado inteiro; no TCP a
+conexão é encerrada. O mesmo formato é aceito como corpo de `POST /api/ftms/raw`.
+"""
+
+import asyncio
+import math
+import socket
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ftms import IndoorBikeParser
+
+RECORD_VERSION = 1
+RAW_RECORD_VERSION = 2
+
+# (nome, formato struct, escala): valor = bruto / escala
+EXTRA_FIELDS = (
+    ("heart_rate", "B", 1),
+    ("resistance_level", "h", 1),
+    ("total_energy", "H", 1),
+    ("elapsed_time", "H", 1),
+    ("instant_speed", "H", 100),    # velocidade informada pela bike (0,01 km/h)
+    ("average_power", "h", 1),
+)
+
+MAX_DATAGRAM = 1400
+
+_LENGTH = struct.Struct("<H")
+_HEAD = struct.Struct("<BHB")
+_BODY = struct.Struct("<dHh")
+_RAW_HEAD = struct.Struct("<BB")
+_TS = struct.Struct("<d")
+
+Record = Tuple[str, float, Dict[str, Any]]
+
+_extra_structs: Dict[int, Tuple[struct.Struct, Tuple[Tuple[str, int], ...]]] = {}
+
+
+def _extras(mask: int) -> Tuple[struct.Struct, Tuple[Tuple[str, int], ...]]:
+    """Struct e (nome, escala) dos extras presentes em `mask`, calculados uma vez por máscara."""
+    cached = _extra_structs.get(mask)
+    if cached is None:
+        present = [f for i, f in enumerate(EXTRA_FIELDS) if mask & (1 << i)]
+        s = struct.Struct("<" + "".join(fmt for _, fmt, _ in present))
+        cached = _extra_structs[mask] = (s, tuple((name, scale) for name, _, scale in present))
+    return cached
+
+
+def encode_record(device: str, ts: float, reading: Dict[str, Any]) -> bytes:
+    """Registro com prefixo de tamanho; extras presentes em `reading` são incluídos."""
+    name = device.encode()
+    if len(name) > 255:
+        raise ValueError("nome do device muito longo")
+    mask = 0
+    values = []
+    for i, (field, _, scale) in enumerate(EXTRA_FIELDS):
+        value = reading.get(field)
+        if value is not None:
+            mask |= 1 << i
+            values.append(int(round(value * scale)))
+    extras, _ = _extras(mask)
+    body = (
+        _HEAD.pack(RECORD_VERSION, mask, len(name))
+        + name
+        + _BODY.pack(ts, int(round(reading.get("instant_cadence", 0) * 2)), int(reading.get("instant_power", 0)))
+        + extras.pack(*values)
+    )
+    return _LENGTH.pack(len(body)) + body
+
+
+def encode_raw_record(device: str, ts: float, payload: bytes) -> bytes:
+    """Registro versão 2: notificação Indoor Bike Data sem decodificar."""
+    name = device.encode()
+    if len(name) > 255:
+        raise ValueError("nome do device muito longo")
+    body = _RAW_HEAD.pack(RAW_RECORD_VERSION, len(name)) + name + _TS.pack(ts) + payload
+    return _LENGTH.pack(len(body)) + body
+
+
+class IngestListener:
+    """
+    Servidores UDP/TCP que decodificam registros e chamam
+    `on_readings(records, transport)` com a lista de (device, ts, leitura)
+    de cada datagrama ou trecho do stream.
+    """
+
+    def __init__(
+        self,
+        on_readings: Callable[[List[Record], str], None],
+        host: str = "0.0.0.0",
+        udp_port: Optional[int] = None,
+        tcp_port: Optional[int] = None,
+        reuse_port: bool = False,
+    ):
+        self.on_readings = on_readings
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        # SO_REUSEPORT (Linux/BSD): vários workers na mesma porta
+        self.reuse_port = reuse_port and hasattr(socket, "SO_REUSEPORT")
+        self.records = 0
+        self.malformed = 0
+        self._names: Dict[bytes, str] = {}
+        self._ftms = IndoorBikeParser()
+        self._udp: Optional[asyncio.DatagramTransport] = None
+        self._tcp: Optional[asyncio.AbstractServer] = None
+        self._tcp_clients: set = set()
+
+    def decode(self, data, end: Optional[int] = None) -> Tuple[List[Record], int]:
+        """
+        Decodifica os registros completos de `data`; retorna (registros, bytes consumidos).
+        Levanta ValueError em registro inválido.
+        """
+        records: List[Record] = []
+        end = len(data) if end is None else end
+        off = 0
+        names = self._names
+        while off + 2 <= end:
+            (size,) = _LENGTH.unpack_from(data, off)
+            if off + 2 + size > end:
+                break
+            if not size:
+                raise ValueError("registro vazio")
+            start = off + 2
+            version = data[start]
+            if version == RECORD_VERSION:
+                _, mask, name_len = _HEAD.unpack_from(data, start)
+                pos = start + _HEAD.size
+            elif version == RAW_RECORD_VERSION:
+                _, name_len = _RAW_HEAD.unpack_from(data, start)
+                pos = start + _RAW_HEAD.size
+            else:
+                raise ValueError(f"versão de registro desconhecida: {version}")
+            raw_name = bytes(data[pos:pos + name_len])
+            device = names.get(raw_name)
+            if device is None:
+                if len(names) >= 4096:
+                    names.clear()
+                device = names[raw_name] = raw_name.decode()
+            pos += name_len
+            if version == RAW_RECORD_VERSION:
+                (ts,) = _TS.unpack_from(data, pos)
+                if not math.isfinite(ts):
+                    raise ValueError("ts não finito")
+                pos += _TS.size
+                if start + size - pos < 2:
+                    raise ValueError("payload FTMS sem flags")
+                records.append((device, ts, self._ftms.parse(bytes(data[pos:start + size]))))
+                off = start + size
+                continue
+            ts, cadence, power = _BODY.unpack_from(data, pos)
+            if not math.isfinite(ts):
+                raise ValueError("ts não finito")
+            pos += _BODY.size
+            reading: Dict[str, Any] = {"instant_power": power, "instant_cadence": cadence / 2}
+            if mask:
+                extras, fields = _extras(mask)
+                for (field, scale), value in zip(fields, extras.unpack_from(data, pos)):
+                    reading[field] = value / scale if scale != 1 else value
+                pos += extras.size
+            if pos != start + size:
+                raise ValueError("tamanho de registro inconsistente")
+            records.append((device, ts, reading))
+            off = start + size
+        return records, off
+
+    def _deliver(self, records: List[Record], transport: str):
+        if records:
+            self.records += len(records)
+            self.on_readings(records, transport)
+
+    # UDP ----------------------------------------------------------
+    def datagram_received(self, data: bytes):
+        try:
+            records, consumed = self.decode(data)
+            if consumed != len(data):
+                raise ValueError("datagrama truncado")
+        except (ValueError, struct.error, UnicodeDecodeError):
+            self.malformed += 1
+            return
+        self._deliver(records, "udp")
+
+    # TCP ----------------------------------------------------------
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tcp_clients.add(writer)
+        buf = bytearray()
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                buf += chunk
+                try:
+                    records, consumed = self.decode(buf)
+                except (ValueError, struct.error, UnicodeDecodeError):
+                    self.malformed += 1
+                    break
+                del buf[:consumed]
+                self._deliver(records, "tcp")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._tcp_clients.discard(writer)
+            writer.close()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self.udp_port is not None:
+            listener = self
+
+            class _Protocol(asyncio.DatagramProtocol):
+                def datagram_received(self, data, addr):
+                    listener.datagram_received(data)
+
+            self._udp, _ = await loop.create_datagram_endpoint(
+                _Protocol, local_addr=(self.host, self.udp_port), reuse_port=self.reuse_port or None
+            )
+        if self.tcp_port is not None:
+            self._tcp = await asyncio.start_server(
+                self._handle_stream, self.host, self.tcp_port, reuse_port=self.reuse_port or None
+            )
+
+    async def stop(self):
+        if self._udp:
+            self._udp.close()
+        if self._tcp:
+            self._tcp.close()
+            for writer in list(self._tcp_clients):
+                writer.close()
+            await self._tcp.wait_closed()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "udp_port": self.udp_port,
+            "tcp_port": self.tcp_port,
+            "tcp_clients": len(self._tcp_clients),
+            "records": self.records,
+            "malformed": self.malformed,
+        }
@@ -0,0 +1,152 @@
+"""
+Estado ao vivo das bikes em registros de layout fixo.
+
+Cada bike é um `BikeRecord` com `__slots__` (sem dict por instância),
+atualizado no lugar a cada leitura: nenhum dict novo e nenhuma string de
+data por leitura. O instante da última leitura fica como float (`last_seen`,
+relógio do servidor) e só vira ISO 8601 (`last_update`) ao serializar.
+
+O JSON de cada bike no formato do protocolo v1 é montado sob demanda e
+guardado no registro até a próxima leitura; o frame "initial", o snapshot
+de resync e `GET /api/bikes` concatenam esses trechos em vez de montar e
+serializar um dict por bike a cada pedido.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Campos que a bike informa além de potência/cadência (só no JSON quando presentes)
+EXTRA_FIELDS = ("heart_rate", "resistance_level", "total_energy")
+
+# Tipos cujo repr() já é o JSON (NaN/infinito à parte, como no json.dumps)
+_NUMBERS = (int, float)
+
+
+def _value(value: Any) -> str:
+    return repr(value) if type(value) in _NUMBERS else json.dumps(value)
+
+
+class BikeRecord:
+    __slots__ = (
+        "device", "key", "timestamp", "last_seen", "instant_speed", "instant_power",
+        "instant_cadence", "distance", "heart_rate", "resistance_level", "total_energy", "json",
+    )
+
+    def __init__(self, device: str, last_seen: float):
+        self.device = device
+        # Nome já escapado para JSON
+        self.key = json.dumps(device)
+        self.timestamp = 0.0
+        self.last_seen = last_seen
+        self.instant_speed = 0.0
+        self.instant_power = 0
+        self.instant_cadence = 0
+        # Acumulador em metros; o JSON leva a parte inteira
+        self.distance = 0.0
+        self.heart_rate = None
+        self.resistance_level = None
+        self.total_energy = None
+        # Trecho '"device": {...}' já serializado (None → desatualizado)
+        self.json: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Formato do protocolo v1 (`last_update` em ISO 8601)."""
+        data = {
+            "device": self.device,
+            "last_update": datetime.fromtimestamp(self.last_seen).isoformat(),
+            "timestamp": self.timestamp,
+            "instant_speed": self.instant_speed,
+            "instant_power": self.instant_power,
+            "instant_cadence": self.instant_cadence,
+            "total_distance": int(self.distance),
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    def fragment(self) -> str:
+        """'"device": {...}' — mesmo texto de json.dumps(to_dict()), sem montar o dict."""
+        if self.json is not None:
+            return self.json
+        key = self.key
+        power, cadence = self.instant_power, self.instant_cadence
+        if type(power) not in _NUMBERS or type(cadence) not in _NUMBERS:
+            # Leitura com valor fora do comum (ex.: null): serializa o dict
+            self.json = f"{key}: {json.dumps(self.to_dict())}"
+            return self.json
+        # timestamp vem validado como float e a velocidade é calculada aqui
+        text = (
+            f'{key}: {{"device": {key}, '
+            f'"last_update": "{datetime.fromtimestamp(self.last_seen).isoformat()}", '
+            f'"timestamp": {self.timestamp!r}, "instant_speed": {self.instant_speed!r}, '
+            f'"instant_power": {power!r}, "instant_cadence": {cadence!r}, '
+            f'"total_distance": {int(self.distance)}'
+        )
+        if self.heart_rate is not None or self.resistance_level is not None or self.total_energy is not None:
+            for field in EXTRA_FIELDS:
+                value = getattr(self, field)
+                if value is not None:
+                    text += f', "{field}": {_value(value)}'
+        self.json = text = text + "}"
+        return text
+
+    def state(self) -> List[Any]:
+        """Valores crus (sincronização entre workers e cópia em disco, ver cluster.py e warm_start.py)."""
+        return [getattr(self, name) for name in STATE_FIELDS]
+
+
+# Campos de `state()`: sem os derivados (nome escapado, JSON guardado)
+STATE_FIELDS = tuple(name for name in BikeRecord.__slots__ if name not in ("key", "json"))
+
+
+class BikeStore:
+    """Registros por device, com serialização em JSON a partir dos trechos guardados."""
+
+    def __init__(self):
+        self.records: Dict[str, BikeRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, device: str) -> bool:
+        return device in self.records
+
+    def __iter__(self) -> Iterator[BikeRecord]:
+        return iter(self.records.values())
+
+    def get(self, device: str) -> Optional[BikeRecord]:
+        return self.records.get(device)
+
+    def add(self, device: str, last_seen: float) -> BikeRecord:
+        record = self.records[device] = BikeRecord(device, last_seen)
+        return record
+
+    def pop(self, device: str) -> Optional[BikeRecord]:
+        return self.records.pop(device, None)
+
+    def clear(self):
+        self.records.clear()
+
+    def json(self, devices: Optional[Iterable[str]] = None) -> str:
+        """Objeto JSON {device: bike} de todas as bikes, ou só de `devices` (que devem existir)."""
+        if devices is None:
+            return "{" + ", ".join([r.fragment() for r in self.records.values()]) + "}"
+        records = self.records
+        return "{" + ", ".join([records[d].fragment() for d in devices]) + "}"
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {device: record.to_dict() for device, record in self.records.items()}
+
+    def state(self) -> List[List[Any]]:
+        return [record.state() for record in self.records.values()]
+
+    def load(self, state: List[List[Any]]):
+        """Substitui os registros pelos de `state()` de outro worker."""
+        self.records.clear()
+        for values in state:
+            record = self.add(values[0], 0.0)
+            for name, value in zip(STATE_FIELDS, values):
+                setattr(record, name, value)
@@ -0,0 +1,109 @@
+"""
+Estado de vida das bikes (active → idle → offline → removida), calculado no servidor.
+
+Cada device tem um único prazo em um heap: o instante em que muda de estado
+se não chegar nenhuma leitura. As leituras só atualizam `last_seen` (O(1));
+quando o prazo vence, ele é recalculado a partir de `last_seen` e, se ainda
+não passou, volta para o heap. Assim o heap tem no máximo uma entrada válida
+por device e a verificação periódica só olha os prazos vencidos.
+
+A remoção tem duas etapas: `expire` aponta os candidatos e `evict` remove
+só se não chegou leitura depois — com vários workers a remoção passa pelo
+barramento (ver cluster.py) e vale a mesma decisão em todas as réplicas.
+"""
+
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+ACTIVE = "active"
+IDLE = "idle"
+OFFLINE = "offline"
+
+
+class LivenessTracker:
+    """Os limites contam a partir da última leitura (idle_after < offline_after < evict_after)."""
+
+    def __init__(self, idle_after: float = 10.0, offline_after: float = 60.0, evict_after: float = 3600.0):
+        # Prazo, a partir de last_seen, para sair de cada estado
+        self.limits = {ACTIVE: idle_after, IDLE: offline_after, OFFLINE: evict_after}
+        self.states: Dict[str, str] = {}
+        self.last_seen: Dict[str, float] = {}
+        # Entradas (prazo, geração, device); entradas de gerações antigas são ignoradas
+        self._heap: List[Tuple[float, int, str]] = []
+        self._generation: Dict[str, int] = {}
+        self._counter = itertools.count(1)
+        # Mudanças ainda não enviadas aos clientes
+        self.pending: Dict[str, str] = {}
+
+    def _schedule(self, device: str):
+        gen = self._generation[device] = next(self._counter)
+        deadline = self.last_seen[device] + self.limits[self.states[device]]
+        heapq.heappush(self._heap, (deadline, gen, device))
+
+    def touch(self, device: str, now: float):
+        """Registra uma leitura do device."""
+        previous = self.states.get(device)
+        self.last_seen[device] = now
+        if previous == ACTIVE:
+            return
+        self.states[device] = ACTIVE
+        self.pending[device] = ACTIVE
+        # O prazo anterior (de idle/offline) é mais longo: agenda um novo
+        self._schedule(device)
+
+    def expire(self, now: float) -> List[Tuple[str, float]]:
+        """
+        Aplica os prazos vencidos até `now`; retorna (device, last_seen) dos
+        offline há EVICT_AFTER segundos, a remover com `evict`.
+        """
+        candidates = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, gen, device = heapq.heappop(heap)
+            if self._generation.get(device) != gen:
+                continue
+            state = self.states[device]
+            deadline = self.last_seen[device] + self.limits[state]
+            if deadline > now:
+                # Chegaram leituras depois do agendamento
+                heapq.heappush(heap, (deadline, gen, device))
+                continue
+            if state == ACTIVE:
+                self.states[device] = IDLE
+            elif state == IDLE:
+                self.states[device] = OFFLINE
+            else:
+                # Sem nova entrada no heap: a próxima leitura reagenda (touch)
+                self._generation.pop(device, None)
+                candidates.append((device, self.last_seen[device]))
+                continue
+            self.pending[device] = self.states[device]
+            self._schedule(device)
+        return candidates
+
+    def evict(self, device: str, last_seen: Optional[float] = None) -> bool:
+        """Remove o device se não houve leitura desde `last_seen` (None: remove sempre)."""
+        if device not in self.states:
+            return False
+        if last_seen is not None and self.last_seen[device] != last_seen:
+            return False
+        self.forget(device)
+        self.pending[device] = "evicted"
+        return True
+
+    def forget(self, device: str):
+        self.states.pop(device, None)
+        self.last_seen.pop(device, None)
+        self._generation.pop(device, None)
+
+    def clear(self):
+        self.states.clear()
+        self.last_seen.clear()
+        self._generation.clear()
+        self._heap.clear()
+        self.pending.clear()
+
+    def take_pending(self) -> Dict[str, str]:
+        pending, self.pending = self.pending, {}
+        return pending
@@ -0,0 +1,441 @@
+"""
+Gerador de carga para o backend: muitas bikes simuladas + assinantes WebSocket.
+
+Diferente do `simulator.py` (um POST por vez, 20 bikes), aqui tudo roda em
+asyncio: cada bike é uma task que envia leituras na frequência pedida por um
+pool de conexões HTTP keep-alive, enquanto M clientes WebSocket medem a
+latência ponta a ponta (leitura enviada → bike no frame do broadcast).
+
+    python loadgen.py --bikes 200,500,1000 --hz 4 --subscribers 20 --duration 20
+    python loadgen.py --bikes 1000 --batch 50 --out report.json
+
+Com vários valores em `--bikes` cada etapa roda por `--duration` segundos,
+em sequência, para achar o ponto de saturação. O relatório (`--out` / `--json`)
+é um JSON estável para comparar entre versões.
+
+Só contam como aceitas as leituras que o backend aceitou: acima de
+`INGEST_DEVICE_RATE` leituras/s por bike (padrão 20) o excedente volta em
+`rate_limited` (ou 429) e a etapa sai como saturada. Para medir `--hz` acima
+disso, rode o backend com `INGEST_DEVICE_RATE=0`.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import websockets
+
+from protocol import FIELD_FORMATS, FIELDS, FRAME_DELTA
+
+REPORT_VERSION = 1
+
+TS_FIELD = FIELDS.index("timestamp")
+_HEADER = struct.Struct("<BH")
+_ENTRY = struct.Struct("<HB")
+_FIELD_STRUCTS = [struct.Struct("<" + f) for f in FIELD_FORMATS]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, math.ceil(q * len(values)) - 1)], 3)
+
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 3)}
+
+
+# ──────────────────────────────────────────
+# Bikes simuladas
+# ──────────────────────────────────────────
+class RiderProfile:
+    """
+    Perfil de aula indoor: potência-base por aluno (FTP), blocos de tiro e
+    recuperação em ondas, cadência acompanhando a potência, ruído por leitura.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.ftp = rng.uniform(120, 280)
+        self.period = rng.uniform(60, 240)
+        self.phase = rng.uniform(0, self.period)
+        self.base_cadence = rng.uniform(70, 95)
+
+    def sample(self, t: float) -> Dict[str, float]:
+        x = ((t + self.phase) % self.period) / self.period
+        # 30% do ciclo em tiro (~110% FTP), resto em recuperação (~65% FTP)
+        effort = 1.1 if x < 0.3 else 0.65
+        power = max(0.0, self.ftp * effort * self.rng.gauss(1.0, 0.06))
+        cadence = self.base_cadence * (0.85 + 0.25 * effort) + self.rng.gauss(0, 2.5)
+        return {"instant_power": round(power), "instant_cadence": round(max(cadence, 0.0), 1)}
+
+
+class IngestStats:
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.rate_limited = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.late = 0
+        self.latency_ms: List[float] = []
+        self.status_codes: Dict[str, int] = {}
+
+
+async def post(client: httpx.AsyncClient, path: str, payload: Dict[str, Any], stats: IngestStats, count: int):
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+    except httpx.HTTPError as e:
+        stats.errors += count
+        key = type(e).__name__
+        stats.status_codes[key] = stats.status_codes.get(key, 0) + 1
+        return
+    stats.latency_ms.append((time.perf_counter() - start) * 1000)
+    key = str(response.status_code)
+    stats.status_codes[key] = stats.status_codes.get(key, 0) + 1
+    if response.status_code == 200:
+        # Aceitação parcial (ver admission.py no backend): vale o que ele diz ter aceitado
+        body = response.json()
+        if body.get("status") == "duplicate":
+            stats.duplicates += count
+            return
+        accepted = body.get("accepted", count)
+        stats.ok += accepted
+        stats.rate_limited += body.get("rate_limited", 0)
+        stats.duplicates += body.get("duplicates", 0)
+    elif response.status_code == 429:
+        stats.rate_limited += count
+    else:
+        stats.errors += count
+
+
+async def run_bike(client, device: str, profile: RiderProfile, hz: float, offset: float, until: float, stats: IngestStats):
+    """Uma bike: leituras individuais em /api/ftms com prazos absolutos (sem deriva)."""
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / hz
+    next_send = loop.time() + offset
+    while True:
+        delay = next_send - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -interval:
+            # Não conseguiu manter a frequência: conta e pula os envios perdidos
+            stats.late += 1
+            next_send = loop.time()
+        if time.time() >= until:
+            return
+        now = time.time()
+        payload = {"ts": now, "src": "loadgen", "device": device, "reading": profile.sample(now)}
+        stats.sent += 1
+        await post(client, "/api/ftms", payload, stats, 1)
+        next_send += interval
+
+
+async def run_gateway(client, devices: List[str], profiles, hz: float, offset: float, until: float, stats: IngestStats):
+    """Um gateway: uma leitura de cada uma das suas bikes por POST em /api/ftms/batch."""
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / hz
+    next_send = loop.time() + offset
+    while True:
+        delay = next_send - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -interval:
+            stats.late += 1
+            next_send = loop.time()
+        if time.time() >= until:
+            return
+        now = time.time()
+        readings = [
+            {"ts": now, "src": "loadgen", "device": d, "reading": p.sample(now)}
+            for d, p in zip(devices, profiles)
+        ]
+        stats.sent += len(readings)
+        await post(client, "/api/ftms/batch", {"readings": readings}, stats, len(readings))
+        next_send += interval
+
+
+# ──────────────────────────────────────────
+# Assinantes WebSocket
+# ──────────────────────────────────────────
+class Subscriber:
+    """
+    Cliente do /ws (v2, JSON ou binário). Para cada entrada de delta com o
+    campo `timestamp` (o `ts` enviado pelo gerador) registra `agora - ts`.
+    """
+
+    def __init__(self, url: str, prefix: str, measure_from: float):
+        self.url = url
+        self.prefix = prefix
+        self.measure_from = measure_from
+        self.names: Dict[int, str] = {}
+        self.frames = 0
+        self.bytes = 0
+        self.updates = 0
+        self.snapshots = 0
+        self.latency_ms: List[float] = []
+        self.closed_by_server: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def _observe(self, device_id: int, ts: float, now: float):
+        name = self.names.get(device_id)
+        if name is None or not name.startswith(self.prefix):
+            return
+        self.updates += 1
+        if now >= self.measure_from:
+            self.latency_ms.append((now - ts) * 1000)
+
+    def _json_entries(self, entries, now: float):
+        for entry in entries:
+            if entry[1] & (1 << TS_FIELD):
+                # TS_FIELD é o bit 0: é sempre o primeiro valor presente
+                self._observe(entry[0], entry[2], now)
+
+    def _binary(self, data: bytes, now: float):
+        kind, count = _HEADER.unpack_from(data, 0)
+        if kind != FRAME_DELTA:
+            return
+        off = _HEADER.size
+        for _ in range(count):
+            device_id, mask = _ENTRY.unpack_from(data, off)
+            off += _ENTRY.size
+            ts = None
+            for i, s in enumerate(_FIELD_STRUCTS):
+                if mask & (1 << i):
+                    if i == TS_FIELD:
+                        ts = s.unpack_from(data, off)[0]
+                    off += s.size
+            if ts is not None:
+                self._observe(device_id, ts, now)
+
+    def _message(self, raw, now: float):
+        self.frames += 1
+        self.bytes += len(raw)
+        if isinstance(raw, bytes):
+            self._binary(raw, now)
+            return
+        msg = json.loads(raw)
+        kind = msg.get("type")
+        if kind in ("initial", "snapshot"):
+            if kind == "snapshot":
+                self.snapshots += 1
+            self.names = {i: name for name, i in msg.get("devices", {}).items()}
+        elif kind == "devices":
+            for name, i in msg["devices"].items():
+                self.names[i] = name
+        elif kind == "delta":
+            self._json_entries(msg["d"], now)
+        elif kind == "status":
+            for name, state in msg["devices"].items():
+                if state == "evicted":
+                    self.names = {i: n for i, n in self.names.items() if n != name}
+
+    async def run(self, until: float):
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                while True:
+                    remaining = until - time.time()
+                    if remaining <= 0:
+                        return
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        return
+                    self._message(raw, time.time())
+        except websockets.ConnectionClosed as e:
+            self.closed_by_server = e.code
+        except (OSError, websockets.WebSocketException) as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+
+# ──────────────────────────────────────────
+# Etapas
+# ──────────────────────────────────────────
+async def server_connections(client: httpx.AsyncClient) -> Dict[str, Any]:
+    try:
+        response = await client.get("/api/connections")
+        data = response.json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+    clients = data.get("connections", [])
+    return {
+        "clients": len(clients),
+        "dropped": sum(c.get("dropped", 0) for c in clients),
+        "resyncs": sum(c.get("resyncs", 0) for c in clients),
+        "evicted": data.get("evicted", 0),
+    }
+
+
+async def run_step(args, bikes: int) -> Dict[str, Any]:
+    rng = random.Random(args.seed + bikes)
+    prefix = f"{args.prefix}{bikes}-"
+    devices = [f"{prefix}{i:04d}" for i in range(1, bikes + 1)]
+    profiles = [RiderProfile(rng) for _ in devices]
+    interval = 1.0 / args.hz
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        before = await server_connections(client)
+
+        start = time.time()
+        measure_from = start + args.warmup
+        until = start + args.warmup + args.duration
+        ws_url = args.url.replace("http", "ws", 1) + "/ws?v=2" + ("&enc=binary" if args.binary else "")
+        subscribers = [Subscriber(ws_url, prefix, measure_from) for _ in range(args.subscribers)]
+        sub_tasks = [asyncio.create_task(s.run(until + 1.0)) for s in subscribers]
+        await asyncio.sleep(0.2)
+
+        ingest = IngestStats()
+        if args.batch:
+            groups = [devices[i:i + args.batch] for i in range(0, bikes, args.batch)]
+            prof_groups = [profiles[i:i + args.batch] for i in range(0, bikes, args.batch)]
+            senders = [
+                run_gateway(client, g, p, args.hz, interval * n / len(groups), until, ingest)
+                for n, (g, p) in enumerate(zip(groups, prof_groups))
+            ]
+        else:
+            # Envios espalhados uniformemente dentro de cada intervalo
+            senders = [
+                run_bike(client, d, p, args.hz, interval * n / bikes, until, ingest)
+                for n, (d, p) in enumerate(zip(devices, profiles))
+            ]
+        ingest_started = time.perf_counter()
+        await asyncio.gather(*senders)
+        ingest_elapsed = time.perf_counter() - ingest_started
+
+        # Antes de fechar os assinantes: o servidor ainda conhece as conexões
+        after = await server_connections(client)
+        await asyncio.gather(*sub_tasks)
+
+    offered = bikes * args.hz
+    latencies = [v for s in subscribers for v in s.latency_ms]
+    frames = sum(s.frames for s in subscribers)
+    return {
+        "bikes": bikes,
+        "ingest": {
+            "offered_per_s": round(offered, 1),
+            "sent": ingest.sent,
+            "ok": ingest.ok,
+            "rate_limited": ingest.rate_limited,
+            "duplicates": ingest.duplicates,
+            "errors": ingest.errors,
+            "late_sends": ingest.late,
+            "accepted_per_s": round(ingest.ok / ingest_elapsed, 1) if ingest_elapsed else 0.0,
+            "status_codes": ingest.status_codes,
+            "http_latency_ms": percentiles(ingest.latency_ms),
+        },
+        "broadcast": {
+            "subscribers": len(subscribers),
+            "frames": frames,
+            "frames_per_s": round(frames / len(subscribers) / (until + 1.0 - start), 1) if subscribers else 0.0,
+            "bytes": sum(s.bytes for s in subscribers),
+            "bike_updates": sum(s.updates for s in subscribers),
+            "snapshots": sum(s.snapshots for s in subscribers),
+            "closed_by_server": sum(1 for s in subscribers if s.closed_by_server is not None),
+            "errors": sorted({s.error for s in subscribers if s.error}),
+            "latency_ms": percentiles(latencies),
+        },
+        "server": {
+            "dropped_frames": after.get("dropped", 0) - before.get("dropped", 0),
+            "resyncs": after.get("resyncs", 0) - before.get("resyncs", 0),
+            "evicted_clients": after.get("evicted", 0) - before.get("evicted", 0),
+        },
+    }
+
+
+def saturated(step: Dict[str, Any], max_p99_ms: float) -> bool:
+    ingest, broadcast = step["ingest"], step["broadcast"]
+    if ingest["errors"] or ingest["rate_limited"] or ingest["late_sends"] or broadcast["closed_by_server"]:
+        return True
+    if ingest["accepted_per_s"] < 0.95 * ingest["offered_per_s"]:
+        return True
+    p99 = broadcast["latency_ms"]["p99"]
+    return p99 is not None and p99 > max_p99_ms
+
+
+async def run(args) -> Dict[str, Any]:
+    steps = []
+    for bikes in args.bikes:
+        step = await run_step(args, bikes)
+        step["saturated"] = saturated(step, args.max_p99)
+        steps.append(step)
+        if not args.json:
+            print_step(step)
+    capacity = [s["bikes"] for s in steps if not s["saturated"]]
+    return {
+        "report_version": REPORT_VERSION,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": {
+            "url": args.url,
+            "hz": args.hz,
+            "batch": args.batch,
+            "connections": args.connections,
+            "subscribers": args.subscribers,
+            "encoding": "binary" if args.binary else "json",
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "max_p99_ms": args.max_p99,
+        },
+        "steps": steps,
+        "max_unsaturated_bikes": max(capacity) if capacity else None,
+    }
+
+
+def print_step(step: Dict[str, Any]):
+    ingest, broadcast, server = step["ingest"], step["broadcast"], step["server"]
+    lat = broadcast["latency_ms"]
+    http = ingest["http_latency_ms"]
+    print(
+        f"bikes={step['bikes']:<6} leituras/s {ingest['accepted_per_s']:>8}/{ingest['offered_per_s']:<8} "
+        f"erros={ingest['errors']:<4} limitadas={ingest['rate_limited']:<4} atrasos={ingest['late_sends']:<4} "
+        f"http p50/p99={http['p50']}/{http['p99']} ms  "
+        f"ws p50/p99={lat['p50']}/{lat['p99']} ms  frames/s={broadcast['frames_per_s']} "
+        f"descartes={server['dropped_frames']} resyncs={server['resyncs']} "
+        f"{'SATURADO' if step['saturated'] else 'ok'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--bikes", default="100", help="quantidade de bikes; lista separada por vírgula para etapas")
+    parser.add_argument("--hz", type=float, default=4.0, help="leituras por segundo por bike")
+    parser.add_argument("--batch", type=int, default=0, help="bikes por POST em /api/ftms/batch (0 = POST por leitura)")
+    parser.add_argument("--connections", type=int, default=64, help="tamanho do pool HTTP keep-alive")
+    parser.add_argument("--subscribers", type=int, default=10, help="clientes WebSocket")
+    parser.add_argument("--binary", action="store_true", help="assinantes com deltas binários (enc=binary)")
+    parser.add_argument("--duration", type=float, default=15.0, help="segundos medidos por etapa")
+    parser.add_argument("--warmup", type=float, default=3.0, help="segundos iniciais fora das medições de latência")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--max-p99", type=float, default=1000.0, help="p99 (ms) acima do qual a etapa é saturada")
+    parser.add_argument("--prefix", default="LOAD-")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório JSON")
+    args = parser.parse_args()
+    args.bikes = [int(b) for b in args.bikes.split(",")]
+
+    report = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif report["max_unsaturated_bikes"] is not None:
+        print(f"Maior etapa sem saturação: {report['max_unsaturated_bikes']} bikes a {args.hz} Hz")
+
+
+if __name__ == "__main__":
+    main()
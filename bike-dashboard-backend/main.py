@@ -1,15 +1,72 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from itertools import starmap
+from typing import Dict, Any, Collection, Iterable, List, Optional, Set, Tuple
 import asyncio
+import base64
+import binascii
 import json
 import sqlite3
+import struct
 import os
-from datetime import datetime
 import time
 
+import numpy as np
+
+import admission
+import bike_metrics
+import bulk_io
+import cluster
+import metrics
+from ftms import FLAG_FIELDS, IndoorBikeParser
+from connections import ClientConnection, ConnectionManager
+from database import Database, connect
+from ingest_listener import IngestListener, Record
+from live_state import BikeRecord, BikeStore
+from liveness import ACTIVE, LivenessTracker
+from sessions import ClassSession, init_schema as init_sessions_schema
+from students import (
+    COLUMNS as STUDENT_COLUMNS,
+    MAX_LIMIT as STUDENTS_MAX_LIMIT,
+    QueryError,
+    decode_cursor,
+    init_schema as init_students_schema,
+    parse_fields,
+    query as query_students,
+)
+from subscriptions import (
+    ASSIGNMENTS,
+    LEADERBOARD,
+    STATUS,
+    TELEMETRY,
+    SubscriptionError,
+    parse_channels,
+    parse_devices,
+    parse_page,
+)
+from telemetry import TelemetryRecorder, init_schema as init_telemetry_schema
+from warm_start import WarmStart
+from protocol import (
+    PROTOCOL_V1,
+    PROTOCOL_V2_BINARY,
+    PROTOCOL_V2_JSON,
+    DeltaEncoder,
+    delta_binary_frame,
+    encode_delta_binary,
+    encode_delta_json,
+    encode_snapshot,
+    negotiate,
+    pack_entry,
+)
+
 app = FastAPI(title="Bike Dashboard API")
+# Mede cada rota HTTP e marca o endpoint nas consultas ao banco (ver metrics.py)
+app.router.route_class = metrics.InstrumentedRoute
 
 # CORS para permitir requisições do frontend
 app.add_middleware(
@@ -20,16 +77,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    try:
+        return await request_validation_exception_handler(request, exc)
+    except ValueError:
+        # NaN/Infinity do corpo recusado não cabem na resposta JSON: o 422 vai sem "input"
+        errors = [{k: v for k, v in error.items() if k != "input"} for error in exc.errors()]
+        return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
 # ──────────────────────────────────────────────
 # SQLite – Banco de dados para alunos e vínculos
 # ──────────────────────────────────────────────
-DB_PATH = os.path.join(os.path.dirname(__file__), "abitah_bikes.db")
+DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(__file__), "abitah_bikes.db"))
 
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Conexão síncrona (WAL + pragmas); usada só na inicialização."""
+    return connect(DB_PATH)
 
 
 def init_db():
@@ -52,6 +118,9 @@ def init_db():
             FOREIGN KEY (student_cpf) REFERENCES students(cpf)
         )
     """)
+    init_students_schema(conn)
+    init_telemetry_schema(conn)
+    init_sessions_schema(conn)
     conn.commit()
     conn.close()
 
@@ -59,16 +128,193 @@ def init_db():
 # Inicializa banco na startup
 init_db()
 
+# Acesso assíncrono usado pelos endpoints (threads dedicadas, fora do event loop)
+db = Database(DB_PATH, readers=int(os.getenv("DB_READERS", "4")))
+
+# Colunas das exportações (ver bulk_io.py)
+ASSIGNMENT_EXPORT_COLUMNS = ("device", "student_cpf", "student_name", "weight", "height", "assigned_at")
+SESSION_EXPORT_COLUMNS = (
+    "session_id", "session_name", "started_at", "stopped_at", "device", "student_cpf", "student_name",
+    "elapsed", "distance", "energy_kj", "avg_power", "max_power", "avg_cadence", "zone_times",
+)
+
+
+def export_response(pages, fmt: str, columns, filename: str, json_columns=()) -> StreamingResponse:
+    if fmt not in bulk_io.FORMATS:
+        raise HTTPException(status_code=400, detail=f"formato inválido: {fmt} (válidos: {list(bulk_io.FORMATS)})")
+    return StreamingResponse(
+        bulk_io.encode_rows(pages, fmt, columns, json_columns),
+        media_type=bulk_io.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+ASSIGNMENTS_SQL = """
+    SELECT ba.device, ba.student_cpf, s.name as student_name, s.weight, s.height
+    FROM bike_assignments ba
+    JOIN students s ON ba.student_cpf = s.cpf
+"""
+
+
+async def fetch_assignments() -> Dict[str, Dict[str, Any]]:
+    rows = await db.fetchall(ASSIGNMENTS_SQL)
+    return {r["device"]: r for r in rows}
+
+
+# ──────────────────────────────────────────
+# Cache de vínculos (fonte única em memória)
+# ──────────────────────────────────────────
+class AssignmentCache:
+    """
+    Mapa device → vínculo carregado na startup e mantido write-through pelos
+    endpoints (o banco é atualizado primeiro, depois a memória).
+    Cada alteração gera uma nova versão (`etag`), usada para que clientes que
+    já têm a versão atual não recebam o payload de novo.
+    """
+
+    def __init__(self):
+        self.assignments: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        # Prefixo por processo: versões de execuções anteriores (ou de outros
+        # workers) nunca coincidem
+        self._epoch = f"{int(time.time()):x}{os.getpid():x}"
+        self._frame: Optional[str] = None
+        # Serializa "escreve no banco + atualiza memória" entre requisições
+        self.lock = asyncio.Lock()
+
+    @property
+    def etag(self) -> str:
+        return f"{self._epoch}-{self.version}"
+
+    def _changed(self):
+        self.version += 1
+        self._frame = None
+
+    def load(self, assignments: Dict[str, Dict[str, Any]]):
+        self.assignments = assignments
+        self._changed()
+
+    def set(self, device: str, student: Dict[str, Any]):
+        self.assignments[device] = {
+            "device": device,
+            "student_cpf": student["cpf"],
+            "student_name": student["name"],
+            "weight": student["weight"],
+            "height": student["height"],
+        }
+        self._changed()
+
+    def remove(self, device: str):
+        if self.assignments.pop(device, None) is not None:
+            self._changed()
+
+    def remove_student(self, cpf: str):
+        devices = [d for d, a in self.assignments.items() if a["student_cpf"] == cpf]
+        for device in devices:
+            del self.assignments[device]
+        if devices:
+            self._changed()
+
+    def update_student(self, cpf: str, updates: Dict[str, Any]) -> bool:
+        """Propaga nome/peso/altura aos vínculos do aluno; retorna se algo mudou."""
+        fields = {("student_name" if k == "name" else k): v for k, v in updates.items()}
+        changed = False
+        for device, a in self.assignments.items():
+            if a["student_cpf"] == cpf:
+                self.assignments[device] = {**a, **fields}
+                changed = True
+        if changed:
+            self._changed()
+        return changed
+
+    def clear(self):
+        if self.assignments:
+            self.assignments = {}
+            self._changed()
+
+    def frame(self) -> str:
+        """Frame "assignments" serializado uma vez por versão."""
+        if self._frame is None:
+            self._frame = json.dumps({
+                "type": "assignments",
+                "assignments": self.assignments,
+                "version": self.etag,
+            })
+        return self._frame
+
+
+assignment_cache = AssignmentCache()
+
+# Gravação de todas as leituras (blocos colunares gravados em segundo plano)
+telemetry = TelemetryRecorder(
+    db,
+    flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1")),
+    max_pending=int(os.getenv("TELEMETRY_MAX_PENDING", "200000")),
+)
+
 
 # ──────────────────────────────────────────
 # Modelos Pydantic
 # ──────────────────────────────────────────
+def _field_range(code: str, divisor: Optional[float]) -> Tuple[float, float]:
+    """Faixa de valores que o campo FTMS representa (formato struct / divisor)."""
+    if code == "3s":
+        low, high = 0, (1 << 24) - 1
+    else:
+        bits = struct.calcsize(code) * 8
+        low, high = (-(1 << bits - 1), (1 << bits - 1) - 1) if code.islower() else (0, (1 << bits) - 1)
+    return low / (divisor or 1), high / (divisor or 1)
+
+
+# Campos conhecidos de `reading`: número finito dentro da faixa do FTMS, ou 422
+# (um valor absurdo iria para o estado, o banco e os frames do WebSocket)
+READING_RANGES = {name: _field_range(code, divisor) for group in FLAG_FIELDS for name, code, divisor in group}
+# Usados em toda leitura: null não vale como ausente
+REQUIRED_READING_VALUES = ("instant_power", "instant_cadence")
+
+
+def validate_reading(reading: Dict[str, Any]) -> Dict[str, Any]:
+    for name, value in reading.items():
+        bounds = READING_RANGES.get(name)
+        if bounds is None:
+            continue
+        # type() e não isinstance: bool é int em Python, mas não é leitura.
+        # NaN falha nas duas comparações.
+        kind = type(value)
+        if (kind is int or kind is float) and bounds[0] <= value <= bounds[1]:
+            continue
+        if value is None and name not in REQUIRED_READING_VALUES:
+            continue
+        raise ValueError(f"{name}: esperado número entre {bounds[0]:g} e {bounds[1]:g}, recebido {value!r}")
+    return reading
+
+
 class BikeReading(BaseModel):
-    ts: float
+    ts: float = Field(allow_inf_nan=False)
     src: str
     device: str
     reading: Dict[str, Any]
 
+    @field_validator("reading")
+    @classmethod
+    def check_reading(cls, reading: Dict[str, Any]) -> Dict[str, Any]:
+        return validate_reading(reading)
+
+
+class BikeReadingBatch(BaseModel):
+    readings: List[BikeReading]
+
+
+class RawBikeReading(BaseModel):
+    ts: float = Field(allow_inf_nan=False)
+    src: str
+    device: str
+    data: str  # notificação Indoor Bike Data (0x2AD2) em base64
+
+
+class RawBikeReadingBatch(BaseModel):
+    readings: List[RawBikeReading]
+
 
 class StudentCreate(BaseModel):
     cpf: str
@@ -88,23 +334,236 @@ class BikeAssignment(BaseModel):
     student_cpf: str
 
 
+class SessionStart(BaseModel):
+    name: Optional[str] = None
+
+
 # ──────────────────────────────────────────
 # Estado em memória das bikes
 # ──────────────────────────────────────────
-bike_data: Dict[str, Dict[str, Any]] = {}
-bike_state: Dict[str, Dict[str, Any]] = {}
-active_connections: List[WebSocket] = []
+# Um registro de layout fixo por bike, atualizado no lugar (ver live_state.py)
+bike_store = BikeStore()
+
+# Devices alterados desde o último tick do broadcaster
+dirty_devices: Set[str] = set()
+
+# Incrementado a cada mudança do estado ao vivo (lotes, remoções, início/fim
+# de aula); a cópia em disco só é regravada se ele mudou
+state_changes = 0
+
+# Frequência (Hz) dos frames "updates" enviados aos dashboards
+BROADCAST_HZ = float(os.getenv("BROADCAST_HZ", "5"))
+
+# Sessão de aula em andamento (None fora de aula) e intervalo do ranking
+current_session: Optional[ClassSession] = None
+# Serializa início de aula no worker (checa, grava no banco e publica)
+session_lock = asyncio.Lock()
+LEADERBOARD_INTERVAL = float(os.getenv("LEADERBOARD_INTERVAL", "1"))
+
+
+# Base compartilhada dos deltas do protocolo v2
+delta_encoder = DeltaEncoder()
+
+# Estado de vida das bikes, pelo tempo desde a última leitura: IDLE_AFTER s →
+# "idle", OFFLINE_AFTER s → "offline", EVICT_AFTER s → removida da memória
+liveness = LivenessTracker(
+    idle_after=float(os.getenv("IDLE_AFTER", "10")),
+    offline_after=float(os.getenv("OFFLINE_AFTER", "60")),
+    evict_after=float(os.getenv("EVICT_AFTER", "3600")),
+)
+
+# Barramento entre workers (ver cluster.py); sem CLUSTER_PORT, um worker só
+bus = cluster.create_bus()
+
+
+# Métricas dos caminhos quentes (no-ops com METRICS_ENABLED=0)
+INGEST_READINGS = metrics.registry.counter(
+    "bike_ingest_readings_total", "Leituras recebidas por device e endpoint", ("device", "endpoint")
+)
+INGEST_REJECTED = metrics.registry.counter(
+    "bike_ingest_rejected_total",
+    "Leituras (ou requisições, em overload) recusadas pela admissão",
+    ("reason",),
+)
+INGEST_VALIDATION_SECONDS = metrics.registry.histogram(
+    "bike_ingest_validation_seconds", "Leitura do corpo, parse e validação até o handler", ("endpoint",)
+)
+SPEED_SECONDS = metrics.registry.histogram(
+    "bike_speed_compute_seconds", "Cálculo da velocidade de uma leitura", buckets=metrics.MICRO_BUCKETS
+)
+BROADCAST_SECONDS = metrics.registry.histogram(
+    "broadcast_tick_duration_seconds", "Diff, serialização e enfileiramento de um tick do broadcaster"
+)
+BROADCAST_DEVICES = metrics.registry.histogram(
+    "broadcast_tick_devices", "Bikes alteradas por tick", buckets=metrics.SIZE_BUCKETS
+)
+BROADCAST_FANOUT = metrics.registry.histogram(
+    "broadcast_tick_fanout_clients", "Clientes que receberam o tick", buckets=metrics.SIZE_BUCKETS
+)
+
+
+# Admissão da ingestão (ver admission.py): balde de fichas por device, 429
+# rápido sob sobrecarga e descarte de duplicatas por (device, ts, leitura).
+# INGEST_DEVICE_RATE=0, INGEST_MAX_INFLIGHT=0 e INGEST_MAX_LAG=0 desligam cada parte.
+rate_limiter = admission.RateLimiter(
+    rate=float(os.getenv("INGEST_DEVICE_RATE", "20")),
+    burst=float(os.getenv("INGEST_DEVICE_BURST", "100")),
+)
+sample_filter = admission.SampleFilter(
+    window=float(os.getenv("INGEST_REORDER_WINDOW", "2")),
+    memory=float(os.getenv("INGEST_DEDUP_MEMORY", "30")),
+    reset_samples=int(os.getenv("INGEST_RESET_SAMPLES", "3")),
+)
+overload = admission.OverloadGuard(
+    max_inflight=int(os.getenv("INGEST_MAX_INFLIGHT", "256")),
+    max_lag=float(os.getenv("INGEST_MAX_LAG", "0.5")),
+    lag=lambda: metrics.loop_lag,
+)
+INGEST_PATHS = ("/api/ftms", "/api/ftms/batch", "/api/ftms/raw", "/api/ftms/raw/batch")
+app.add_middleware(
+    admission.IngestGate,
+    guard=overload,
+    paths=INGEST_PATHS,
+    on_reject=lambda path: INGEST_REJECTED.inc("overload") if metrics.ENABLED else None,
+)
+
+
+def bike_row(device_name: str) -> tuple:
+    """Valores da bike na ordem de `protocol.FIELDS`."""
+    r = bike_store.records[device_name]
+    return (r.timestamp, r.last_seen, r.instant_speed, r.instant_power, r.instant_cadence, int(r.distance))
+
+
+def v1_bikes_frame(frame_type: str, devices: Optional[Iterable[str]] = None, **extra: Any) -> str:
+    """Frame v1 com o JSON guardado de cada bike: todas, ou só as de `devices` que existem."""
+    if devices is not None:
+        devices = [d for d in devices if d in bike_store]
+    tail = ", " + json.dumps(extra)[1:] if extra else "}"
+    return f'{{"type": "{frame_type}", "bikes": {bike_store.json(devices)}{tail}'
+
+
+def bikes_snapshot(client: ClientConnection) -> str:
+    """Frame com o estado completo das bikes que o cliente assina (resync de clientes lentos)."""
+    extra = {"status": liveness.states} if STATUS in client.channels else {}
+    if client.protocol == PROTOCOL_V1:
+        return v1_bikes_frame("updates", client.devices, **extra)
+    # v2: a partir da base dos deltas, para que os próximos deltas se apliquem sobre ela
+    return encode_snapshot(delta_encoder, "snapshot", subset=client.devices, **extra)
+
+
+def send_device_state(client: ClientConnection, devices: Set[str]):
+    """
+    Estado atual das bikes que o cliente passou a assinar: ele não recebeu os
+    deltas delas até aqui. Os valores dos deltas são absolutos, então um tick
+    já enfileirado pode chegar antes ou depois sem diferença.
+    """
+    if not devices or TELEMETRY not in client.channels:
+        return
+    if client.protocol == PROTOCOL_V1:
+        if not any(d in bike_store for d in devices):
+            return
+        frame = v1_bikes_frame("updates", devices)
+    else:
+        entries = delta_encoder.snapshot_entries(devices)
+        if not entries:
+            return
+        frame = encode_delta_binary(entries) if client.protocol == PROTOCOL_V2_BINARY else encode_delta_json(entries)
+    client.enqueue(frame, mergeable=True)
+
+
+def send_page_changes(changes: Dict[ClientConnection, Set[str]]):
+    """Bikes que entraram na página de cada cliente quando a lista de devices mudou."""
+    for client, devices in changes.items():
+        send_device_state(client, devices)
+
+
+# Fila de saída limitada por cliente; clientes atrasados por mais de
+# WS_MAX_LAG segundos (ou com envio travado) são desconectados.
+active_connections = ConnectionManager(
+    snapshot=bikes_snapshot,
+    max_queue=int(os.getenv("WS_QUEUE_SIZE", "32")),
+    max_lag=float(os.getenv("WS_MAX_LAG", "10")),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "5")),
+)
 
 
 def calculate_speed_from_power_and_cadence(power: float, cadence: float) -> float:
     """
     Calcula a velocidade (km/h) baseada na potência (W) e cadência (RPM).
+    Mesma fórmula da versão vetorizada em `bike_metrics`.
+    """
+    return bike_metrics.speed_kmh(power, cadence)
+
+
+def apply_reading(
+    device_name: str,
+    ts: float,
+    reading: Dict[str, Any],
+    current_time: float,
+    interval: Optional[float] = None,
+) -> BikeRecord:
+    """
+    Aplica uma leitura ao estado da bike (velocidade + integração da distância)
+    e retorna o registro atualizado em `bike_store`. `interval` substitui o
+    intervalo medido pelo relógio do servidor (current_time - last_seen).
     """
-    speed_from_cadence = cadence * 2.1 * 3.5 * 60 / 1000
-    power_factor = 0.9 + (power - 80) / (250 - 80) * 0.25
-    power_factor = max(0.8, min(1.2, power_factor))
-    speed = speed_from_cadence * power_factor
-    return round(speed, 1)
+    record = bike_store.get(device_name)
+    if record is None:
+        record = bike_store.add(device_name, current_time)
+        changes = active_connections.subscriptions.device_added(device_name)
+        if changes:
+            # A bike nova chega no próximo tick; as que se deslocaram para a página, agora
+            for devices in changes.values():
+                devices.discard(device_name)
+            send_page_changes(changes)
+
+    instant_power = reading.get("instant_power", 0)
+    instant_cadence = reading.get("instant_cadence", 0)
+
+    if metrics.ENABLED:
+        start = time.perf_counter()
+        instant_speed = calculate_speed_from_power_and_cadence(instant_power, instant_cadence)
+        SPEED_SECONDS.observe(time.perf_counter() - start)
+    else:
+        instant_speed = calculate_speed_from_power_and_cadence(instant_power, instant_cadence)
+
+    # Uma pausa na transmissão não é integrada como distância (limite MAX_GAP)
+    elapsed = current_time - record.last_seen if interval is None else interval
+    time_delta = bike_metrics.integration_interval(elapsed)
+    distance_increment = bike_metrics.distance_increment(instant_speed, time_delta)
+    if time_delta > 0:
+        record.distance += distance_increment
+
+    record.last_seen = current_time
+    record.timestamp = ts
+    record.instant_speed = instant_speed
+    record.instant_power = instant_power
+    record.instant_cadence = instant_cadence
+    # Campos que a bike informa além de potência/cadência (valem os da última leitura)
+    record.heart_rate = reading.get("heart_rate")
+    record.resistance_level = reading.get("resistance_level")
+    record.total_energy = reading.get("total_energy")
+    record.json = None
+    dirty_devices.add(device_name)
+    liveness.touch(device_name, current_time)
+
+    assignment = assignment_cache.assignments.get(device_name)
+    if current_session is not None:
+        current_session.record(
+            device_name, time_delta, instant_power, instant_cadence, distance_increment, assignment
+        )
+    # Com vários workers todos aplicam todas as leituras; só o líder grava
+    if bus.leader:
+        telemetry.record(
+            device_name,
+            assignment["student_cpf"] if assignment else None,
+            current_time,
+            instant_power,
+            instant_cadence,
+            instant_speed,
+            record.distance,
+        )
+    return record
 
 
 # ──────────────────────────────────────────
@@ -116,98 +575,553 @@ async def receive_bike_data(data: BikeReading):
     Recebe dados das bicicletas (ESP32).
     Apenas cadência e potência são recebidos; velocidade e distância são calculados.
     """
-    device_name = data.device
+    if metrics.ENABLED:
+        INGEST_VALIDATION_SECONDS.observe(metrics.since_request_start(), "single")
+        INGEST_READINGS.inc(data.device, "single")
     current_time = time.time()
+    readings, duplicates = admit_readings([(data.device, data.ts, data.reading)], current_time)
+    if duplicates:
+        # Já aplicada (retentativa): 200, para o ESP32 não reenviar de novo
+        return {"status": "duplicate", "device": data.device}
+    if not readings:
+        return rate_limited([data.device])
+    publish_readings(readings, current_time)
 
-    if device_name not in bike_state:
-        bike_state[device_name] = {
-            "total_distance": 0.0,
-            "last_timestamp": current_time,
-        }
+    return {"status": "ok", "device": data.device}
 
-    reading = data.reading
-    instant_power = reading.get("instant_power", 0)
-    instant_cadence = reading.get("instant_cadence", 0)
 
-    instant_speed = calculate_speed_from_power_and_cadence(instant_power, instant_cadence)
+@app.post("/api/ftms/batch")
+async def receive_bike_data_batch(batch: BikeReadingBatch):
+    """
+    Recebe várias leituras de uma vez (gateways / simulador), aplicadas
+    em ordem de `ts` (ver `apply_readings`).
+    """
+    if metrics.ENABLED:
+        INGEST_VALIDATION_SECONDS.observe(metrics.since_request_start(), "batch")
+        for r in batch.readings:
+            INGEST_READINGS.inc(r.device, "batch")
+    current_time = time.time()
+    readings = [(r.device, r.ts, r.reading) for r in batch.readings]
+    admitted, duplicates = admit_readings(readings, current_time)
+    limited = len(readings) - len(admitted) - duplicates
+    if limited and not admitted:
+        return rate_limited({r[0] for r in readings})
+    publish_readings(admitted, current_time)
+    return {
+        "status": "ok",
+        "accepted": len(admitted),
+        "duplicates": duplicates,
+        "rate_limited": limited,
+        "devices": len({r.device for r in batch.readings}),
+    }
 
-    time_delta = current_time - bike_state[device_name]["last_timestamp"]
-    if time_delta > 0:
-        distance_increment = (instant_speed * time_delta / 3600) * 1000
-        bike_state[device_name]["total_distance"] += distance_increment
-
-    bike_state[device_name]["last_timestamp"] = current_time
-
-    bike_data[device_name] = {
-        "device": device_name,
-        "last_update": datetime.now().isoformat(),
-        "timestamp": data.ts,
-        "instant_speed": instant_speed,
-        "instant_power": instant_power,
-        "instant_cadence": instant_cadence,
-        "total_distance": int(bike_state[device_name]["total_distance"]),
+
+def admit_readings(
+    readings: List[Tuple[str, float, Dict[str, Any]]], current_time: float
+) -> Tuple[List[Tuple[str, float, Dict[str, Any]]], int]:
+    """
+    (leituras que seguem para o barramento, quantas eram duplicatas). Saem
+    primeiro as já aplicadas (retentativas) e as repetidas no próprio lote,
+    sem gastar fichas; depois vale o balde de fichas do device (ver
+    admission.py). A decisão final sobre duplicatas continua em
+    `apply_readings`, a mesma em todos os workers.
+    """
+    fresh = sample_filter.drop_seen(readings)
+    duplicates = len(readings) - len(fresh)
+    admitted = rate_limiter.admit(fresh, current_time)
+    if metrics.ENABLED:
+        if duplicates:
+            INGEST_REJECTED.inc("duplicate", amount=duplicates)
+        if len(admitted) < len(fresh):
+            INGEST_REJECTED.inc("rate_limited", amount=len(fresh) - len(admitted))
+    return admitted, duplicates
+
+
+def rate_limited(devices: Iterable[str]) -> JSONResponse:
+    """429 de uma requisição em que nenhuma leitura teve ficha."""
+    return JSONResponse(
+        {"detail": "limite de leituras por device excedido"},
+        status_code=429,
+        headers={"Retry-After": str(rate_limiter.retry_after(devices))},
+    )
+
+
+def publish_readings(readings: List[Tuple[str, float, Dict[str, Any]]], current_time: float):
+    """
+    Publica um lote no barramento; cada worker o aplica com `apply_readings`
+    e o mesmo `current_time`. Com um worker só, aplica na hora.
+    """
+    bus.publish({"type": "readings", "readings": readings, "time": current_time})
+
+
+def apply_readings(readings: List[Tuple[str, float, Dict[str, Any]]], current_time: float):
+    """
+    Aplica um lote de leituras (device, ts, leitura) em ordem de `ts`,
+    descartando duplicatas (ver admission.SampleFilter). Cada amostra é
+    posicionada no relógio do servidor em relação à mais recente do mesmo
+    device (now - (ts_mais_recente - ts)). Se essa posição cai antes do
+    `last_seen` (backlog descarregado em vários lotes depois de uma queda),
+    a distância é integrada pelo espaçamento dos `ts` do device em vez do
+    relógio do servidor, e o `last_seen` não volta.
+    """
+    global state_changes
+    state_changes += 1
+
+    admitted = []
+    latest_ts: Dict[str, float] = {}
+    for device, ts, reading in sorted(readings, key=lambda r: r[1]):
+        latest = latest_ts.get(device)
+        if latest is None:
+            record = bike_store.get(device)
+            latest = record.timestamp if record is not None else None
+        ts = sample_filter.admit(device, admission.sample_key(ts, reading), latest)
+        if ts is None:
+            continue
+        latest_ts[device] = ts
+        admitted.append((device, ts, reading))
+
+    for device, ts, reading in admitted:
+        sample_time = current_time - (latest_ts[device] - ts)
+        record = bike_store.get(device)
+        interval = None
+        if record is not None and sample_time < record.last_seen:
+            interval = max(0.0, ts - record.timestamp)
+            sample_time = record.last_seen
+        apply_reading(device, ts, reading, sample_time, interval)
+
+
+def ingest_records(records: List[Record], transport: str) -> Tuple[int, int]:
+    """
+    Registros binários do listener UDP/TCP: mesmo pipeline do /api/ftms/batch.
+    Retorna (aceitos, duplicatas).
+    """
+    current_time = time.time()
+    if metrics.ENABLED:
+        for device, _, _ in records:
+            INGEST_READINGS.inc(device, transport)
+    # ts = 0: device sem relógio, vale a hora de chegada
+    readings, duplicates = admit_readings(
+        [(device, ts or current_time, reading) for device, ts, reading in records],
+        current_time,
+    )
+    publish_readings(readings, current_time)
+    return len(readings), duplicates
+
+
+# Ingestão binária opcional (ver ingest_listener.py): ativa com INGEST_UDP_PORT / INGEST_TCP_PORT
+ingest_listener = IngestListener(
+    ingest_records,
+    host=os.getenv("INGEST_HOST", "0.0.0.0"),
+    udp_port=int(os.environ["INGEST_UDP_PORT"]) if os.getenv("INGEST_UDP_PORT") else None,
+    tcp_port=int(os.environ["INGEST_TCP_PORT"]) if os.getenv("INGEST_TCP_PORT") else None,
+    # Vários workers: todos escutam a mesma porta e o kernel distribui
+    reuse_port=isinstance(bus, cluster.BrokerBus),
+)
+
+
+@app.get("/api/ingest/stats")
+async def ingest_stats():
+    return {
+        **ingest_listener.stats(),
+        "admission": {"rate_limited": rate_limiter.limited, **sample_filter.stats(), **overload.stats()},
     }
 
-    if active_connections:
-        message = json.dumps({
-            "type": "update",
-            "device": device_name,
-            "data": bike_data[device_name],
-        })
-        await broadcast(message)
 
-    return {"status": "ok", "device": device_name}
+ftms_parser = IndoorBikeParser()
+
+
+@app.post("/api/ftms/raw/batch")
+async def receive_raw_batch(batch: RawBikeReadingBatch):
+    """
+    Notificações FTMS cruas (base64) encaminhadas pelos gateways, decodificadas
+    aqui com o mesmo parser do firmware (`ftms.py`).
+    """
+    readings = []
+    for i, r in enumerate(batch.readings):
+        try:
+            payload = base64.b64decode(r.data, validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail=f"readings[{i}].data não é base64 válido")
+        if len(payload) < 2:
+            raise HTTPException(status_code=400, detail=f"readings[{i}].data sem as flags FTMS")
+        readings.append((r.device, r.ts, ftms_parser.parse(payload)))
+    if metrics.ENABLED:
+        INGEST_VALIDATION_SECONDS.observe(metrics.since_request_start(), "raw_batch")
+        for r in batch.readings:
+            INGEST_READINGS.inc(r.device, "raw_batch")
+    current_time = time.time()
+    admitted, duplicates = admit_readings(readings, current_time)
+    limited = len(readings) - len(admitted) - duplicates
+    if limited and not admitted:
+        return rate_limited({r[0] for r in readings})
+    publish_readings(admitted, current_time)
+    return {
+        "status": "ok",
+        "accepted": len(admitted),
+        "duplicates": duplicates,
+        "rate_limited": limited,
+        "devices": len({r.device for r in batch.readings}),
+    }
+
+
+@app.post("/api/ftms/raw")
+async def receive_raw_records(request: Request):
+    """
+    Corpo binário (application/octet-stream) com registros no formato de
+    `ingest_listener.py` — versão 2 (FTMS cru) ou 1.
+    """
+    body = await request.body()
+    try:
+        records, consumed = ingest_listener.decode(body)
+        if consumed != len(body):
+            raise ValueError("registro truncado")
+    except (ValueError, struct.error, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"corpo inválido: {e}")
+    accepted, duplicates = ingest_records(records, "raw")
+    limited = len(records) - accepted - duplicates
+    if limited and not accepted:
+        return rate_limited({device for device, _, _ in records})
+    return {"status": "ok", "accepted": accepted, "duplicates": duplicates, "rate_limited": limited}
 
 
 @app.get("/api/bikes")
 async def get_all_bikes():
-    return {"bikes": bike_data}
+    # Montado a partir do JSON guardado em cada registro, sem o jsonable_encoder
+    return Response(
+        f'{{"bikes": {bike_store.json()}, "status": {json.dumps(liveness.states)}}}',
+        media_type="application/json",
+    )
+
+
+# ──────────────────────────────────────────
+# Endpoints – Sessões de aula
+# ──────────────────────────────────────────
+def leaderboard_frame() -> str:
+    return json.dumps({
+        "type": "leaderboard",
+        "session": current_session.info(),
+        "ranking": current_session.leaderboard(),
+    })
+
+
+@app.post("/api/sessions/start")
+async def start_session(body: Optional[SessionStart] = None):
+    """
+    Inicia uma aula: guarda e zera a distância acumulada de cada bike e passa
+    a calcular os agregados da sessão a cada leitura.
+    """
+    async with session_lock:
+        if current_session is not None:
+            raise HTTPException(status_code=409, detail="Já existe uma aula em andamento")
+
+        session = ClassSession(body.name if body else None)
+        session.id = await db.transaction(lambda conn: conn.execute(
+            "INSERT INTO class_sessions (name, started_at) VALUES (?, ?)",
+            (session.name, session.started_at),
+        ).lastrowid)
+        previous = {record.device: int(record.distance) for record in bike_store}
+        bus.publish({"type": "session_start", "id": session.id, "name": session.name, "started_at": session.started_at})
+
+    return {"status": "ok", "session": session.info(), "previous_distances": previous}
+
+
+def begin_session(message: Dict[str, Any], origin: bool):
+    """Aplica o início de aula (mensagem do barramento): zera a distância de cada bike."""
+    global current_session, state_changes
+    if current_session is not None:
+        # Dois workers iniciaram ao mesmo tempo: vale a primeira na ordem do barramento
+        if origin:
+            asyncio.get_running_loop().create_task(
+                db.execute("DELETE FROM class_sessions WHERE id = ?", (message["id"],))
+            )
+        return
+    session = current_session = ClassSession(message["name"], message["started_at"])
+    session.id = message["id"]
+    state_changes += 1
+    for record in bike_store:
+        record.distance = 0.0
+        record.json = None
+        dirty_devices.add(record.device)
+    broadcast(leaderboard_frame(), channel=LEADERBOARD)
+
+
+@app.post("/api/sessions/stop")
+async def stop_session():
+    """Encerra a aula e grava o resumo de cada bike."""
+    session = current_session
+    if session is None:
+        raise HTTPException(status_code=404, detail="Nenhuma aula em andamento")
+    stopped_at = time.time()
+    ranking = session.leaderboard()
+    bus.publish({"type": "session_stop", "id": session.id, "stopped_at": stopped_at})
+    info = {**session.info(), "stopped_at": stopped_at}
+
+    def run(conn):
+        conn.execute(
+            "UPDATE class_sessions SET stopped_at = ? WHERE id = ?",
+            (stopped_at, session.id),
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO session_results
+                (session_id, device, student_cpf, student_name, elapsed, distance,
+                 energy_kj, avg_power, max_power, avg_cadence, zone_times)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (session.id, r["device"], r["student_cpf"], r["student_name"], r["elapsed"],
+                 r["distance"], r["energy_kj"], r["avg_power"], r["max_power"],
+                 r["avg_cadence"], json.dumps(r["zone_times"]))
+                for r in ranking
+            ],
+        )
+
+    await db.transaction(run)
+    return {"status": "ok", "session": info, "ranking": ranking}
+
+
+def end_session(message: Dict[str, Any]):
+    """Aplica o fim de aula: envia o ranking final aos clientes deste worker."""
+    global current_session, state_changes
+    session = current_session
+    if session is None or session.id != message["id"]:
+        return
+    current_session = None
+    state_changes += 1
+    session.stopped_at = message["stopped_at"]
+    broadcast(
+        json.dumps({"type": "leaderboard", "session": session.info(), "ranking": session.leaderboard()}),
+        channel=LEADERBOARD,
+    )
+
+
+@app.get("/api/sessions/current")
+async def get_current_session():
+    if current_session is None:
+        raise HTTPException(status_code=404, detail="Nenhuma aula em andamento")
+    return {"session": current_session.info(), "ranking": current_session.leaderboard()}
+
+
+@app.get("/api/sessions")
+async def list_sessions():
+    rows = await db.fetchall("SELECT * FROM class_sessions ORDER BY started_at DESC")
+    return {"sessions": rows}
+
+
+@app.get("/api/sessions/export")
+async def export_sessions(format: str = "csv", session_id: Optional[int] = None):
+    """Resultados das aulas gravadas (uma linha por bike por aula), em streaming."""
+    where, params = ("r.session_id = ?", (session_id,)) if session_id is not None else ("", ())
+    pages = bulk_io.keyset_pages(
+        db.read,
+        """
+        SELECT r.session_id, c.name AS session_name, c.started_at, c.stopped_at, r.device,
+               r.student_cpf, r.student_name, r.elapsed, r.distance, r.energy_kj,
+               r.avg_power, r.max_power, r.avg_cadence, r.zone_times
+        FROM session_results r JOIN class_sessions c ON c.id = r.session_id
+        """,
+        ("r.session_id", "r.device"),
+        where,
+        params,
+    )
+    return export_response(pages, format, SESSION_EXPORT_COLUMNS, "aulas", json_columns=("zone_times",))
+
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: int):
+    session = await db.fetchone("SELECT * FROM class_sessions WHERE id = ?", (session_id,))
+    if not session:
+        raise HTTPException(status_code=404, detail="Aula não encontrada")
+    ranking = await db.fetchall(
+        "SELECT * FROM session_results WHERE session_id = ? ORDER BY distance DESC", (session_id,)
+    )
+    for position, r in enumerate(ranking, 1):
+        r["zone_times"] = json.loads(r["zone_times"])
+        r["position"] = position
+    return {"session": session, "ranking": ranking}
+
+
+# ──────────────────────────────────────────
+# Endpoints – Telemetria gravada
+# ──────────────────────────────────────────
+@app.get("/api/telemetry")
+async def query_telemetry(
+    device: Optional[str] = None,
+    student_cpf: Optional[str] = None,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    bucket: float = 0.0,
+):
+    """
+    Séries gravadas de um device ou aluno no intervalo [start, end] (epoch, s).
+    `bucket` > 0 reduz para uma amostra a cada `bucket` segundos.
+    """
+    if device is None and student_cpf is None:
+        raise HTTPException(status_code=400, detail="Informe device ou student_cpf")
+    series = await telemetry.query(
+        device=device,
+        student_cpf=student_cpf,
+        start=start,
+        end=end if end is not None else float("inf"),
+        bucket=bucket,
+    )
+    return {"series": series}
+
+
+def build_report(series: Dict[str, Any], student: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resumo de uma série gravada, recalculado com o motor vetorizado."""
+    ts = np.frombuffer(series["ts"], dtype=np.float64)
+    power = np.frombuffer(series["power"], dtype=np.float64)
+    result = bike_metrics.compute(
+        ts,
+        power,
+        np.frombuffer(series["cadence"], dtype=np.float64),
+        weight=student["weight"] if student else None,
+        height=student["height"] if student else None,
+    )
+    duration = float(ts[-1] - ts[0]) if len(ts) else 0.0
+    energy_kj = float(result["energy_kj"][-1]) if len(ts) else 0.0
+    report = {
+        "device": series["device"],
+        "student_cpf": series["student_cpf"],
+        "student_name": student["name"] if student else None,
+        "samples": len(ts),
+        "start": float(ts[0]) if len(ts) else None,
+        "end": float(ts[-1]) if len(ts) else None,
+        "duration": round(duration, 1),
+        "distance": round(float(result["distance"][-1]), 1) if len(ts) else 0.0,
+        "energy_kj": round(energy_kj, 2),
+        "avg_power": round(energy_kj * 1000 / duration, 1) if duration else 0.0,
+        "max_power": float(power.max()) if len(ts) else 0.0,
+        "avg_speed": round(float(result["speed"].mean()), 1) if len(ts) else 0.0,
+    }
+    if "calories" in result:
+        report["calories"] = round(float(result["calories"][-1]), 1) if len(ts) else 0.0
+    return report
+
+
+@app.get("/api/telemetry/report")
+async def telemetry_report(
+    device: Optional[str] = None,
+    student_cpf: Optional[str] = None,
+    start: float = 0.0,
+    end: Optional[float] = None,
+):
+    """
+    Relatório do intervalo: distância, energia, calorias (peso/altura do aluno)
+    e potência, recalculados a partir das leituras gravadas.
+    """
+    if device is None and student_cpf is None:
+        raise HTTPException(status_code=400, detail="Informe device ou student_cpf")
+    series = await telemetry.load(device, student_cpf, start, end if end is not None else float("inf"))
+
+    cpfs = {s["student_cpf"] for s in series if s["student_cpf"]}
+    students = {}
+    for cpf in cpfs:
+        students[cpf] = await db.fetchone("SELECT * FROM students WHERE cpf = ?", (cpf,))
+
+    reports = await asyncio.to_thread(
+        lambda: [build_report(s, students.get(s["student_cpf"])) for s in series]
+    )
+    return {"reports": reports}
+
+
+@app.get("/api/telemetry/stats")
+async def telemetry_stats():
+    return telemetry.stats()
 
 
 # ──────────────────────────────────────────
 # Endpoints – CRUD de Alunos
 # ──────────────────────────────────────────
 @app.get("/api/students")
-async def list_students():
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM students ORDER BY name").fetchall()
-    conn.close()
-    return {"students": [dict(r) for r in rows]}
+async def list_students(
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Alunos em ordem de nome. `q` busca por CPF (dígitos) ou por prefixos das
+    palavras do nome; `limit` pagina, e `next` é o `after` da página
+    seguinte; `fields` escolhe as colunas. Ver students.py.
+    """
+    if limit is not None and not 1 <= limit <= STUDENTS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {STUDENTS_MAX_LIMIT}")
+    try:
+        columns = parse_fields(fields)
+        if after:
+            decode_cursor(after)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows, cursor = await db.read(lambda conn: query_students(conn, q, after, limit, columns))
+    return {"students": rows, "next": cursor}
+
+
+@app.get("/api/students/export")
+async def export_students(format: str = "csv"):
+    """Cadastro inteiro em ordem de nome, lido e enviado em páginas (ver bulk_io.py)."""
+    pages = bulk_io.keyset_pages(db.read, f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students", ("name", "cpf"))
+    return export_response(pages, format, STUDENT_COLUMNS, "alunos")
+
+
+@app.post("/api/students/import")
+async def import_students(request: Request, format: Optional[str] = None, encoding: str = "utf-8"):
+    """
+    Importa alunos de um CSV ou NDJSON enviado como corpo da requisição
+    (upsert pelo CPF, em lotes; ver bulk_io.py). Linhas inválidas são puladas
+    e listadas em `errors`.
+    """
+    try:
+        fmt = bulk_io.negotiate_format(format, request.headers.get("content-type"))
+    except bulk_io.BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    assignments_changed = False
+
+    async def write(rows):
+        nonlocal assignments_changed
+        async with assignment_cache.lock:
+            updated = await db.transaction(lambda conn: bulk_io.upsert_students(conn, rows))
+            assigned = {a["student_cpf"] for a in assignment_cache.assignments.values()}
+            for (cpf, name, weight, height), existed in zip(rows, updated):
+                if existed and cpf in assigned:
+                    if assignment_cache.update_student(cpf, {"name": name, "weight": weight, "height": height}):
+                        assignments_changed = True
+        return updated
+
+    try:
+        report = await bulk_io.import_students(request.stream(), fmt, write, encoding)
+    except bulk_io.BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Lotes já gravados valem mesmo se o resto falhar
+        if assignments_changed:
+            broadcast_assignments()
+    return {"status": "ok", **report.to_dict()}
 
 
 @app.get("/api/students/{cpf}")
 async def get_student(cpf: str):
-    conn = get_db()
-    row = conn.execute("SELECT * FROM students WHERE cpf = ?", (cpf,)).fetchone()
-    conn.close()
+    row = await db.fetchone("SELECT * FROM students WHERE cpf = ?", (cpf,))
     if not row:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
-    return dict(row)
+    return row
 
 
 @app.post("/api/students")
 async def create_student(student: StudentCreate):
-    conn = get_db()
     try:
-        conn.execute(
+        await db.execute(
             "INSERT INTO students (cpf, name, weight, height) VALUES (?, ?, ?, ?)",
             (student.cpf, student.name, student.weight, student.height),
         )
-        conn.commit()
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(status_code=409, detail="CPF já cadastrado")
-    conn.close()
     return {"status": "ok", "cpf": student.cpf}
 
 
 @app.put("/api/students/{cpf}")
 async def update_student(cpf: str, student: StudentUpdate):
-    conn = get_db()
-    existing = conn.execute("SELECT * FROM students WHERE cpf = ?", (cpf,)).fetchone()
-    if not existing:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Aluno não encontrado")
     updates = {}
     if student.name is not None:
         updates["name"] = student.name
@@ -215,28 +1129,42 @@ async def update_student(cpf: str, student: StudentUpdate):
         updates["weight"] = student.weight
     if student.height is not None:
         updates["height"] = student.height
-    if updates:
-        set_clause = ", ".join(f"{k} = ?" for k in updates)
-        values = list(updates.values()) + [cpf]
-        conn.execute(f"UPDATE students SET {set_clause} WHERE cpf = ?", values)
-        conn.commit()
-    conn.close()
+
+    def run(conn):
+        existing = conn.execute("SELECT 1 FROM students WHERE cpf = ?", (cpf,)).fetchone()
+        if not existing:
+            return False
+        if updates:
+            set_clause = ", ".join(f"{k} = ?" for k in updates)
+            values = list(updates.values()) + [cpf]
+            conn.execute(f"UPDATE students SET {set_clause} WHERE cpf = ?", values)
+        return True
+
+    async with assignment_cache.lock:
+        if not await db.transaction(run):
+            raise HTTPException(status_code=404, detail="Aluno não encontrado")
+        # Nome/peso/altura aparecem nos vínculos
+        changed = assignment_cache.update_student(cpf, updates)
+
+    if changed:
+        broadcast_assignments()
+
     return {"status": "ok", "cpf": cpf}
 
 
 @app.delete("/api/students/{cpf}")
 async def delete_student(cpf: str):
-    conn = get_db()
-    conn.execute("DELETE FROM bike_assignments WHERE student_cpf = ?", (cpf,))
-    result = conn.execute("DELETE FROM students WHERE cpf = ?", (cpf,))
-    conn.commit()
-    if result.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Aluno não encontrado")
-    conn.close()
+    def run(conn):
+        conn.execute("DELETE FROM bike_assignments WHERE student_cpf = ?", (cpf,))
+        return conn.execute("DELETE FROM students WHERE cpf = ?", (cpf,)).rowcount
+
+    async with assignment_cache.lock:
+        if await db.transaction(run) == 0:
+            raise HTTPException(status_code=404, detail="Aluno não encontrado")
+        assignment_cache.remove_student(cpf)
 
     # Notifica frontend que vínculos mudaram
-    await broadcast_assignments()
+    broadcast_assignments()
 
     return {"status": "ok"}
 
@@ -245,48 +1173,68 @@ async def delete_student(cpf: str):
 # Endpoints – Vínculo Bike ↔ Aluno
 # ──────────────────────────────────────────
 @app.get("/api/assignments")
-async def list_assignments():
-    conn = get_db()
-    rows = conn.execute("""
-        SELECT ba.device, ba.student_cpf, s.name as student_name, s.weight, s.height
-        FROM bike_assignments ba
-        JOIN students s ON ba.student_cpf = s.cpf
-    """).fetchall()
-    conn.close()
-    assignments = {r["device"]: dict(r) for r in rows}
-    return {"assignments": assignments}
+async def list_assignments(request: Request):
+    """
+    Servido da memória. Responde 304 quando o `If-None-Match` do cliente já
+    corresponde à versão atual.
+    """
+    etag = f'"{assignment_cache.etag}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        {"assignments": assignment_cache.assignments, "version": assignment_cache.etag},
+        headers={"ETag": etag},
+    )
+
+
+@app.get("/api/assignments/export")
+async def export_assignments(format: str = "csv"):
+    """Vínculos atuais (lidos do banco, em ordem de device)."""
+    pages = bulk_io.keyset_pages(
+        db.read,
+        """
+        SELECT ba.device, ba.student_cpf, s.name AS student_name, s.weight, s.height, ba.assigned_at
+        FROM bike_assignments ba JOIN students s ON ba.student_cpf = s.cpf
+        """,
+        ("ba.device",),
+    )
+    return export_response(pages, format, ASSIGNMENT_EXPORT_COLUMNS, "vinculos")
 
 
 @app.post("/api/assignments")
 async def assign_student_to_bike(assignment: BikeAssignment):
-    conn = get_db()
-    # Verifica se o aluno existe
-    student = conn.execute("SELECT * FROM students WHERE cpf = ?", (assignment.student_cpf,)).fetchone()
-    if not student:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Aluno não encontrado")
+    def run(conn):
+        # Verifica se o aluno existe
+        student = conn.execute(
+            "SELECT cpf, name, weight, height FROM students WHERE cpf = ?", (assignment.student_cpf,)
+        ).fetchone()
+        if not student:
+            return None
+        # Upsert – substitui se já existe vínculo para esse device
+        conn.execute(
+            "INSERT OR REPLACE INTO bike_assignments (device, student_cpf) VALUES (?, ?)",
+            (assignment.device, assignment.student_cpf),
+        )
+        return dict(student)
 
-    # Upsert – substitui se já existe vínculo para esse device
-    conn.execute(
-        "INSERT OR REPLACE INTO bike_assignments (device, student_cpf) VALUES (?, ?)",
-        (assignment.device, assignment.student_cpf),
-    )
-    conn.commit()
-    conn.close()
+    async with assignment_cache.lock:
+        student = await db.transaction(run)
+        if student is None:
+            raise HTTPException(status_code=404, detail="Aluno não encontrado")
+        assignment_cache.set(assignment.device, student)
 
-    await broadcast_assignments()
+    broadcast_assignments()
 
     return {"status": "ok", "device": assignment.device, "student_cpf": assignment.student_cpf}
 
 
 @app.delete("/api/assignments/{device}")
 async def unassign_bike(device: str):
-    conn = get_db()
-    conn.execute("DELETE FROM bike_assignments WHERE device = ?", (device,))
-    conn.commit()
-    conn.close()
+    async with assignment_cache.lock:
+        await db.execute("DELETE FROM bike_assignments WHERE device = ?", (device,))
+        assignment_cache.remove(device)
 
-    await broadcast_assignments()
+    broadcast_assignments()
 
     return {"status": "ok"}
 
@@ -294,73 +1242,598 @@ async def unassign_bike(device: str):
 @app.post("/api/assignments/reset")
 async def reset_all_assignments():
     """Remove todos os vínculos – usado ao trocar de turma."""
-    conn = get_db()
-    conn.execute("DELETE FROM bike_assignments")
-    conn.commit()
-    conn.close()
+    async with assignment_cache.lock:
+        await db.execute("DELETE FROM bike_assignments")
+        assignment_cache.clear()
 
-    await broadcast_assignments()
+    broadcast_assignments()
 
     return {"status": "ok", "message": "Todos os vínculos foram removidos"}
 
 
-async def broadcast_assignments():
-    """Envia a lista atualizada de vínculos para todos os clientes WS."""
-    conn = get_db()
-    rows = conn.execute("""
-        SELECT ba.device, ba.student_cpf, s.name as student_name, s.weight, s.height
-        FROM bike_assignments ba
-        JOIN students s ON ba.student_cpf = s.cpf
-    """).fetchall()
-    conn.close()
-    assignments = {r["device"]: dict(r) for r in rows}
-    msg = json.dumps({"type": "assignments", "assignments": assignments})
-    await broadcast(msg)
+def broadcast_assignments():
+    """
+    Envia a lista atualizada de vínculos para todos os clientes WS e avisa os
+    outros workers, que recarregam os vínculos do banco.
+    """
+    broadcast(assignment_cache.frame(), channel=ASSIGNMENTS)
+    bus.publish({"type": "assignments"})
+
+
+async def reload_assignments():
+    async with assignment_cache.lock:
+        assignment_cache.load(await fetch_assignments())
+    broadcast(assignment_cache.frame(), channel=ASSIGNMENTS)
 
 
 # ──────────────────────────────────────────
 # WebSocket
 # ──────────────────────────────────────────
+def subscription_info(client: ClientConnection) -> Dict[str, Any]:
+    return {
+        "devices": sorted(client.devices) if client.devices is not None else "*",
+        "page": client.page,
+        "channels": sorted(client.channels),
+    }
+
+
+def update_subscription(client: ClientConnection, message: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
+    """
+    Aplica um "subscribe" / "unsubscribe" (ver subscriptions.py). Retorna
+    (devices que o cliente passou a receber, canais que passou a receber).
+    Valida tudo antes de mudar qualquer coisa.
+    """
+    subscribe = message.get("type") == "subscribe"
+    if not subscribe and message.get("type") != "unsubscribe":
+        raise SubscriptionError('esperado {"type": "subscribe" | "unsubscribe", ...}')
+    channels = parse_channels(message["channels"]) if "channels" in message else None
+    devices = message.get("devices")
+    page = None
+    if "page" in message:
+        if not subscribe or devices is not None:
+            raise SubscriptionError('"page" só vale em subscribe, sem "devices"')
+        page = parse_page(message["page"], message.get("per_page", 10))
+    elif devices == "*":
+        if not subscribe:
+            raise SubscriptionError('para deixar de receber todas as bikes, assine devices ou uma página')
+    elif devices is not None:
+        devices = parse_devices(devices)
+
+    added_channels: Set[str] = set()
+    if channels is not None:
+        if subscribe:
+            added_channels = channels - client.channels
+            client.channels |= channels
+        else:
+            client.channels -= channels
+    subscriptions = active_connections.subscriptions
+    added: Set[str] = set()
+    if page is not None:
+        added = subscriptions.set_page(client, *page)
+    elif devices == "*":
+        added = subscriptions.subscribe_all(client)
+    elif devices is not None:
+        if subscribe:
+            added = subscriptions.subscribe(client, devices)
+        else:
+            subscriptions.unsubscribe(client, devices)
+    return added, added_channels
+
+
+def handle_client_message(client: ClientConnection, data: str):
+    """Mensagem de texto do cliente (além do "ping"): responde "subscribed" ou "error"."""
+    try:
+        message = json.loads(data)
+        if not isinstance(message, dict):
+            raise SubscriptionError("mensagem deve ser um objeto JSON")
+        added, added_channels = update_subscription(client, message)
+    except ValueError as e:
+        client.enqueue(json.dumps({"type": "error", "detail": str(e)}))
+        return
+    # O que o cliente não vinha recebendo chega com o estado atual
+    if TELEMETRY in added_channels:
+        client.enqueue(bikes_snapshot(client), mergeable=True)
+    else:
+        send_device_state(client, added)
+    if STATUS in added_channels:
+        client.enqueue(json.dumps({"type": "status", "devices": liveness.states}))
+    if ASSIGNMENTS in added_channels:
+        client.enqueue(assignment_cache.frame())
+    if LEADERBOARD in added_channels and current_session is not None:
+        client.enqueue(leaderboard_frame())
+    client.enqueue(json.dumps({"type": "subscribed", **subscription_info(client)}))
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    v: str = "1",
+    enc: str = "json",
+    av: str = "",
+    devices: str = "",
+    page: str = "",
+    per_page: str = "10",
+    channels: str = "",
+):
+    """
+    `v=2` negocia o protocolo de deltas (ver protocol.py); `enc=binary` envia
+    os deltas em frames binários. Sem parâmetros: protocolo JSON v1.
+    `av` é a versão de vínculos que o cliente já tem: se for a atual, o frame
+    inicial não repete os vínculos.
+    Assinaturas iniciais (ver subscriptions.py), todas opcionais:
+    `devices=A,B`, `page=1&per_page=10` e `channels=telemetry,status,...`;
+    depois, mensagens JSON "subscribe" / "unsubscribe".
+    """
+    protocol = negotiate(v, enc)
     await websocket.accept()
-    active_connections.append(websocket)
-
-    # Envia dados iniciais + vínculos
-    conn = get_db()
-    rows = conn.execute("""
-        SELECT ba.device, ba.student_cpf, s.name as student_name, s.weight, s.height
-        FROM bike_assignments ba
-        JOIN students s ON ba.student_cpf = s.cpf
-    """).fetchall()
-    conn.close()
-    assignments = {r["device"]: dict(r) for r in rows}
 
-    await websocket.send_text(json.dumps({
-        "type": "initial",
-        "bikes": bike_data,
-        "assignments": assignments,
-    }))
+    # Registro + frame inicial sem await entre eles: o próximo tick já envia
+    # deltas relativos a este estado
+    client = active_connections.connect(websocket, protocol)
+    try:
+        if channels:
+            client.channels = parse_channels(channels.split(","))
+        if page:
+            if not page.isdigit() or not per_page.isdigit():
+                raise SubscriptionError("page e per_page devem ser inteiros")
+            active_connections.subscriptions.set_page(client, *parse_page(int(page), int(per_page)))
+        elif devices and devices != "*":
+            active_connections.subscriptions.subscribe(client, parse_devices(devices.split(",")))
+    except SubscriptionError as e:
+        client.enqueue(json.dumps({"type": "error", "detail": str(e)}))
+
+    extra: Dict[str, Any] = {}
+    if ASSIGNMENTS in client.channels:
+        extra["assignments_version"] = assignment_cache.etag
+        if av != assignment_cache.etag:
+            extra["assignments"] = assignment_cache.assignments
+    if STATUS in client.channels:
+        extra["status"] = liveness.states
+    if LEADERBOARD in client.channels and current_session is not None:
+        extra["leaderboard"] = {"session": current_session.info(), "ranking": current_session.leaderboard()}
+
+    subset = client.devices if TELEMETRY in client.channels else ()
+    if protocol == PROTOCOL_V1:
+        # Bikes a partir do JSON guardado em cada registro (ver live_state.py)
+        initial = v1_bikes_frame("initial", subset, **extra)
+    else:
+        initial = encode_snapshot(
+            delta_encoder,
+            "initial",
+            subset=subset,
+            encoding="binary" if protocol == PROTOCOL_V2_BINARY else "json",
+            **extra,
+        )
+    client.enqueue(initial)
 
     try:
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
+                client.enqueue(json.dumps({"type": "pong"}))
+            else:
+                handle_client_message(client, data)
+    except (WebSocketDisconnect, RuntimeError):
+        active_connections.disconnect(client)
         print(f"Cliente desconectado. Conexões ativas: {len(active_connections)}")
 
 
-async def broadcast(message: str):
-    disconnected = []
-    for connection in active_connections:
+async def broadcast_loop():
+    """
+    Envia, a cada tick, um único frame com as bikes que mudaram desde o tick
+    anterior: "updates" (estado completo, v1) e/ou "delta" (v2, JSON ou
+    binário). Cada formato é serializado uma vez por tick, e o endpoint de
+    ingestão nunca espera pelos sockets.
+    """
+    interval = 1.0 / BROADCAST_HZ
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    next_leaderboard = next_tick
+    leaderboard_version = None
+    while True:
+        next_tick = max(next_tick + interval, loop.time())
+        await asyncio.sleep(next_tick - loop.time())
+
+        # Um erro perde só o tick (e é registrado); os seguintes continuam
         try:
-            await connection.send_text(message)
-        except:
-            disconnected.append(connection)
-    for connection in disconnected:
-        active_connections.remove(connection)
+            # Ranking da aula: no máximo a cada LEADERBOARD_INTERVAL e só se mudou
+            if current_session is not None and loop.time() >= next_leaderboard:
+                next_leaderboard = loop.time() + LEADERBOARD_INTERVAL
+                version = (current_session.id, current_session.version)
+                if version != leaderboard_version and active_connections:
+                    leaderboard_version = version
+                    broadcast(leaderboard_frame(), mergeable=True, channel=LEADERBOARD)
+        except Exception as e:
+            print(f"⚠️ Erro no ranking do tick: {e!r}")
+        try:
+            expire_devices()
+        except Exception as e:
+            print(f"⚠️ Erro ao expirar devices no tick: {e!r}")
+        try:
+            broadcast_updates()
+        except Exception as e:
+            print(f"⚠️ Erro no broadcast do tick: {e!r}")
+
+
+def broadcast_updates():
+    """Um tick: envia as bikes alteradas desde o anterior (cada formato serializado uma vez)."""
+    if not dirty_devices:
+        return
+    if metrics.ENABLED:
+        start = time.perf_counter()
+        fanout = _broadcast_updates()
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
+        BROADCAST_FANOUT.observe(fanout)
+    else:
+        _broadcast_updates()
+
+
+def _broadcast_updates() -> int:
+    """
+    Retorna quantos clientes receberam o tick. Quem assina todas as bikes
+    recebe o frame completo (serializado uma vez por formato); os clientes
+    filtrados vêm do índice device → grupos de assinatura e cada grupo recebe
+    um frame por formato. As entradas binárias do frame completo são
+    reaproveitadas nos frames dos grupos.
+    """
+    devices = list(dirty_devices)
+    dirty_devices.clear()
+    BROADCAST_DEVICES.observe(len(devices))
+    rows = {d: bike_row(d) for d in devices if d in bike_store}
+    new_devices, entries = delta_encoder.diff(rows)
+    if not active_connections:
+        return 0
+
+    everyone, routed = active_connections.route(rows)
+    if new_devices:
+        # Tabela de IDs: todos os clientes v2 do canal telemetry, filtrados ou não
+        devices_frame = json.dumps({"type": "devices", "devices": new_devices})
+        broadcast({PROTOCOL_V2_JSON: devices_frame, PROTOCOL_V2_BINARY: devices_frame}, channel=TELEMETRY)
+
+    protocols = {c.protocol for c in everyone}
+    frames: Dict[str, Any] = {}
+    # Entradas binárias do frame completo, reaproveitadas nos frames filtrados
+    packed: Optional[Dict[str, bytes]] = None
+    if PROTOCOL_V1 in protocols:
+        frames[PROTOCOL_V1] = f'{{"type": "updates", "bikes": {bike_store.json(rows)}}}'
+    if entries:
+        if PROTOCOL_V2_JSON in protocols:
+            frames[PROTOCOL_V2_JSON] = encode_delta_json(list(entries.values()))
+        if PROTOCOL_V2_BINARY in protocols:
+            packed = {name: pack_entry(*entry) for name, entry in entries.items()}
+            frames[PROTOCOL_V2_BINARY] = delta_binary_frame(list(packed.values()))
+    fanout = 0
+    for client in everyone:
+        frame = frames.get(client.protocol)
+        if frame is not None:
+            client.enqueue(frame, mergeable=True)
+            fanout += 1
+
+    for group, names in routed.items():
+        group_frames: Dict[str, Any] = {}
+        for client in group.clients:
+            if TELEMETRY not in client.channels:
+                continue
+            protocol = client.protocol
+            if protocol in group_frames:
+                frame = group_frames[protocol]
+            else:
+                frame = group_frames[protocol] = _routed_frame(protocol, names, entries, packed)
+            if frame is not None:
+                client.enqueue(frame, mergeable=True)
+                fanout += 1
+    return fanout
+
+
+def _routed_frame(
+    protocol: str, names: Collection[str], entries: Dict[str, Any], packed: Optional[Dict[str, bytes]]
+):
+    """
+    Frame do tick só com as bikes de `names` que mudaram (None se nenhuma);
+    `packed` são as entradas binárias do frame completo, se houve um. Sem
+    ele cada grupo empacota as suas (em páginas, cada entrada uma vez só).
+    """
+    if protocol == PROTOCOL_V1:
+        changed = [name for name in names if name in entries]
+        return f'{{"type": "updates", "bikes": {bike_store.json(changed)}}}' if changed else None
+    # filter(None, ...) tira os devices sem delta no tick (entradas nunca são vazias)
+    if protocol == PROTOCOL_V2_BINARY:
+        if packed is not None:
+            parts = list(filter(None, map(packed.get, names)))
+        else:
+            parts = list(starmap(pack_entry, filter(None, map(entries.get, names))))
+        return delta_binary_frame(parts) if parts else None
+    selected = list(filter(None, map(entries.get, names)))
+    return encode_delta_json(selected) if selected else None
+
+
+def expire_devices():
+    """
+    Aplica os prazos de inatividade vencidos, remove da memória os devices
+    sem leituras há EVICT_AFTER segundos (pelo barramento, para que todos os
+    workers removam os mesmos) e envia as mudanças de estado num frame
+    "status" compacto ({device: "active" | "idle" | "offline" | "evicted"}).
+    """
+    candidates = liveness.expire(time.time())
+    if candidates:
+        bus.publish({"type": "evict", "devices": candidates})
+    changes = liveness.take_pending()
+    if changes and active_connections:
+        # Frame de controle: não pode ser descartado em favor de um snapshot
+        broadcast(json.dumps({"type": "status", "devices": changes}), channel=STATUS)
+
+
+def evict_devices(devices: List[Tuple[str, float]]):
+    """Remove os devices que continuam sem leitura desde `last_seen`."""
+    global state_changes
+    state_changes += 1
+    for device, last_seen in devices:
+        if liveness.evict(device, last_seen):
+            drop_device(device)
+
+
+def drop_device(device: str):
+    bike_store.pop(device)
+    sample_filter.remove(device)
+    send_page_changes(active_connections.subscriptions.device_removed(device))
+    dirty_devices.discard(device)
+    delta_encoder.remove(device)
+
+
+# ──────────────────────────────────────────
+# Vários workers (ver cluster.py)
+# ──────────────────────────────────────────
+def on_bus_message(message: Dict[str, Any], origin: bool):
+    """Aplica uma mensagem do barramento; `origin` indica que foi publicada por este worker."""
+    kind = message["type"]
+    if kind == "readings":
+        apply_readings(message["readings"], message["time"])
+    elif kind == "evict":
+        evict_devices(message["devices"])
+    elif kind == "session_start":
+        begin_session(message, origin)
+    elif kind == "session_stop":
+        end_session(message)
+    elif kind == "assignments" and not origin:
+        asyncio.get_running_loop().create_task(reload_assignments())
+
+
+def state_snapshot() -> Dict[str, Any]:
+    """Estado ao vivo enviado a um worker que acabou de (re)conectar."""
+    return {
+        "bikes": bike_store.state(),
+        "last_seen": liveness.last_seen,
+        "session": current_session.state() if current_session is not None else None,
+    }
+
+
+def restore_snapshot(state: Dict[str, Any]):
+    """
+    Substitui o estado local pelo de um par (ou pela cópia em disco, na
+    inicialização); os clientes deste worker recebem tudo de novo.
+    """
+    global current_session, state_changes
+    state_changes += 1
+    removed = set(bike_store.records) - {values[0] for values in state["bikes"]}
+    for device in removed:
+        drop_device(device)
+    bike_store.load(state["bikes"])
+    # As janelas de duplicatas recomeçam do `timestamp` de cada registro
+    sample_filter.clear()
+    send_page_changes(active_connections.subscriptions.reset_devices(bike_store.records))
+    liveness.clear()
+    for device, last_seen in state["last_seen"].items():
+        liveness.touch(device, last_seen)
+    evict_devices(liveness.expire(time.time()))
+    for device in removed:
+        liveness.pending.setdefault(device, "evicted")
+    dirty_devices.update(bike_store.records)
+    session = state["session"]
+    current_session = ClassSession.from_state(session) if session is not None else None
+
+
+async def capture_state(chunk: int) -> Dict[str, Any]:
+    """
+    O estado de state_snapshot() para a cópia em disco, serializado em linhas
+    de `chunk` bikes com o event loop liberado entre elas (ver warm_start.py).
+    """
+    session = current_session
+    session_state = None
+    if session is not None:
+        session_state = {**session.info(), "version": session.version}
+    lines = []
+    records = list(bike_store)
+    for i in range(0, len(records), chunk):
+        if i:
+            await asyncio.sleep(0)
+        lines.append(json.dumps({"bikes": [record.state() for record in records[i:i + chunk]]}))
+    if session is not None:
+        aggregates = list(session.bikes.values())
+        for i in range(0, len(aggregates), chunk):
+            await asyncio.sleep(0)
+            lines.append(json.dumps({"session_bikes": {agg.device: agg.state() for agg in aggregates[i:i + chunk]}}))
+    return {"session": session_state, "lines": lines}
+
+
+# Cópia periódica do estado ao vivo em disco, restaurada ao reiniciar (ver
+# warm_start.py); SNAPSHOT_INTERVAL=0 desliga. Com vários workers só o líder grava.
+warm_start = WarmStart(
+    os.getenv("SNAPSHOT_PATH", os.path.join(os.path.dirname(DB_PATH), "live_state.snapshot")),
+    float(os.getenv("SNAPSHOT_INTERVAL", "5")),
+    capture_state,
+    lambda: state_changes,
+    should_write=lambda: bus.leader,
+)
+
+
+@app.get("/api/snapshot")
+async def snapshot_stats():
+    """Cópia do estado ao vivo em disco: última gravação, tamanho, custo e restauração."""
+    return warm_start.stats()
+
+
+@app.get("/api/cluster")
+async def cluster_stats():
+    """Estado do barramento deste worker (modo, líder, mensagens, sincronizações)."""
+    return bus.stats()
+
+
+broadcast_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def load_assignments():
+    assignment_cache.load(await fetch_assignments())
+
+
+@app.on_event("startup")
+async def restore_live_state():
+    """
+    Carrega a cópia do estado ao vivo antes do barramento: com vários workers,
+    um par já sincronizado prevalece sobre ela.
+    """
+    if not warm_start.enabled:
+        return
+    state = warm_start.load()
+    if state is None:
+        return
+    session = state["session"]
+    if session is not None:
+        # Aula encerrada (ou apagada) depois da cópia não volta
+        row = await db.fetchone("SELECT stopped_at FROM class_sessions WHERE id = ?", (session["id"],))
+        if row is None or row["stopped_at"] is not None:
+            state["session"] = None
+    restore_snapshot(state)
+    print(
+        f"♻️ Estado restaurado de {warm_start.path}: {len(bike_store)} bikes"
+        f"{', aula em andamento' if current_session is not None else ''}"
+        f" (cópia de {time.time() - state['saved_at']:.0f} s atrás)"
+    )
+
+
+@app.on_event("startup")
+async def start_bus():
+    await bus.start(on_bus_message, state_snapshot, restore_snapshot)
+
+
+@app.on_event("shutdown")
+async def stop_bus():
+    await bus.stop()
+
+
+@app.on_event("startup")
+async def start_telemetry():
+    telemetry.start()
+
+
+@app.on_event("shutdown")
+async def stop_telemetry():
+    await telemetry.stop()
+
+
+@app.on_event("startup")
+async def start_broadcaster():
+    global broadcast_task
+    broadcast_task = asyncio.create_task(broadcast_loop())
+
+
+@app.on_event("shutdown")
+async def stop_broadcaster():
+    if broadcast_task:
+        broadcast_task.cancel()
+
+
+@app.on_event("startup")
+async def start_ingest_listener():
+    await ingest_listener.start()
+
+
+@app.on_event("shutdown")
+async def stop_ingest_listener():
+    await ingest_listener.stop()
+
+
+@app.on_event("startup")
+async def start_warm_start():
+    warm_start.start()
+
+
+@app.on_event("shutdown")
+async def stop_warm_start():
+    await warm_start.stop()
+
+
+@app.on_event("startup")
+async def start_metrics():
+    # O monitor do event loop também alimenta o OverloadGuard
+    metrics.start(monitor_lag=overload.max_lag > 0)
+
+
+@app.on_event("shutdown")
+async def stop_metrics():
+    metrics.stop()
+
+
+@app.on_event("shutdown")
+def close_db():
+    db.close()
+
+
+def broadcast(message, mergeable: bool = False, channel: Optional[str] = None):
+    """
+    Enfileira a mensagem para todos os clientes sem esperar pelos sockets.
+    `message` pode ser um frame único ou um dicionário {protocolo: frame}.
+    `mergeable=True` marca frames de estado que podem ser descartados em favor
+    do estado mais recente quando a fila de um cliente enche. Com `channel`,
+    só para os clientes que assinam o canal.
+    """
+    active_connections.broadcast(message, mergeable, channel)
+
+
+@app.get("/api/connections")
+async def list_connections():
+    """Profundidade de fila e descartes por cliente WebSocket (telas atrasadas)."""
+    return {
+        "connections": active_connections.stats(),
+        "evicted": active_connections.evicted,
+    }
+
+
+# Valores lidos na hora da coleta
+metrics.registry.gauge("ws_connections", "Clientes WebSocket conectados", lambda: len(active_connections))
+metrics.registry.gauge(
+    "ws_queue_depth", "Frames na fila de saída, somados por protocolo",
+    lambda: _queue_depths(), ("protocol",),
+)
+metrics.registry.gauge("bikes", "Bikes em memória por estado", lambda: _states_count(), ("state",))
+metrics.registry.gauge("telemetry_pending_samples", "Amostras aguardando gravação", lambda: telemetry.pending)
+metrics.registry.gauge("telemetry_dropped_samples", "Amostras descartadas (buffer cheio)", lambda: telemetry.dropped)
+metrics.registry.gauge(
+    "ingest_listener_malformed", "Datagramas/streams binários descartados por registro inválido",
+    lambda: ingest_listener.malformed,
+)
+
+
+def _queue_depths() -> Dict[str, int]:
+    depths: Dict[str, int] = {}
+    for client in active_connections.clients:
+        depths[client.protocol] = depths.get(client.protocol, 0) + len(client.pending)
+    return depths
+
+
+def _states_count() -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for state in liveness.states.values():
+        counts[state] = counts.get(state, 0) + 1
+    return counts
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Métricas no formato texto do Prometheus (404 com METRICS_ENABLED=0)."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desativadas")
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/")
@@ -368,11 +1841,19 @@ async def root():
     return {
         "app": "Bike Dashboard API",
         "status": "running",
-        "active_bikes": len(bike_data),
+        "active_bikes": sum(1 for state in liveness.states.values() if state == ACTIVE),
+        "known_bikes": len(bike_store),
         "active_connections": len(active_connections),
     }
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        # Estado compartilhado pelo barramento (ver cluster.py)
+        if not os.getenv("CLUSTER_PORT"):
+            os.environ["CLUSTER_PORT"] = "8765"
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
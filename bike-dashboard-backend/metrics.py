@@ -0,0 +1,263 @@
+"""
+Instrumentação dos caminhos quentes e exposição em `/metrics` (formato texto
+do Prometheus, sem dependências).
+
+Contadores e histogramas ficam em memória, indexados pela tupla de labels.
+Com `METRICS_ENABLED=0` todos os objetos viram no-ops e os pontos de medição
+nos caminhos quentes são protegidos por `if metrics.ENABLED:`, então o custo
+fica em uma leitura de atributo por chamada.
+
+Quem mede tempo usa `time.perf_counter()`; os histogramas são em segundos.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Buckets (s) para operações de microssegundos (cálculos por leitura)
+MICRO_BUCKETS = (1e-7, 2.5e-7, 5e-7, 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4)
+# Buckets (s) para requisições, consultas e envios
+LATENCY_BUCKETS = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Endpoint da requisição atual (label das consultas ao banco) e início dela
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="background")
+request_started: contextvars.ContextVar[float] = contextvars.ContextVar("request_started", default=0.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels → [contagem por bucket (não cumulativa) + overflow, soma, total]
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Valor lido na hora da coleta: `fn()` retorna um número ou {labels: número}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], object], labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        value = self.fn()
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(v)}")
+        else:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+class _Noop:
+    def inc(self, *labels, amount: float = 1.0):
+        pass
+
+    def observe(self, value: float, *labels):
+        pass
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        if not ENABLED:
+            return _Noop()
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], object], labels: Sequence[str] = ()):
+        return self._add(Gauge(name, help, fn, labels))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ──────────────────────────────────────────
+# Métricas comuns aos módulos
+# ──────────────────────────────────────────
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Duração das requisições HTTP por rota", ("method", "route", "status")
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "Tempo de consultas SQLite (fila + execução) por endpoint", ("endpoint", "kind")
+)
+WS_SEND_SECONDS = registry.histogram(
+    "ws_send_duration_seconds", "Tempo de envio de um frame a um socket", ("protocol",)
+)
+WS_DROPPED_FRAMES = registry.counter(
+    "ws_dropped_frames_total", "Frames de estado descartados em filas cheias", ("protocol",)
+)
+WS_RESYNCS = registry.counter("ws_resyncs_total", "Snapshots enviados a clientes atrasados", ("protocol",))
+WS_EVICTIONS = registry.counter("ws_evictions_total", "Clientes desconectados pelo servidor", ("reason",))
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "event_loop_lag_seconds", "Atraso do event loop em acordar uma task periódica"
+)
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Rota do FastAPI que mede a duração de cada requisição e marca o endpoint
+    atual (label das consultas ao banco) e o instante de chegada (tempo de
+    leitura e validação do corpo, ver `since_request_start`).
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if not ENABLED:
+            return handler
+        route, endpoint = self.path, self.name
+
+        async def instrumented(request):
+            started = time.perf_counter()
+            current_endpoint.set(endpoint)
+            request_started.set(started)
+            status = "500"
+            try:
+                response = await handler(request)
+                status = str(response.status_code)
+                return response
+            except HTTPException as e:
+                status = str(e.status_code)
+                raise
+            except RequestValidationError:
+                status = "422"
+                raise
+            finally:
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, status)
+
+        return instrumented
+
+
+def since_request_start() -> float:
+    """Segundos desde a chegada da requisição atual (0 fora de uma rota instrumentada)."""
+    started = request_started.get()
+    return time.perf_counter() - started if started else 0.0
+
+
+# Última medida do monitor (s); o guarda de sobrecarga da ingestão lê daqui
+loop_lag = 0.0
+
+
+async def monitor_event_loop(interval: float = 0.1):
+    """Mede quanto o loop atrasa para acordar uma task que dorme `interval` segundos."""
+    global loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag = max(loop.time() - start - interval, 0.0)
+        EVENT_LOOP_LAG_SECONDS.observe(loop_lag)
+
+
+_lag_task: Optional[asyncio.Task] = None
+
+
+def start(monitor_lag: bool = False):
+    """Liga o monitor do event loop se as métricas estão ligadas ou se `monitor_lag`."""
+    global _lag_task
+    if ENABLED or monitor_lag:
+        _lag_task = asyncio.create_task(monitor_event_loop())
+
+
+def stop():
+    if _lag_task:
+        _lag_task.cancel()
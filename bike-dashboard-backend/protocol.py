@@ -0,0 +1,194 @@
+"""
+Protocolo v2 do WebSocket: deltas por device com IDs numéricos curtos.
+
+Negociado na conexão (`/ws?v=2` ou `/ws?v=2&enc=binary`); sem parâmetros o
+servidor continua usando o protocolo JSON v1 (estado completo por bike).
+
+Cada entrada de delta é `[id, mask, valor, ...]`: o bit `i` de `mask` indica
+que o campo `FIELDS[i]` mudou, e os valores seguem na ordem dos bits.
+
+Frame binário (little-endian), usado só para os deltas:
+    u8  tipo (1 = delta)
+    u16 quantidade de entradas
+    por entrada: u16 id, u8 mask, valores presentes conforme `FIELD_FORMATS`
+
+O ID de um device removido volta para uma fila e é reaproveitado pelo
+próximo device novo, anunciado no frame "devices" como qualquer ID novo; assim
+os IDs cabem no u16 enquanto houver até MAX_DEVICE_ID devices ao mesmo tempo.
+
+Os frames raros (initial, snapshot, devices, assignments) continuam em JSON.
+"""
+
+import json
+import struct
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PROTOCOL_V1 = "v1"
+PROTOCOL_V2_JSON = "v2"
+PROTOCOL_V2_BINARY = "v2b"
+
+# Ordem dos campos = ordem dos bits da máscara
+FIELDS = (
+    "timestamp",        # ts enviado pelo device
+    "last_seen",        # epoch (s) do servidor na última leitura
+    "instant_speed",
+    "instant_power",
+    "instant_cadence",
+    "total_distance",
+)
+FIELD_FORMATS = ("d", "d", "f", "f", "f", "I")
+
+# Faixa dos formatos que não cobrem todo float do Python ("d" cobre)
+_FORMAT_LIMITS = {"f": (-3.4028234663852886e38, 3.4028234663852886e38), "I": (0, 0xFFFFFFFF)}
+
+FRAME_DELTA = 1
+
+# Maior ID de device que cabe no frame binário (u16)
+MAX_DEVICE_ID = 0xFFFF
+
+_HEADER = struct.Struct("<BH")
+
+Entry = Tuple[int, int, List[Any]]
+
+_entry_structs: Dict[int, struct.Struct] = {}
+
+
+def _entry_struct(mask: int) -> struct.Struct:
+    s = _entry_structs.get(mask)
+    if s is None:
+        fmt = "".join(f for i, f in enumerate(FIELD_FORMATS) if mask & (1 << i))
+        s = _entry_structs[mask] = struct.Struct("<HB" + fmt)
+    return s
+
+
+def negotiate(version: str, encoding: str) -> str:
+    """Escolhe o protocolo a partir dos parâmetros de query do /ws."""
+    if version == "2":
+        return PROTOCOL_V2_BINARY if encoding == "binary" else PROTOCOL_V2_JSON
+    return PROTOCOL_V1
+
+
+class DeltaEncoder:
+    """
+    Guarda o último estado transmitido de cada device (a "base" dos deltas),
+    compartilhado por todos os clientes v2: os deltas são calculados e
+    serializados uma vez por tick, não por cliente.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.baseline: Dict[int, Tuple[Any, ...]] = {}
+        self._next_id = 1
+        # IDs liberados por remove(), reaproveitados do mais antigo para o mais novo
+        self._free: Deque[int] = deque()
+
+    def diff(self, rows: Dict[str, Tuple[Any, ...]]) -> Tuple[Dict[str, int], Dict[str, Entry]]:
+        """
+        Compara as linhas atuais com a base e a atualiza.
+        Retorna (devices novos {nome: id}, entradas de delta {nome: entrada}).
+        """
+        new_devices: Dict[str, int] = {}
+        entries: Dict[str, Entry] = {}
+        full_mask = (1 << len(FIELDS)) - 1
+        for name, row in rows.items():
+            device_id = self.ids.get(name)
+            if device_id is None:
+                device_id = self.ids[name] = self._allocate()
+                new_devices[name] = device_id
+                entries[name] = (device_id, full_mask, list(row))
+            else:
+                previous = self.baseline[device_id]
+                mask = 0
+                values = []
+                for i, value in enumerate(row):
+                    if value != previous[i]:
+                        mask |= 1 << i
+                        values.append(value)
+                if not mask:
+                    continue
+                entries[name] = (device_id, mask, values)
+            self.baseline[device_id] = row
+        return new_devices, entries
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.popleft()
+        if self._next_id > MAX_DEVICE_ID:
+            raise OverflowError(f"mais de {MAX_DEVICE_ID} devices ativos no protocolo v2")
+        device_id = self._next_id
+        self._next_id += 1
+        return device_id
+
+    def remove(self, name: str):
+        """Esquece um device removido; o ID dele vai para a fila de reaproveitamento."""
+        device_id = self.ids.pop(name, None)
+        if device_id is not None:
+            self.baseline.pop(device_id, None)
+            self._free.append(device_id)
+
+    def snapshot_entries(self, subset: Optional[Iterable[str]] = None) -> List[Entry]:
+        """Estado completo da base; com `subset`, só desses devices (os ainda não transmitidos ficam de fora)."""
+        full_mask = (1 << len(FIELDS)) - 1
+        if subset is None:
+            return [(device_id, full_mask, list(row)) for device_id, row in self.baseline.items()]
+        entries = []
+        for name in subset:
+            device_id = self.ids.get(name)
+            if device_id is not None:
+                entries.append((device_id, full_mask, list(self.baseline[device_id])))
+        return entries
+
+
+def encode_delta_json(entries: Sequence[Entry]) -> str:
+    return json.dumps({"type": "delta", "d": [[i, m, *v] for i, m, v in entries]}, separators=(",", ":"))
+
+
+def _clamp(code: str, value: Any) -> Any:
+    """`value` no formato `code`: fora da faixa → extremo; NaN ou não numérico → 0."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0
+    if value != value:
+        value = 0.0
+    limits = _FORMAT_LIMITS.get(code)
+    if limits is not None:
+        value = min(max(value, limits[0]), limits[1])
+    return int(value) if code == "I" else value
+
+
+def pack_entry(device_id: int, mask: int, values: List[Any]) -> bytes:
+    """Uma entrada do frame binário (ver `delta_binary_frame`)."""
+    s = _entry_struct(mask)
+    try:
+        return s.pack(device_id, mask, *values)
+    except (struct.error, TypeError, OverflowError):
+        # Só entradas com valor fora do formato pagam o ajuste
+        codes = [f for i, f in enumerate(FIELD_FORMATS) if mask & (1 << i)]
+        return s.pack(device_id, mask, *map(_clamp, codes, values))
+
+
+def delta_binary_frame(packed: Sequence[bytes]) -> bytes:
+    """Frame binário com entradas já empacotadas por `pack_entry` (reaproveitadas entre frames do tick)."""
+    return _HEADER.pack(FRAME_DELTA, len(packed)) + b"".join(packed)
+
+
+def encode_delta_binary(entries: Sequence[Entry]) -> bytes:
+    """Frame binário dos deltas; valores fora do formato do campo são ajustados (ver `_clamp`)."""
+    return delta_binary_frame([pack_entry(device_id, mask, values) for device_id, mask, values in entries])
+
+
+def encode_snapshot(encoder: DeltaEncoder, frame_type: str, subset: Optional[Iterable[str]] = None, **extra: Any) -> str:
+    """
+    Frame JSON com a tabela de IDs e o estado completo (initial/snapshot v2);
+    com `subset`, o estado só desses devices (assinaturas, ver subscriptions.py).
+    """
+    return json.dumps({
+        "type": frame_type,
+        "version": 2,
+        "fields": FIELDS,
+        "devices": encoder.ids,
+        "d": [[i, m, *v] for i, m, v in encoder.snapshot_entries(subset)],
+        **extra,
+    }, separators=(",", ":"))
@@ -0,0 +1,368 @@
+"""
+Replay de aulas gravadas: reenvia leituras reais pelo pipeline de ingestão.
+
+Fontes:
+- `--session ID`: a telemetria gravada de uma aula (`telemetry_blocks` entre
+  o início e o fim da aula) no banco `--db`;
+- `--csv ARQ`: uma leitura por linha, com colunas `ts`, `device` e os campos
+  da leitura (`instant_power`, `instant_cadence`, `heart_rate`, ...);
+- `--ndjson ARQ`: um payload de `/api/ftms` (ou de `/api/ftms/batch`) por linha.
+
+As leituras são agrupadas em janelas de `--window` segundos do tempo gravado
+e cada janela vira um lote, enviado no instante correspondente em 1×, N×
+(`--speed N`) ou o mais rápido possível (`--speed 0`). O `ts` de cada leitura
+é o gravado, deslocado para começar em `--base-ts` (padrão: o original;
+`now` = hora do início do replay): a mesma captura gera sempre as mesmas
+leituras, em qualquer velocidade.
+
+Destinos:
+- HTTP (padrão): `POST /api/ftms/batch` num backend rodando (`--url`); os
+  dashboards abertos veem a aula. O backend integra a distância pelo próprio
+  relógio, então só em 1× ela bate com a gravação. Acima de
+  `INGEST_DEVICE_RATE` leituras/s por bike (padrão 20; `--speed 0` ou
+  multiplicadores altos) o backend descarta o excedente: o relatório mostra
+  quantas foram limitadas. Para replays rápidos, rode o backend com
+  `INGEST_DEVICE_RATE=0`;
+- `--inprocess`: importa `main` (com banco temporário) e aplica cada lote com
+  `apply_readings` no relógio virtual da janela, seguido de um tick do
+  broadcaster para `--clients` WebSockets em memória. Distâncias e estado
+  final não dependem da velocidade nem da máquina (`state_digest` no
+  relatório); com `--speed 0` é um benchmark do caminho estado → broadcast
+  com dados reais.
+
+    python replay.py --session 3 --db abitah_bikes.db --base-ts now
+    python replay.py --ndjson captura.ndjson --speed 10 --url http://127.0.0.1:8000
+    python replay.py --csv aula.csv --inprocess --speed 0 --clients 50 --json
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (ts, device, leitura), em ordem de ts
+Event = Tuple[float, str, Dict[str, Any]]
+Batch = List[Tuple[str, float, Dict[str, Any]]]
+
+
+# ──────────────────────────────────────────
+# Fontes
+# ──────────────────────────────────────────
+def _number(value: float):
+    """Potência/cadência gravadas como float64: inteiros voltam como int."""
+    return int(value) if value.is_integer() else value
+
+
+def load_session(db_path: str, session_id: int, device: Optional[str] = None) -> List[Event]:
+    """Telemetria gravada durante a aula `session_id` (até agora, se ainda não terminou)."""
+    from database import connect
+    from telemetry import read_series
+
+    conn = connect(db_path)
+    try:
+        session = conn.execute(
+            "SELECT started_at, stopped_at FROM class_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if session is None:
+            raise ValueError(f"aula {session_id} não encontrada em {db_path}")
+        end = session["stopped_at"] if session["stopped_at"] is not None else float("inf")
+        series = read_series(conn, device=device, start=session["started_at"], end=end)
+    finally:
+        conn.close()
+    events = [
+        (ts, s["device"], {"instant_power": _number(power), "instant_cadence": _number(cadence)})
+        for s in series
+        for ts, power, cadence in zip(s["ts"], s["power"], s["cadence"])
+    ]
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def _csv_value(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def load_csv(path: str) -> List[Event]:
+    """Colunas `ts` e `device` obrigatórias; `src` é ignorada; células vazias ficam de fora."""
+    events: List[Event] = []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = {"ts", "device"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{path}: faltam as colunas {sorted(missing)}")
+        fields = [name for name in reader.fieldnames if name not in ("ts", "device", "src")]
+        for row in reader:
+            reading = {name: _csv_value(row[name]) for name in fields if row[name] not in ("", None)}
+            events.append((float(row["ts"]), row["device"], reading))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def load_ndjson(path: str) -> List[Event]:
+    events: List[Event] = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                payload = json.loads(line)
+                for r in payload["readings"] if "readings" in payload else (payload,):
+                    events.append((float(r["ts"]), r["device"], r["reading"]))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{number}: linha inválida ({e})")
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def windows(events: List[Event], window: float, shift: float) -> Iterator[Tuple[float, Batch]]:
+    """(fim da janela, relativo ao início; lote com `ts` deslocado) por janela com leituras."""
+    t0 = events[0][0]
+    current = None
+    batch: Batch = []
+    for ts, device, reading in events:
+        index = int((ts - t0) // window)
+        if index != current:
+            if batch:
+                yield (current + 1) * window, batch
+            current, batch = index, []
+        batch.append((device, ts + shift, reading))
+    if batch:
+        yield (current + 1) * window, batch
+
+
+# ──────────────────────────────────────────
+# Destinos
+# ──────────────────────────────────────────
+class HttpSink:
+    """Lotes em `POST /api/ftms/batch` de um backend rodando."""
+
+    def __init__(self, url: str):
+        import httpx
+
+        self.client = httpx.AsyncClient(base_url=url, timeout=10.0)
+        self.ok = 0
+        self.rate_limited = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    async def send(self, batch: Batch, current_time: float):
+        # O backend usa o próprio relógio como current_time
+        payload = {"readings": [{"ts": ts, "src": "replay", "device": d, "reading": r} for d, ts, r in batch]}
+        try:
+            response = await self.client.post("/api/ftms/batch", json=payload)
+        except Exception as e:
+            print(f"⚠️ Falha ao enviar lote: {e}")
+            self.errors += len(batch)
+            return
+        if response.status_code == 200:
+            # Aceitação parcial: o backend diz quantas entraram (ver admission.py)
+            body = response.json()
+            self.ok += body.get("accepted", len(batch))
+            self.rate_limited += body.get("rate_limited", 0)
+            self.duplicates += body.get("duplicates", 0)
+        elif response.status_code == 429:
+            self.rate_limited += len(batch)
+        else:
+            self.errors += len(batch)
+
+    async def close(self) -> Dict[str, Any]:
+        await self.client.aclose()
+        return {
+            "sink": "http",
+            "ok": self.ok,
+            "rate_limited": self.rate_limited,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+        }
+
+
+class _LocalSocket:
+    """Lado servidor de um WebSocket em memória: conta frames e bytes."""
+
+    client = None
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def send_bytes(self, data: bytes):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class InProcessSink:
+    """`apply_readings` no relógio virtual + um tick do broadcaster por lote, sem rede."""
+
+    def __init__(self, clients: int, protocol: str):
+        # main.py abre o banco na importação: o temporário tem de vir antes
+        self._tmp = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self._tmp.name, "replay.db")
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main
+
+        self.main = main
+        self.sockets = [_LocalSocket() for _ in range(clients)]
+        self.conns = [main.active_connections.connect(s, protocol) for s in self.sockets]
+
+    async def send(self, batch: Batch, current_time: float):
+        self.main.apply_readings(batch, current_time)
+        self.main.broadcast_updates()
+        await self._drain()
+
+    async def _drain(self):
+        """Espera os writers entregarem tudo o que está na fila (sem frames mesclados)."""
+        while any(c.pending for c in self.conns):
+            await asyncio.sleep(0)
+
+    def state_digest(self) -> str:
+        """Hash do estado final das bikes (igual em qualquer velocidade ou máquina)."""
+        digest = hashlib.sha256()
+        for record in sorted(self.main.bike_store, key=lambda r: r.device):
+            digest.update(repr((record.device, record.timestamp, record.last_seen, record.distance)).encode())
+        return digest.hexdigest()[:16]
+
+    async def close(self) -> Dict[str, Any]:
+        await self._drain()
+        for conn in self.conns:
+            self.main.active_connections.disconnect(conn)
+        await asyncio.sleep(0)
+        self._tmp.cleanup()
+        return {
+            "sink": "inprocess",
+            "clients": len(self.sockets),
+            "frames": sum(s.frames for s in self.sockets),
+            "frame_bytes": sum(s.bytes for s in self.sockets),
+            "bikes": len(self.main.bike_store),
+            "distances": {r.device: int(r.distance) for r in self.main.bike_store},
+            "state_digest": self.state_digest(),
+        }
+
+
+# ──────────────────────────────────────────
+# Replay
+# ──────────────────────────────────────────
+async def replay(events: List[Event], sink, speed: float, window: float, base_ts: Optional[float]) -> Dict[str, Any]:
+    """Envia as janelas no ritmo de `speed` (0 = sem espera); retorna o relatório."""
+    t0 = events[0][0]
+    shift = base_ts - t0 if base_ts is not None else 0.0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    wall, cpu = time.perf_counter(), time.process_time()
+    batches = late = 0
+    for end, batch in windows(events, window, shift):
+        if speed > 0:
+            delay = start + end / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -window:
+                late += 1
+        # Relógio virtual: fim da janela no tempo gravado (deslocado)
+        await sink.send(batch, t0 + shift + end)
+        batches += 1
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    report = {
+        "readings": len(events),
+        "devices": len({e[1] for e in events}),
+        "recorded_s": round(events[-1][0] - t0, 3),
+        "speed": speed,
+        "window_s": window,
+        "batches": batches,
+        "late_batches": late,
+        "wall_s": round(wall, 3),
+        "readings_per_s": round(len(events) / wall, 1) if wall else None,
+        "cpu_us_per_reading": round(cpu / len(events) * 1e6, 2),
+    }
+    report.update(await sink.close())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--session", type=int, metavar="ID", help="aula gravada (telemetria do banco)")
+    source.add_argument("--csv", metavar="ARQ")
+    source.add_argument("--ndjson", metavar="ARQ")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "abitah_bikes.db"), help="banco da --session")
+    parser.add_argument("--device", help="só este device (--session)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = tempo real, N = N× mais rápido, 0 = sem espera")
+    parser.add_argument("--window", type=float, default=0.2, help="segundos gravados por lote")
+    parser.add_argument("--base-ts", default=None, help="ts da primeira leitura (epoch ou 'now'); padrão: o gravado")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--inprocess", action="store_true", help="aplica no próprio processo (determinístico, benchmark)")
+    parser.add_argument("--clients", type=int, default=0, help="WebSockets em memória (--inprocess)")
+    parser.add_argument("--protocol", default="v2b", choices=("v1", "v2", "v2b"), help="protocolo dos clientes (--inprocess)")
+    parser.add_argument("--json", action="store_true", help="relatório em JSON")
+    args = parser.parse_args()
+    if args.speed < 0 or args.window <= 0:
+        parser.error("--speed deve ser >= 0 e --window > 0")
+
+    try:
+        if args.session is not None:
+            events, name = load_session(args.db, args.session, args.device), f"session:{args.session}"
+        elif args.csv:
+            events, name = load_csv(args.csv), args.csv
+        else:
+            events, name = load_ndjson(args.ndjson), args.ndjson
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if not events:
+        print("❌ Nenhuma leitura na fonte")
+        sys.exit(1)
+
+    base_ts = None
+    if args.base_ts == "now":
+        base_ts = time.time()
+    elif args.base_ts is not None:
+        base_ts = float(args.base_ts)
+
+    async def run():
+        sink = InProcessSink(args.clients, args.protocol) if args.inprocess else HttpSink(args.url)
+        return await replay(events, sink, args.speed, args.window, base_ts)
+
+    report = {"source": name, **asyncio.run(run())}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"✅ {report['readings']} leituras de {report['devices']} bikes ({report['recorded_s']} s gravados) "
+        f"em {report['wall_s']} s: {report['readings_per_s']} leituras/s, "
+        f"{report['cpu_us_per_reading']} µs de CPU por leitura"
+    )
+    if report["sink"] == "http":
+        print(
+            f"   HTTP: {report['ok']} aceitas, {report['rate_limited']} limitadas, "
+            f"{report['duplicates']} duplicatas, {report['errors']} com erro"
+        )
+        if report["rate_limited"]:
+            print("   ⚠️ Leituras acima do limite por bike: rode o backend com INGEST_DEVICE_RATE=0 ou use um --speed menor")
+    else:
+        print(
+            f"   {report['clients']} clientes, {report['frames']} frames; "
+            f"estado final {report['state_digest']} ({report['bikes']} bikes)"
+        )
+
+
+if __name__ == "__main__":
+    main()
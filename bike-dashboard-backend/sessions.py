@@ -0,0 +1,161 @@
+"""
+Sessões de aula e estatísticas agregadas por bike.
+
+Durante uma sessão, cada leitura atualiza os agregados da bike em O(1)
+(somas ponderadas pelo tempo, máximo e tempo em cada zona de potência);
+médias, energia e ranking são derivados desses acumuladores, sem reler o
+histórico. O ranking é enviado pelo WebSocket (frame "leaderboard").
+"""
+
+import time
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+# Limites (W) das zonas de potência: Z1 < 100 ≤ Z2 < 150 ≤ Z3 < 200 ≤ Z4 < 250 ≤ Z5
+POWER_ZONES = (100, 150, 200, 250)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS class_sessions (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        started_at REAL NOT NULL,
+        stopped_at REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_results (
+        session_id INTEGER NOT NULL,
+        device TEXT NOT NULL,
+        student_cpf TEXT,
+        student_name TEXT,
+        elapsed REAL NOT NULL,
+        distance REAL NOT NULL,
+        energy_kj REAL NOT NULL,
+        avg_power REAL NOT NULL,
+        max_power REAL NOT NULL,
+        avg_cadence REAL NOT NULL,
+        zone_times TEXT NOT NULL,
+        PRIMARY KEY (session_id, device),
+        FOREIGN KEY (session_id) REFERENCES class_sessions(id)
+    )
+    """,
+)
+
+
+def init_schema(conn):
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+class BikeAggregate:
+    __slots__ = (
+        "device", "student_cpf", "student_name", "samples", "elapsed", "energy_j",
+        "cadence_integral", "max_power", "distance", "zone_times",
+    )
+
+    def __init__(self, device: str):
+        self.device = device
+        self.student_cpf: Optional[str] = None
+        self.student_name: Optional[str] = None
+        self.samples = 0
+        self.elapsed = 0.0
+        self.energy_j = 0.0
+        self.cadence_integral = 0.0
+        self.max_power = 0.0
+        self.distance = 0.0
+        self.zone_times = [0.0] * (len(POWER_ZONES) + 1)
+
+    def add(self, dt: float, power: float, cadence: float, distance_increment: float,
+            student: Optional[Dict[str, Any]]):
+        """Acumula uma leitura que vale por `dt` segundos (mesmo intervalo da integração da distância)."""
+        self.samples += 1
+        if student is not None:
+            self.student_cpf = student["student_cpf"]
+            self.student_name = student["student_name"]
+        if power > self.max_power:
+            self.max_power = power
+        if dt > 0:
+            self.elapsed += dt
+            self.energy_j += power * dt
+            self.cadence_integral += cadence * dt
+            self.distance += distance_increment
+            self.zone_times[bisect_right(POWER_ZONES, power)] += dt
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "device": self.device,
+            "student_cpf": self.student_cpf,
+            "student_name": self.student_name,
+            "elapsed": round(elapsed, 1),
+            "distance": round(self.distance, 1),
+            "energy_kj": round(self.energy_j / 1000, 2),
+            "avg_power": round(self.energy_j / elapsed, 1) if elapsed else 0.0,
+            "max_power": self.max_power,
+            "avg_cadence": round(self.cadence_integral / elapsed, 1) if elapsed else 0.0,
+            "zone_times": [round(t, 1) for t in self.zone_times],
+        }
+
+    def state(self) -> Dict[str, Any]:
+        """Acumuladores crus (sincronização entre workers, ver cluster.py)."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "BikeAggregate":
+        agg = cls(state["device"])
+        for name in cls.__slots__:
+            setattr(agg, name, state[name])
+        return agg
+
+
+class ClassSession:
+    def __init__(self, name: Optional[str], started_at: Optional[float] = None):
+        self.id: Optional[int] = None
+        self.name = name
+        self.started_at = time.time() if started_at is None else started_at
+        self.stopped_at: Optional[float] = None
+        self.bikes: Dict[str, BikeAggregate] = {}
+        # Incrementado a cada leitura; o broadcaster só reenvia o ranking se mudou
+        self.version = 0
+
+    def record(self, device: str, dt: float, power: float, cadence: float,
+               distance_increment: float, student: Optional[Dict[str, Any]]):
+        """`student` é o vínculo atual da bike (ou None)."""
+        agg = self.bikes.get(device)
+        if agg is None:
+            agg = self.bikes[device] = BikeAggregate(device)
+        agg.add(dt, power, cadence, distance_increment, student)
+        self.version += 1
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            **self.info(),
+            "version": self.version,
+            "bikes": {device: agg.state() for device, agg in self.bikes.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ClassSession":
+        session = cls(state["name"], state["started_at"])
+        session.id = state["id"]
+        session.stopped_at = state["stopped_at"]
+        session.version = state["version"]
+        session.bikes = {device: BikeAggregate.from_state(s) for device, s in state["bikes"].items()}
+        return session
+
+    def leaderboard(self) -> List[Dict[str, Any]]:
+        """Ranking por distância percorrida na sessão."""
+        ranking = [agg.summary() for agg in self.bikes.values()]
+        ranking.sort(key=lambda e: e["distance"], reverse=True)
+        for position, entry in enumerate(ranking, 1):
+            entry["position"] = position
+        return ranking
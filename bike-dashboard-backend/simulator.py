@@ -4,6 +4,7 @@ Simula 5 bicicletas enviando dados aleatórios para o backend.
 """
 
 import requests
+import sys
 import time
 import random
 import json
@@ -11,6 +12,10 @@ from datetime import datetime
 
 # URL do backend
 BACKEND_URL = "http://localhost:8000/api/ftms"
+BATCH_URL = "http://localhost:8000/api/ftms/batch"
+
+# Envia a rodada inteira em um único POST (ative com --batch)
+USE_BATCH = "--batch" in sys.argv
 
 # Configuração das bikes simuladas
 BIKES = [
@@ -62,11 +67,25 @@ def send_bike_data(bike_name):
     except requests.exceptions.RequestException as e:
         print(f"❌ {bike_name}: Falha na conexão - {e}")
 
+def send_round_batch(bikes):
+    """Envia uma leitura de cada bike em um único POST para /api/ftms/batch"""
+    readings = [generate_bike_data(bike) for bike in bikes]
+    try:
+        response = requests.post(BATCH_URL, json={"readings": readings}, timeout=2)
+
+        if response.status_code == 200:
+            ack = response.json()
+            print(f"✅ Lote enviado: {ack['accepted']} leituras, {ack['devices']} bikes")
+        else:
+            print(f"❌ Lote: Erro {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Lote: Falha na conexão - {e}")
+
 def main():
     """Loop principal de simulação"""
     print("🚴 Simulador de Bikes - Abitah Dashboard")
     print("=" * 60)
-    print(f"Backend: {BACKEND_URL}")
+    print(f"Backend: {BATCH_URL if USE_BATCH else BACKEND_URL}")
     print(f"Bikes simuladas: {len(BIKES)}")
     print("=" * 60)
     print("\nPressione Ctrl+C para parar\n")
@@ -78,10 +97,13 @@ def main():
             iteration += 1
             print(f"\n--- Iteração {iteration} - {datetime.now().strftime('%H:%M:%S')} ---")
             
-            # Envia dados de cada bike
-            for bike in BIKES:
-                send_bike_data(bike)
-                time.sleep(0.2)  # Pequeno delay entre bikes
+            if USE_BATCH:
+                send_round_batch(BIKES)
+            else:
+                # Envia dados de cada bike
+                for bike in BIKES:
+                    send_bike_data(bike)
+                    time.sleep(0.2)  # Pequeno delay entre bikes
             
             # Aguarda 2 segundos antes da próxima rodada
             print("\nAguardando 2 segundos...")
@@ -0,0 +1,168 @@
+"""
+Cadastro de alunos: paginação por cursor e busca indexada.
+
+`GET /api/students` lista em ordem de nome. Com `limit` a resposta vem em
+páginas: o cursor `next` guarda (nome, cpf) do último aluno e a página
+seguinte continua a partir dele pelo índice `idx_students_name` (keyset, sem
+OFFSET), então o custo de uma página não depende de quantas vieram antes.
+
+Busca (`q`):
+- só dígitos (a pontuação do CPF é ignorada): prefixo do CPF, pela chave primária;
+- texto: cada palavra de `q` é prefixo de alguma palavra do nome, sem
+  diferenciar maiúsculas nem acentos ("joao sil" encontra "João da Silva"),
+  pelo índice FTS5 `students_fts`, mantido por triggers. Se o SQLite não tiver
+  FTS5, a busca cai para prefixo do nome inteiro (LIKE), sensível a acentos.
+  O índice aponta para o rowid de `students`, que um VACUUM manual pode
+  renumerar; depois de um, reconstrua com
+  `INSERT INTO students_fts(students_fts) VALUES ('rebuild')`.
+
+`fields` limita as colunas devolvidas (ex.: `fields=cpf,name` para um seletor).
+"""
+
+import base64
+import json
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+COLUMNS = ("cpf", "name", "weight", "height", "created_at")
+MAX_LIMIT = 500
+
+SCHEMA = (
+    "CREATE INDEX IF NOT EXISTS idx_students_name ON students(name, cpf)",
+)
+
+FTS_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+        name, content='students', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+        INSERT INTO students_fts(rowid, name) VALUES (new.rowid, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+        INSERT INTO students_fts(students_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF name ON students BEGIN
+        INSERT INTO students_fts(students_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+        INSERT INTO students_fts(rowid, name) VALUES (new.rowid, new.name);
+    END
+    """,
+)
+
+# Definido por init_schema: o SQLite deste processo tem FTS5
+fts_enabled = False
+
+_WORD = re.compile(r"\w+")
+_CPF_PUNCTUATION = re.compile(r"[\s.\-/]")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Índices de `students` (a tabela é criada em main.init_db)."""
+    global fts_enabled
+    for sql in SCHEMA:
+        conn.execute(sql)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone()
+    try:
+        for sql in FTS_SCHEMA:
+            conn.execute(sql)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 indisponível ({e}): busca de alunos por prefixo do nome")
+        fts_enabled = False
+        return
+    if not exists:
+        # Índice novo sobre um cadastro que já pode ter alunos
+        conn.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+    fts_enabled = True
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    if not fields:
+        return COLUMNS
+    names = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in names if f not in COLUMNS]
+    if unknown or not names:
+        raise QueryError(f"campos inválidos: {unknown} (válidos: {list(COLUMNS)})")
+    return names
+
+
+def encode_cursor(name: str, cpf: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, cpf]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        name, cpf = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise QueryError("cursor inválido")
+    if not isinstance(name, str) or not isinstance(cpf, str):
+        raise QueryError("cursor inválido")
+    return name, cpf
+
+
+def _search_clause(q: str) -> Tuple[str, str, List[Any]]:
+    """(FROM, condição, parâmetros) de uma busca."""
+    digits = _CPF_PUNCTUATION.sub("", q)
+    if digits.isascii() and digits.isdigit():
+        # Prefixo do CPF como intervalo na chave primária
+        upper = digits[:-1] + chr(ord(digits[-1]) + 1)
+        return "students s", "s.cpf >= ? AND s.cpf < ?", [digits, upper]
+    words = _WORD.findall(q)
+    if fts_enabled and words:
+        match = " ".join(f'"{w}"*' for w in words)
+        return "students_fts f JOIN students s ON s.rowid = f.rowid", "f.students_fts MATCH ?", [match]
+    prefix = q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "students s", "s.name LIKE ? ESCAPE '\\'", [prefix + "%"]
+
+
+def query(
+    conn: sqlite3.Connection,
+    q: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Sequence[str] = COLUMNS,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Alunos em ordem de (nome, cpf) após o cursor `after`; retorna (linhas,
+    cursor da próxima página ou None). Sem `limit`, todos.
+    """
+    source, conditions, params = "students s", [], []
+    if q and q.strip():
+        source, condition, params = _search_clause(q)
+        conditions.append(condition)
+    if after:
+        conditions.append("(s.name, s.cpf) > (?, ?)")
+        params.extend(decode_cursor(after))
+    # nome e cpf sempre vêm (cursor); saem da resposta se não foram pedidos
+    columns = list(fields) + [c for c in ("name", "cpf") if c not in fields]
+    sql = f"SELECT {', '.join('s.' + c for c in columns)} FROM {source}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY s.name, s.cpf"
+    if limit is not None:
+        # Uma linha a mais diz se há próxima página
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    # Tuplas (sem sqlite3.Row): o dict de cada aluno é montado uma vez, aqui
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(sql, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[columns.index("name")], last[columns.index("cpf")])
+    # zip para nos campos pedidos: as colunas extras ficam de fora
+    return [dict(zip(fields, row)) for row in rows], next_cursor
@@ -0,0 +1,229 @@
+"""
+Assinaturas do WebSocket: quais bikes e quais canais cada cliente recebe.
+
+Por padrão um cliente recebe tudo, como antes. Com mensagens "subscribe" /
+"unsubscribe" (ou parâmetros na URL do `/ws`) ele passa a receber só um
+conjunto de devices, ou uma página da lista de devices em ordem de nome, e
+só os canais que pediu. Clientes com o mesmo conjunto de devices (a mesma
+página, por exemplo) formam um grupo, e o índice device → grupos faz o
+broadcaster tocar apenas os grupos interessados em cada bike alterada: o
+custo do tick acompanha o interesse real, não bikes × clientes, e cada grupo
+recebe um frame serializado uma vez.
+
+Modos de um cliente (mutuamente exclusivos):
+- todas as bikes (`devices` = None);
+- conjunto explícito (`subscribe` acrescenta, `unsubscribe` remove);
+- página (`page`, `per_page`): o conjunto acompanha a lista de devices
+  conhecidos conforme bikes entram e saem.
+
+Cada operação retorna os devices que o cliente passou a receber; quem chama
+envia o estado atual deles (os deltas v2 só valem sobre um estado completo).
+"""
+
+from bisect import bisect_left
+from typing import Any, Collection, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+TELEMETRY = "telemetry"
+STATUS = "status"
+ASSIGNMENTS = "assignments"
+LEADERBOARD = "leaderboard"
+CHANNELS = (TELEMETRY, STATUS, ASSIGNMENTS, LEADERBOARD)
+
+MAX_DEVICES = 1000
+MAX_PER_PAGE = 200
+
+
+class SubscriptionError(ValueError):
+    pass
+
+
+def parse_channels(channels: Any) -> Set[str]:
+    if not isinstance(channels, list) or not all(isinstance(c, str) for c in channels):
+        raise SubscriptionError("channels deve ser uma lista de nomes")
+    unknown = set(channels) - set(CHANNELS)
+    if unknown:
+        raise SubscriptionError(f"canais desconhecidos: {sorted(unknown)} (válidos: {list(CHANNELS)})")
+    return set(channels)
+
+
+def parse_devices(devices: Any) -> Set[str]:
+    if not isinstance(devices, list) or not all(isinstance(d, str) for d in devices):
+        raise SubscriptionError('devices deve ser uma lista de nomes ou "*"')
+    if len(devices) > MAX_DEVICES:
+        raise SubscriptionError(f"no máximo {MAX_DEVICES} devices por cliente")
+    return set(devices)
+
+
+def parse_page(page: Any, per_page: Any) -> Tuple[int, int]:
+    if not isinstance(page, int) or not isinstance(per_page, int) or page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+        raise SubscriptionError(f"page deve ser >= 1 e per_page entre 1 e {MAX_PER_PAGE}")
+    return page, per_page
+
+
+class Group:
+    """Clientes que assinam exatamente o mesmo conjunto de devices."""
+
+    __slots__ = ("devices", "clients")
+
+    def __init__(self, devices: FrozenSet[str]):
+        self.devices = devices
+        self.clients: Set[Any] = set()
+
+
+class SubscriptionIndex:
+    """
+    Estado de assinatura guardado no próprio cliente (`devices`, `page`,
+    `channels`, `group`) e indexado aqui por device, um grupo por conjunto.
+    """
+
+    def __init__(self):
+        self.everything: Set[Any] = set()
+        self.groups: Dict[FrozenSet[str], Group] = {}
+        self.by_device: Dict[str, Set[Group]] = {}
+        # Soma dos tamanhos dos grupos (escolhe o caminho de route)
+        self.indexed = 0
+        self.paged: Set[Any] = set()
+        # Devices existentes, em ordem de nome (base das páginas)
+        self.known: List[str] = []
+
+    # Clientes ---------------------------------------------------------
+    def add(self, client):
+        client.devices = None
+        client.page = None
+        client.group = None
+        client.channels = set(CHANNELS)
+        self.everything.add(client)
+
+    def remove(self, client):
+        self._leave(client)
+        self.everything.discard(client)
+        self.paged.discard(client)
+
+    def _join(self, client, devices: Set[str]):
+        key = frozenset(devices)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = Group(key)
+            self.indexed += len(key)
+            for device in key:
+                groups = self.by_device.get(device)
+                if groups is None:
+                    groups = self.by_device[device] = set()
+                groups.add(group)
+        group.clients.add(client)
+        client.group = group
+
+    def _leave(self, client):
+        group = client.group
+        if group is None:
+            return
+        client.group = None
+        group.clients.discard(client)
+        if group.clients:
+            return
+        del self.groups[group.devices]
+        self.indexed -= len(group.devices)
+        for device in group.devices:
+            groups = self.by_device.get(device)
+            if groups is not None:
+                groups.discard(group)
+                if not groups:
+                    del self.by_device[device]
+
+    def _replace(self, client, devices: Optional[Set[str]], page: Optional[Tuple[int, int]]) -> Set[str]:
+        """Troca o conjunto do cliente; retorna os devices que ele não recebia."""
+        previous = client.devices
+        if previous is None:
+            added: Set[str] = set()
+            self.everything.discard(client)
+        else:
+            added = devices - previous if devices is not None else set(self.known) - previous
+        if devices is None:
+            self._leave(client)
+            self.everything.add(client)
+        elif client.group is None or client.group.devices != devices:
+            self._leave(client)
+            self._join(client, devices)
+        client.devices = devices
+        client.page = page
+        if page is None:
+            self.paged.discard(client)
+        else:
+            self.paged.add(client)
+        return added
+
+    def subscribe_all(self, client) -> Set[str]:
+        return self._replace(client, None, None)
+
+    def subscribe(self, client, devices: Set[str]) -> Set[str]:
+        """Acrescenta devices; vindo do modo "todas" ou de uma página, passa a receber só estes."""
+        if client.devices is None or client.page is not None:
+            return self._replace(client, set(devices), None)
+        if len(client.devices | devices) > MAX_DEVICES:
+            raise SubscriptionError(f"no máximo {MAX_DEVICES} devices por cliente")
+        return self._replace(client, client.devices | devices, None)
+
+    def unsubscribe(self, client, devices: Set[str]):
+        if client.devices is None or client.page is not None:
+            raise SubscriptionError("unsubscribe de devices só vale para um conjunto explícito")
+        self._replace(client, client.devices - devices, None)
+
+    def set_page(self, client, page: int, per_page: int) -> Set[str]:
+        return self._replace(client, self._page(page, per_page), (page, per_page))
+
+    def _page(self, page: int, per_page: int) -> Set[str]:
+        start = (page - 1) * per_page
+        return set(self.known[start:start + per_page])
+
+    # Devices ----------------------------------------------------------
+    def device_added(self, device: str) -> Dict[Any, Set[str]]:
+        """Bike nova: as páginas se deslocam; retorna {cliente: devices que entraram na página}."""
+        index = bisect_left(self.known, device)
+        if index < len(self.known) and self.known[index] == device:
+            return {}
+        self.known.insert(index, device)
+        return self._repage()
+
+    def device_removed(self, device: str) -> Dict[Any, Set[str]]:
+        index = bisect_left(self.known, device)
+        if index == len(self.known) or self.known[index] != device:
+            return {}
+        del self.known[index]
+        return self._repage()
+
+    def reset_devices(self, devices: Iterable[str]) -> Dict[Any, Set[str]]:
+        self.known = sorted(devices)
+        return self._repage()
+
+    def _repage(self) -> Dict[Any, Set[str]]:
+        changes = {}
+        for client in self.paged:
+            added = self._replace(client, self._page(*client.page), client.page)
+            if added:
+                changes[client] = added
+        return changes
+
+    # Roteamento -------------------------------------------------------
+    def route(self, devices: Collection[str]) -> Dict[Group, Collection[str]]:
+        """
+        {grupo: devices de `devices` que ele assina}, pelo índice device →
+        grupos. Quando o tick tem tantos devices quanto os grupos somados
+        (páginas cobrindo a lista toda, por exemplo), filtrar não compensa:
+        vai o conjunto inteiro de cada grupo e quem monta o frame descarta os
+        devices sem mudança no tick.
+        """
+        if self.indexed <= len(devices):
+            return {group: group.devices for group in self.groups.values()}
+        routed: Dict[Group, List[str]] = {}
+        by_device = self.by_device
+        for device in devices:
+            groups = by_device.get(device)
+            if not groups:
+                continue
+            for group in groups:
+                names = routed.get(group)
+                if names is None:
+                    routed[group] = [device]
+                else:
+                    names.append(device)
+        return routed
@@ -0,0 +1,285 @@
+"""
+Gravação da telemetria de cada bike (série temporal por sessão de aula).
+
+Cada leitura aplicada em `apply_reading` é anexada a um buffer colunar em
+memória (um `array('d')` por coluna, por device/aluno) — O(1), sem I/O no
+caminho do POST. Uma task de fundo grava os buffers periodicamente como
+blocos na tabela `telemetry_blocks`: uma linha por bloco, com cada coluna
+empacotada em um BLOB (float64 little-endian). Assim, 1 kHz de leituras vira
+poucas inserções por segundo, feitas na thread de escrita do `Database`.
+
+Se o banco não acompanhar, o total em memória fica limitado a `max_pending`
+amostras; o excedente é descartado e contado em `dropped`.
+"""
+
+import asyncio
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import Database
+
+COLUMNS = ("ts", "power", "cadence", "speed", "distance")
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS telemetry_blocks (
+        id INTEGER PRIMARY KEY,
+        device TEXT NOT NULL,
+        student_cpf TEXT,
+        t_start REAL NOT NULL,
+        t_end REAL NOT NULL,
+        n INTEGER NOT NULL,
+        ts BLOB NOT NULL,
+        power BLOB NOT NULL,
+        cadence BLOB NOT NULL,
+        speed BLOB NOT NULL,
+        distance BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_telemetry_device ON telemetry_blocks (device, t_start)",
+    "CREATE INDEX IF NOT EXISTS idx_telemetry_student ON telemetry_blocks (student_cpf, t_start)",
+)
+
+Key = Tuple[str, Optional[str]]
+
+
+def init_schema(conn):
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+def _pack(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array("d", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    values = array("d")
+    values.frombytes(blob)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class _Buffer:
+    __slots__ = COLUMNS
+
+    def __init__(self):
+        for column in COLUMNS:
+            setattr(self, column, array("d"))
+
+    def __len__(self):
+        return len(self.ts)
+
+
+class TelemetryRecorder:
+    def __init__(
+        self,
+        db: Database,
+        flush_interval: float = 1.0,
+        block_size: int = 4096,
+        max_pending: int = 200_000,
+    ):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.block_size = block_size
+        self.max_pending = max_pending
+        self.buffers: Dict[Key, _Buffer] = {}
+        self.pending = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.blocks_written = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def record(
+        self,
+        device: str,
+        student_cpf: Optional[str],
+        ts: float,
+        power: float,
+        cadence: float,
+        speed: float,
+        distance: float,
+    ):
+        if self.pending >= self.max_pending:
+            self.dropped += 1
+            return
+        buf = self.buffers.get((device, student_cpf))
+        if buf is None:
+            buf = self.buffers[(device, student_cpf)] = _Buffer()
+        buf.ts.append(ts)
+        buf.power.append(power)
+        buf.cadence.append(cadence)
+        buf.speed.append(speed)
+        buf.distance.append(distance)
+        self.pending += 1
+        self.recorded += 1
+        if self.pending >= self.block_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take_blocks(self) -> List[tuple]:
+        buffers, self.buffers = self.buffers, {}
+        self.pending = 0
+        return [
+            (device, cpf, buf.ts[0], buf.ts[-1], len(buf), *(_pack(getattr(buf, c)) for c in COLUMNS))
+            for (device, cpf), buf in buffers.items()
+            if len(buf)
+        ]
+
+    async def flush(self):
+        blocks = self._take_blocks()
+        if not blocks:
+            return
+        def write(conn):
+            # Sem retornar o cursor: liberado no event loop, ele resetaria o
+            # statement em cache enquanto a thread de escrita ainda o usa
+            conn.executemany(
+                """
+                INSERT INTO telemetry_blocks
+                    (device, student_cpf, t_start, t_end, n, ts, power, cadence, speed, distance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                blocks,
+            )
+
+        await self.db.transaction(write)
+        self.blocks_written += len(blocks)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Falha ao gravar telemetria: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "pending": self.pending,
+            "dropped": self.dropped,
+            "blocks_written": self.blocks_written,
+        }
+
+    async def load(
+        self,
+        device: Optional[str] = None,
+        student_cpf: Optional[str] = None,
+        start: float = 0.0,
+        end: float = float("inf"),
+    ) -> List[Dict[str, Any]]:
+        """
+        Amostras gravadas no intervalo [start, end], agrupadas por device/aluno.
+        Cada coluna volta como `array('d')` (pode ser lida com `np.frombuffer`).
+        """
+        return await self.db.read(lambda conn: read_series(conn, device, student_cpf, start, end))
+
+    async def query(
+        self,
+        device: Optional[str] = None,
+        student_cpf: Optional[str] = None,
+        start: float = 0.0,
+        end: float = float("inf"),
+        bucket: float = 0.0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Séries por device/aluno no intervalo [start, end]. Com `bucket` > 0,
+        reduz para uma amostra por janela de `bucket` segundos (média de
+        potência, cadência e velocidade; última distância).
+        """
+        result = await self.load(device, student_cpf, start, end)
+        if bucket > 0:
+            return [downsample(s, bucket) for s in result]
+        return [{k: (v.tolist() if isinstance(v, array) else v) for k, v in s.items()} for s in result]
+
+
+def read_series(
+    conn,
+    device: Optional[str] = None,
+    student_cpf: Optional[str] = None,
+    start: float = 0.0,
+    end: float = float("inf"),
+) -> List[Dict[str, Any]]:
+    """`TelemetryRecorder.load` numa conexão síncrona (ex.: `replay.py` lendo o banco direto)."""
+    where = ["t_end >= ?", "t_start <= ?"]
+    params: List[Any] = [start, end if end != float("inf") else 1e300]
+    if device is not None:
+        where.append("device = ?")
+        params.append(device)
+    if student_cpf is not None:
+        where.append("student_cpf = ?")
+        params.append(student_cpf)
+    sql = (
+        "SELECT device, student_cpf, t_start, t_end, ts, power, cadence, speed, distance "
+        f"FROM telemetry_blocks WHERE {' AND '.join(where)} ORDER BY t_start"
+    )
+
+    series: Dict[Key, Dict[str, Any]] = {}
+    for row in conn.execute(sql, params):
+        key = (row["device"], row["student_cpf"])
+        out = series.get(key)
+        if out is None:
+            out = series[key] = {"device": key[0], "student_cpf": key[1]}
+            for c in COLUMNS:
+                out[c] = array("d")
+        cols = [_unpack(row[c]) for c in COLUMNS]
+        if start <= row["t_start"] and row["t_end"] <= end:
+            # Bloco inteiro no intervalo
+            for c, values in zip(COLUMNS, cols):
+                out[c].extend(values)
+            continue
+        for i, t in enumerate(cols[0]):
+            if start <= t <= end:
+                for c, values in zip(COLUMNS, cols):
+                    out[c].append(values[i])
+    return list(series.values())
+
+
+def downsample(series: Dict[str, Any], bucket: float) -> Dict[str, Any]:
+    out = {k: v for k, v in series.items() if k not in COLUMNS}
+    for c in COLUMNS:
+        out[c] = []
+    current = None
+    n = 0
+    sums = [0.0, 0.0, 0.0]
+    last_distance = 0.0
+    first_ts = 0.0
+
+    def emit():
+        out["ts"].append(first_ts)
+        out["power"].append(sums[0] / n)
+        out["cadence"].append(sums[1] / n)
+        out["speed"].append(sums[2] / n)
+        out["distance"].append(last_distance)
+
+    for t, p, c, s, d in zip(*(series[c] for c in COLUMNS)):
+        key = int(t // bucket)
+        if key != current:
+            if n:
+                emit()
+            current, n, sums, first_ts = key, 0, [0.0, 0.0, 0.0], key * bucket
+        n += 1
+        sums[0] += p
+        sums[1] += c
+        sums[2] += s
+        last_distance = d
+    if n:
+        emit()
+    return out
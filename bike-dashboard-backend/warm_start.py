@@ -0,0 +1,195 @@
+"""
+Retomada rápida: cópia periódica do estado ao vivo em disco, restaurada na inicialização.
+
+O estado ao vivo (registros das bikes com a distância acumulada, agregados da
+aula em andamento) só existe em memória. A cada `interval` segundos, se algo
+mudou, ele é copiado e gravado em `path`; ao reiniciar, o servidor carrega a
+cópia antes de aceitar conexões, e os dashboards que reconectam recebem as
+bikes de volta no frame "initial".
+
+Custo limitado qualquer que seja o número de bikes:
+- o estado é serializado no event loop em trechos de `chunk` bikes (um
+  `json.dumps` por trecho), cedendo o loop entre eles: uma parada nunca passa
+  de um trecho. Cada trecho vira logo uma string, e nenhum objeto da cópia
+  sobrevive para pesar na coleta de lixo (com 10 mil bikes, guardar listas e
+  dicts até a gravação fazia o GC parar o loop por ~40 ms);
+- a gravação e o fsync rodam numa thread;
+- o arquivo é escrito ao lado (`.tmp`), sincronizado (fsync) e renomeado por
+  cima do anterior: quem lê encontra a cópia anterior ou a nova, inteiras.
+
+Formato (uma linha JSON por trecho):
+
+    {"format": 1, "saved_at": ..., "bike_fields": [...], "session": {...} | null}
+    {"bikes": [[valores de BikeRecord.state()], ...]}
+    {"session_bikes": {device: BikeAggregate.state(), ...}}
+
+`load` devolve o estado no formato de `main.state_snapshot()` (o mesmo da
+sincronização entre workers, ver cluster.py). Uma cópia de outra versão do
+layout dos registros é ignorada.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from live_state import STATE_FIELDS
+
+FORMAT = 1
+
+# capture(chunk) → {"session": estado da aula sem "bikes" | None, "lines": [trechos em JSON]}
+Capture = Callable[[int], Awaitable[Dict[str, Any]]]
+
+
+class WarmStart:
+    def __init__(
+        self,
+        path: str,
+        interval: float,
+        capture: Capture,
+        version: Callable[[], Any],
+        should_write: Callable[[], bool] = lambda: True,
+        chunk: int = 200,
+    ):
+        self.path = path
+        self.interval = interval
+        self.capture = capture
+        # Marcador de mudança: igual ao da última cópia → nada a gravar
+        self.version = version
+        # Com vários workers, só um grava (ver main.py)
+        self.should_write = should_write
+        self.chunk = chunk
+        self.saved_version: Any = None
+        self.snapshots_written = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_bytes = 0
+        self.last_capture_ms = 0.0
+        self.last_write_ms = 0.0
+        self.last_saved_at: Optional[float] = None
+        self.restored: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    # Restauração --------------------------------------------------------
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Estado gravado (formato de state_snapshot), ou None se não houver cópia válida."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("format") != FORMAT or header.get("bike_fields") != list(STATE_FIELDS):
+                    print(f"⚠️ Cópia do estado em {self.path} é de outra versão: ignorada")
+                    return None
+                bikes: List[List[Any]] = []
+                session = header["session"]
+                if session is not None:
+                    session["bikes"] = {}
+                for line in f:
+                    part = json.loads(line)
+                    bikes.extend(part.get("bikes", ()))
+                    if session is not None:
+                        session["bikes"].update(part.get("session_bikes", {}))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            print(f"⚠️ Cópia do estado em {self.path} ilegível ({e}): ignorada")
+            return None
+        last_seen = STATE_FIELDS.index("last_seen")
+        self.restored = {
+            "saved_at": header["saved_at"],
+            "bikes": len(bikes),
+            "session": session["id"] if session is not None else None,
+        }
+        return {
+            "bikes": bikes,
+            "last_seen": {values[0]: values[last_seen] for values in bikes},
+            "session": session,
+            "saved_at": header["saved_at"],
+        }
+
+    # Gravação -----------------------------------------------------------
+    async def save(self) -> bool:
+        """Serializa o estado (no loop, em trechos) e grava numa thread; False se nada mudou."""
+        version = self.version()
+        if version == self.saved_version:
+            self.skipped += 1
+            return False
+        start = time.perf_counter()
+        state = await self.capture(self.chunk)
+        self.last_capture_ms = (time.perf_counter() - start) * 1000
+        header = {
+            "format": FORMAT,
+            "saved_at": time.time(),
+            "bike_fields": list(STATE_FIELDS),
+            "session": state["session"],
+        }
+        start = time.perf_counter()
+        self._writing = asyncio.get_running_loop().run_in_executor(None, self._write, header, state["lines"])
+        try:
+            self.last_bytes = await self._writing
+        except OSError as e:
+            self.errors += 1
+            print(f"⚠️ Falha ao gravar a cópia do estado em {self.path}: {e}")
+            return False
+        self.last_write_ms = (time.perf_counter() - start) * 1000
+        self.saved_version = version
+        self.last_saved_at = header["saved_at"]
+        self.snapshots_written += 1
+        return True
+
+    def _write(self, header: Dict[str, Any], lines: List[str]) -> int:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for line in lines:
+                f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, self.path)
+        return size
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.should_write():
+                continue
+            try:
+                await self.save()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Erro na cópia do estado: {e}")
+
+    def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Para a task e grava uma última cópia (reinício planejado não perde nada)."""
+        if self._task:
+            self._task.cancel()
+        if self._writing is not None and not self._writing.done():
+            # A thread não é interrompida pelo cancelamento: espera ela terminar
+            await asyncio.wait([self._writing])
+        if self.enabled and self.should_write():
+            await self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "interval": self.interval,
+            "snapshots_written": self.snapshots_written,
+            "skipped_unchanged": self.skipped,
+            "errors": self.errors,
+            "last_saved_at": self.last_saved_at,
+            "last_bytes": self.last_bytes,
+            "last_capture_ms": round(self.last_capture_ms, 3),
+            "last_write_ms": round(self.last_write_ms, 3),
+            "restored": self.restored,
+        }
@@ -1,13 +1,15 @@
-import { useState, useEffect, useCallback } from 'react'
+import { useState, useEffect, useCallback, useRef } from 'react'
 import Header from './components/Header'
 import BikeGrid from './components/BikeGrid'
 import Pagination from './components/Pagination'
 import StudentRegistrationModal from './components/StudentRegistrationModal'
 import StudentSelectModal from './components/StudentSelectModal'
+import Leaderboard from './components/Leaderboard'
 import useWebSocket from './hooks/useWebSocket'
+import { createDecoder } from './utils/wsProtocol'
 
-// URL do backend
-const WS_URL = 'ws://localhost:8000/ws'
+// URL do backend (v=2&enc=binary: deltas em frames binários; sem parâmetros: JSON v1)
+const WS_URL = 'ws://localhost:8000/ws?v=2&enc=binary'
 const API_URL = 'http://localhost:8000'
 
 // Número de bikes por página
@@ -15,54 +17,100 @@ const BIKES_PER_PAGE = 10
 
 function App() {
   const [bikes, setBikes] = useState({})
+  // Estado de cada bike calculado no backend: active | idle | offline
+  const [statuses, setStatuses] = useState({})
   const [assignments, setAssignments] = useState({})
+  const [leaderboard, setLeaderboard] = useState(null)
   const [currentPage, setCurrentPage] = useState(1)
-  const { isConnected, lastMessage } = useWebSocket(WS_URL)
+  const decoder = useRef(createDecoder())
+  // Versão dos vínculos já recebida: ao reconectar o backend não os reenvia
+  const assignmentsVersion = useRef('')
+  // Página assinada no backend: só as bikes dela recebem telemetria
+  const pageRef = useRef(1)
+  const subscribedPage = useRef(null)
+
+  const handleMessage = useCallback((raw) => {
+    try {
+      const data = decoder.current.decode(raw)
+      if (!data) return
+
+      if (data.type === 'initial') {
+        setBikes(data.bikes || {})
+        if (data.assignments) setAssignments(data.assignments)
+        assignmentsVersion.current = data.assignments_version || ''
+        setLeaderboard(data.leaderboard || null)
+        setStatuses(data.status || {})
+      } else if (data.type === 'snapshot') {
+        setBikes(data.bikes || {})
+        setStatuses(data.status || {})
+      } else if (data.type === 'delta') {
+        // Um frame por tick do backend com todas as bikes alteradas
+        setBikes(prev => ({
+          ...prev,
+          ...data.bikes
+        }))
+        if (data.status) setStatuses(data.status)
+      } else if (data.type === 'status') {
+        // Só as mudanças de estado; "evicted" = bike removida pelo backend
+        const evicted = Object.keys(data.devices).filter(d => data.devices[d] === 'evicted')
+        setStatuses(prev => {
+          const next = { ...prev, ...data.devices }
+          evicted.forEach(d => delete next[d])
+          return next
+        })
+        if (evicted.length > 0) {
+          setBikes(prev => {
+            const next = { ...prev }
+            evicted.forEach(d => delete next[d])
+            return next
+          })
+        }
+      } else if (data.type === 'assignments') {
+        setAssignments(data.assignments || {})
+        assignmentsVersion.current = data.version || ''
+      } else if (data.type === 'leaderboard') {
+        setLeaderboard({ session: data.session, ranking: data.ranking })
+      } else if (data.type === 'error') {
+        console.error('Erro do WebSocket:', data.detail)
+      }
+    } catch (error) {
+      console.error('Erro ao processar mensagem WebSocket:', error)
+    }
+  }, [])
+
+  const wsUrl = useCallback(() => {
+    subscribedPage.current = pageRef.current
+    return `${WS_URL}&av=${encodeURIComponent(assignmentsVersion.current)}` +
+      `&page=${pageRef.current}&per_page=${BIKES_PER_PAGE}`
+  }, [])
+  const { isConnected, send } = useWebSocket(wsUrl, handleMessage)
+
+  // Troca de página: o backend passa a enviar as bikes da nova página
+  useEffect(() => {
+    pageRef.current = currentPage
+    if (!isConnected || subscribedPage.current === currentPage) return
+    if (send(JSON.stringify({ type: 'subscribe', page: currentPage, per_page: BIKES_PER_PAGE }))) {
+      subscribedPage.current = currentPage
+    }
+  }, [currentPage, isConnected, send])
 
   // Modais
   const [studentModalOpen, setStudentModalOpen] = useState(false)
   const [selectModalOpen, setSelectModalOpen] = useState(false)
   const [selectedDevice, setSelectedDevice] = useState(null)
 
-  useEffect(() => {
-    if (lastMessage) {
-      try {
-        const data = JSON.parse(lastMessage)
-        
-        if (data.type === 'initial') {
-          setBikes(data.bikes || {})
-          setAssignments(data.assignments || {})
-        } else if (data.type === 'update') {
-          setBikes(prev => ({
-            ...prev,
-            [data.device]: data.data
-          }))
-        } else if (data.type === 'assignments') {
-          setAssignments(data.assignments || {})
-        }
-      } catch (error) {
-        console.error('Erro ao processar mensagem WebSocket:', error)
-      }
-    }
-  }, [lastMessage])
-
-  const activeBikesCount = Object.values(bikes).filter(bike => {
-    if (!bike.last_update) return false
-    const lastUpdate = new Date(bike.last_update)
-    const now = new Date()
-    return (now - lastUpdate) < 10000
-  }).length
-
-  // Paginação
-  const bikeArray = Object.values(bikes)
-  const totalPages = Math.ceil(bikeArray.length / BIKES_PER_PAGE)
+  const activeBikesCount = Object.values(statuses).filter(s => s === 'active').length
+
+  // Paginação: todas as bikes têm status; telemetria só chega das bikes da
+  // página assinada, na mesma ordem de nome usada pelo backend
+  const deviceNames = Object.keys(statuses).sort()
+  const totalPages = Math.ceil(deviceNames.length / BIKES_PER_PAGE)
   const startIndex = (currentPage - 1) * BIKES_PER_PAGE
   const endIndex = startIndex + BIKES_PER_PAGE
-  const currentBikes = bikeArray.slice(startIndex, endIndex)
 
   const paginatedBikes = {}
-  currentBikes.forEach(bike => {
-    paginatedBikes[bike.device] = bike
+  deviceNames.slice(startIndex, endIndex).forEach(device => {
+    if (bikes[device]) paginatedBikes[device] = bikes[device]
   })
 
   useEffect(() => {
@@ -87,19 +135,44 @@ function App() {
     }
   }
 
+  // Sessão de aula (o ranking chega pelo WebSocket)
+  const sessionActive = Boolean(leaderboard && !leaderboard.session?.stopped_at)
+
+  const handleStartSession = async () => {
+    try {
+      await fetch(`${API_URL}/api/sessions/start`, { method: 'POST' })
+    } catch (err) {
+      console.error('Erro ao iniciar aula:', err)
+    }
+  }
+
+  const handleStopSession = async () => {
+    try {
+      await fetch(`${API_URL}/api/sessions/stop`, { method: 'POST' })
+    } catch (err) {
+      console.error('Erro ao encerrar aula:', err)
+    }
+  }
+
   return (
     <div className="min-h-screen">
       <Header 
-        totalBikes={Object.keys(bikes).length}
+        totalBikes={deviceNames.length}
         activeBikes={activeBikesCount}
         isConnected={isConnected}
         onOpenStudentModal={() => setStudentModalOpen(true)}
         onResetAssignments={handleResetAssignments}
+        sessionActive={sessionActive}
+        onStartSession={handleStartSession}
+        onStopSession={handleStopSession}
       />
       <main className="container mx-auto px-4 py-8">
+        <Leaderboard leaderboard={leaderboard} />
+
         <BikeGrid
           bikes={paginatedBikes}
           assignments={assignments}
+          statuses={statuses}
           onClickBike={handleClickBike}
         />
         
@@ -108,9 +181,9 @@ function App() {
             currentPage={currentPage}
             totalPages={totalPages}
             onPageChange={setCurrentPage}
-            totalBikes={bikeArray.length}
+            totalBikes={deviceNames.length}
             startIndex={startIndex + 1}
-            endIndex={Math.min(endIndex, bikeArray.length)}
+            endIndex={Math.min(endIndex, deviceNames.length)}
           />
         )}
       </main>
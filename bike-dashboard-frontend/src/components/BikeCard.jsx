@@ -7,16 +7,8 @@ import {
 } from 'lucide-react'
 import { useEffect } from 'react'
 
-const BikeCard = ({ bike, assignment, onClickBike }) => {
-  // Verifica se a bike está ativa (recebeu dados nos últimos 10 segundos)
-  const isActive = () => {
-    if (!bike.last_update) return false
-    const lastUpdate = new Date(bike.last_update)
-    const now = new Date()
-    return (now - lastUpdate) < 10000
-  }
-
-  const active = isActive()
+// `active`: estado calculado no backend (leituras nos últimos IDLE_AFTER segundos)
+const BikeCard = ({ bike, assignment, active, onClickBike }) => {
 
   // Retorna o nome da bike
   const getBikeName = () => {
@@ -1,6 +1,6 @@
 import BikeCard from './BikeCard'
 
-const BikeGrid = ({ bikes, assignments, onClickBike }) => {
+const BikeGrid = ({ bikes, assignments, statuses, onClickBike }) => {
   const bikeArray = Object.values(bikes)
 
   if (bikeArray.length === 0) {
@@ -26,6 +26,7 @@ const BikeGrid = ({ bikes, assignments, onClickBike }) => {
           key={bike.device}
           bike={bike}
           assignment={assignments?.[bike.device] || null}
+          active={statuses?.[bike.device] === 'active'}
           onClickBike={onClickBike}
         />
       ))}
@@ -1,6 +1,15 @@
-import { Activity, Wifi, WifiOff, UserPlus, RotateCcw } from 'lucide-react'
+import { Activity, Wifi, WifiOff, UserPlus, RotateCcw, Play, Square } from 'lucide-react'
 
-const Header = ({ totalBikes, activeBikes, isConnected, onOpenStudentModal, onResetAssignments }) => {
+const Header = ({
+  totalBikes,
+  activeBikes,
+  isConnected,
+  onOpenStudentModal,
+  onResetAssignments,
+  sessionActive,
+  onStartSession,
+  onStopSession,
+}) => {
   const handleReset = () => {
     if (confirm('Deseja realmente desvincular todos os alunos das bikes?\nIsso é útil ao trocar de turma.')) {
       onResetAssignments?.()
@@ -43,6 +52,25 @@ const Header = ({ totalBikes, activeBikes, isConnected, onOpenStudentModal, onRe
                 <RotateCcw className="w-4 h-4 text-red-400" />
                 <span className="text-gray-300 hidden sm:inline">Resetar Vínculos</span>
               </button>
+              {sessionActive ? (
+                <button
+                  onClick={onStopSession}
+                  className="flex items-center gap-2 px-3 py-2 rounded-lg bg-dark-800 border border-dark-700 hover:border-red-500/50 hover:bg-dark-700 transition-all text-sm"
+                  title="Encerrar a aula e salvar o ranking"
+                >
+                  <Square className="w-4 h-4 text-red-400" />
+                  <span className="text-gray-300 hidden sm:inline">Encerrar Aula</span>
+                </button>
+              ) : (
+                <button
+                  onClick={onStartSession}
+                  className="flex items-center gap-2 px-3 py-2 rounded-lg bg-dark-800 border border-dark-700 hover:border-primary-500/50 hover:bg-dark-700 transition-all text-sm"
+                  title="Iniciar aula (zera as distâncias)"
+                >
+                  <Play className="w-4 h-4 text-primary-400" />
+                  <span className="text-gray-300 hidden sm:inline">Iniciar Aula</span>
+                </button>
+              )}
             </div>
           </div>
 
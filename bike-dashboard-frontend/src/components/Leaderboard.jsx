@@ -0,0 +1,65 @@
+import { Trophy } from 'lucide-react'
+
+// Ranking da aula calculado no backend (frame "leaderboard" do WebSocket)
+const Leaderboard = ({ leaderboard }) => {
+  if (!leaderboard) return null
+
+  const { session, ranking } = leaderboard
+  const finished = Boolean(session?.stopped_at)
+
+  const getBikeName = (device) => {
+    const numbers = device?.match(/\d+/)
+    return numbers ? `Bike ${numbers[0]}` : device
+  }
+
+  return (
+    <div className="card-bike mb-6">
+      <div className="flex items-center justify-between mb-4">
+        <div className="flex items-center gap-2">
+          <Trophy className="w-5 h-5 text-primary-500" />
+          <h2 className="text-lg font-bold text-white">
+            {session?.name || 'Aula'}
+          </h2>
+        </div>
+        <span className={`text-xs font-medium ${finished ? 'text-gray-500' : 'text-green-400'}`}>
+          {finished ? 'Encerrada' : 'Em andamento'}
+        </span>
+      </div>
+
+      {ranking.length === 0 ? (
+        <p className="text-gray-500 text-sm">Aguardando leituras das bikes...</p>
+      ) : (
+        <div className="overflow-x-auto">
+          <table className="w-full text-sm">
+            <thead>
+              <tr className="text-left metric-label">
+                <th className="py-1 pr-3">#</th>
+                <th className="py-1 pr-3">Aluno</th>
+                <th className="py-1 pr-3 text-right">Distância</th>
+                <th className="py-1 pr-3 text-right">Pot. média</th>
+                <th className="py-1 pr-3 text-right">Pot. máx.</th>
+                <th className="py-1 pr-3 text-right">Cad. média</th>
+                <th className="py-1 text-right">Energia</th>
+              </tr>
+            </thead>
+            <tbody>
+              {ranking.map((r) => (
+                <tr key={r.device} className="border-t border-dark-700 text-gray-300">
+                  <td className="py-1 pr-3 font-bold text-primary-400">{r.position}</td>
+                  <td className="py-1 pr-3 truncate">{r.student_name || getBikeName(r.device)}</td>
+                  <td className="py-1 pr-3 text-right">{(r.distance / 1000).toFixed(2)} km</td>
+                  <td className="py-1 pr-3 text-right">{r.avg_power.toFixed(0)} W</td>
+                  <td className="py-1 pr-3 text-right">{Number(r.max_power).toFixed(0)} W</td>
+                  <td className="py-1 pr-3 text-right">{r.avg_cadence.toFixed(0)} rpm</td>
+                  <td className="py-1 text-right">{r.energy_kj.toFixed(1)} kJ</td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        </div>
+      )}
+    </div>
+  )
+}
+
+export default Leaderboard
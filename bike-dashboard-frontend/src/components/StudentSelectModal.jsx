@@ -1,8 +1,12 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { X, User, UserPlus, Search, AlertCircle } from 'lucide-react'
 
 const API_URL = 'http://localhost:8000'
 
+// Busca feita no backend (nome sem acento ou CPF), em páginas
+const PAGE_SIZE = 50
+const SEARCH_DELAY_MS = 250
+
 const formatCPF = (cpf) => {
   const d = cpf.replace(/\D/g, '')
   if (d.length !== 11) return cpf
@@ -11,28 +15,43 @@ const formatCPF = (cpf) => {
 
 const StudentSelectModal = ({ isOpen, onClose, device, currentAssignment, onOpenRegister }) => {
   const [students, setStudents] = useState([])
+  const [next, setNext] = useState(null)
   const [search, setSearch] = useState('')
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
+  // Respostas de buscas anteriores que chegam atrasadas são ignoradas
+  const requestId = useRef(0)
 
   useEffect(() => {
     if (isOpen) {
-      fetchStudents()
       setSearch('')
       setError('')
     }
   }, [isOpen])
 
-  const fetchStudents = async () => {
+  // Nova busca a cada alteração do texto (com um pequeno atraso)
+  useEffect(() => {
+    if (!isOpen) return
+    const timer = setTimeout(() => fetchStudents(search, null), search ? SEARCH_DELAY_MS : 0)
+    return () => clearTimeout(timer)
+  }, [isOpen, search])
+
+  const fetchStudents = async (q, after) => {
+    const id = ++requestId.current
     setLoading(true)
     try {
-      const res = await fetch(`${API_URL}/api/students`)
+      const params = new URLSearchParams({ limit: PAGE_SIZE, fields: 'cpf,name,weight,height' })
+      if (q.trim()) params.set('q', q.trim())
+      if (after) params.set('after', after)
+      const res = await fetch(`${API_URL}/api/students?${params}`)
       const data = await res.json()
-      setStudents(data.students || [])
+      if (id !== requestId.current) return
+      setStudents(prev => (after ? [...prev, ...(data.students || [])] : data.students || []))
+      setNext(data.next || null)
     } catch {
-      setError('Erro ao carregar alunos')
+      if (id === requestId.current) setError('Erro ao carregar alunos')
     }
-    setLoading(false)
+    if (id === requestId.current) setLoading(false)
   }
 
   const handleAssign = async (cpf) => {
@@ -58,12 +77,6 @@ const StudentSelectModal = ({ isOpen, onClose, device, currentAssignment, onOpen
     }
   }
 
-  const filtered = students.filter(
-    (s) =>
-      s.name.toLowerCase().includes(search.toLowerCase()) ||
-      s.cpf.includes(search.replace(/\D/g, ''))
-  )
-
   const bikeName = (() => {
     if (!device) return 'Bike'
     const nums = device.match(/\d+/)
@@ -124,11 +137,11 @@ const StudentSelectModal = ({ isOpen, onClose, device, currentAssignment, onOpen
 
         {/* Lista */}
         <div className="flex-1 overflow-y-auto p-5">
-          {loading ? (
+          {loading && students.length === 0 ? (
             <div className="flex items-center justify-center py-8">
               <div className="w-6 h-6 border-2 border-primary-500 border-t-transparent rounded-full animate-spin" />
             </div>
-          ) : students.length === 0 ? (
+          ) : students.length === 0 && !search.trim() ? (
             <div className="text-center py-8">
               <AlertCircle className="w-10 h-10 text-yellow-500 mx-auto mb-3" />
               <p className="text-gray-300 text-sm font-semibold mb-1">Nenhum aluno cadastrado</p>
@@ -146,11 +159,11 @@ const StudentSelectModal = ({ isOpen, onClose, device, currentAssignment, onOpen
                 Cadastrar Aluno
               </button>
             </div>
-          ) : filtered.length === 0 ? (
+          ) : students.length === 0 ? (
             <p className="text-gray-500 text-sm text-center py-6">Nenhum aluno encontrado</p>
           ) : (
             <div className="space-y-2">
-              {filtered.map((s) => {
+              {students.map((s) => {
                 const isCurrentStudent = currentAssignment?.student_cpf === s.cpf
                 return (
                   <button
@@ -180,6 +193,15 @@ const StudentSelectModal = ({ isOpen, onClose, device, currentAssignment, onOpen
                   </button>
                 )
               })}
+              {next && (
+                <button
+                  onClick={() => fetchStudents(search, next)}
+                  disabled={loading}
+                  className="w-full text-sm text-gray-400 hover:text-white py-2 transition-colors"
+                >
+                  {loading ? 'Carregando...' : 'Carregar mais'}
+                </button>
+              )}
             </div>
           )}
         </div>
@@ -1,14 +1,21 @@
 import { useState, useEffect, useRef, useCallback } from 'react'
 
-const useWebSocket = (url) => {
+// onMessage (opcional) é chamado para cada mensagem, sem passar pelo estado do
+// React: no protocolo de deltas nenhuma mensagem pode ser perdida entre renders.
+// url pode ser uma função, chamada a cada (re)conexão.
+// send(data) envia se a conexão estiver aberta e retorna se enviou.
+const useWebSocket = (url, onMessage) => {
   const [isConnected, setIsConnected] = useState(false)
   const [lastMessage, setLastMessage] = useState(null)
   const ws = useRef(null)
   const reconnectTimeout = useRef(null)
+  const onMessageRef = useRef(onMessage)
+  onMessageRef.current = onMessage
 
   const connect = useCallback(() => {
     try {
-      ws.current = new WebSocket(url)
+      ws.current = new WebSocket(typeof url === 'function' ? url() : url)
+      ws.current.binaryType = 'arraybuffer'
 
       ws.current.onopen = () => {
         console.log('WebSocket conectado')
@@ -16,7 +23,11 @@ const useWebSocket = (url) => {
       }
 
       ws.current.onmessage = (event) => {
-        setLastMessage(event.data)
+        if (onMessageRef.current) {
+          onMessageRef.current(event.data)
+        } else {
+          setLastMessage(event.data)
+        }
       }
 
       ws.current.onerror = (error) => {
@@ -65,7 +76,13 @@ const useWebSocket = (url) => {
     return () => clearInterval(interval)
   }, [isConnected])
 
-  return { isConnected, lastMessage }
+  const send = useCallback((data) => {
+    if (ws.current?.readyState !== WebSocket.OPEN) return false
+    ws.current.send(data)
+    return true
+  }, [])
+
+  return { isConnected, lastMessage, send }
 }
 
 export default useWebSocket
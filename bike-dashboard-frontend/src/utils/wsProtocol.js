@@ -0,0 +1,126 @@
+// Decodificador das mensagens do WebSocket (ver bike-dashboard-backend/protocol.py)
+//
+// v1: JSON com o estado completo de cada bike ("initial" / "updates").
+// v2: deltas por device com IDs curtos. Cada entrada é [id, mask, ...valores];
+//     o bit i da máscara indica que o campo fields[i] mudou. Os deltas podem
+//     chegar em JSON ou em frames binários (ArrayBuffer).
+
+const FRAME_DELTA = 1
+
+// Tipos binários na ordem dos campos: [tamanho, leitor]
+const BINARY_FIELDS = [
+  [8, (view, off) => view.getFloat64(off, true)],  // timestamp
+  [8, (view, off) => view.getFloat64(off, true)],  // last_seen
+  [4, (view, off) => view.getFloat32(off, true)],  // instant_speed
+  [4, (view, off) => view.getFloat32(off, true)],  // instant_power
+  [4, (view, off) => view.getFloat32(off, true)],  // instant_cadence
+  [4, (view, off) => view.getUint32(off, true)],   // total_distance
+]
+
+export const createDecoder = () => {
+  let fields = []
+  let names = {}  // id -> device
+  let bikes = {}  // device -> objeto no formato v1
+
+  const applyEntry = (id, mask, values, changed) => {
+    const device = names[id]
+    if (!device) return
+    const bike = { ...bikes[device], device }
+    let v = 0
+    for (let i = 0; i < fields.length; i++) {
+      if (mask & (1 << i)) bike[fields[i]] = values[v++]
+    }
+    // last_update em ms (mesmo formato do v1)
+    bike.last_update = bike.last_seen * 1000
+    bikes[device] = bike
+    changed[device] = bike
+  }
+
+  const applyJsonEntries = (entries) => {
+    const changed = {}
+    for (const entry of entries) {
+      applyEntry(entry[0], entry[1], entry.slice(2), changed)
+    }
+    return changed
+  }
+
+  const applyBinary = (buffer) => {
+    const view = new DataView(buffer)
+    if (view.getUint8(0) !== FRAME_DELTA) return null
+    const count = view.getUint16(1, true)
+    const changed = {}
+    let off = 3
+    for (let n = 0; n < count; n++) {
+      const id = view.getUint16(off, true)
+      const mask = view.getUint8(off + 2)
+      off += 3
+      const values = []
+      for (let i = 0; i < BINARY_FIELDS.length; i++) {
+        if (mask & (1 << i)) {
+          const [size, read] = BINARY_FIELDS[i]
+          values.push(read(view, off))
+          off += size
+        }
+      }
+      applyEntry(id, mask, values, changed)
+    }
+    return changed
+  }
+
+  const loadSnapshot = (msg) => {
+    fields = msg.fields
+    names = {}
+    for (const [device, id] of Object.entries(msg.devices)) names[id] = device
+    bikes = {}
+    applyJsonEntries(msg.d)
+    return { ...bikes }
+  }
+
+  // Retorna { type, bikes?, status?, assignments? } ou null
+  const decode = (raw) => {
+    if (raw instanceof ArrayBuffer) {
+      const changed = applyBinary(raw)
+      return changed ? { type: 'delta', bikes: changed } : null
+    }
+
+    const msg = JSON.parse(raw)
+    switch (msg.type) {
+      case 'initial':
+        if (msg.version === 2) {
+          return {
+            type: 'initial',
+            bikes: loadSnapshot(msg),
+            assignments: msg.assignments,
+            assignments_version: msg.assignments_version,
+            leaderboard: msg.leaderboard,
+            status: msg.status,
+          }
+        }
+        return msg
+      case 'snapshot':
+        return { type: 'snapshot', bikes: loadSnapshot(msg), status: msg.status }
+      case 'devices':
+        for (const [device, id] of Object.entries(msg.devices)) names[id] = device
+        return null
+      case 'delta':
+        return { type: 'delta', bikes: applyJsonEntries(msg.d) }
+      case 'updates':
+        // v1: "updates" completo (resync) também traz o status de todas as bikes
+        return { type: 'delta', bikes: msg.bikes, status: msg.status }
+      case 'status':
+        // Bikes removidas pelo backend: o ID pode voltar num frame 'devices' com outro nome
+        for (const [device, state] of Object.entries(msg.devices)) {
+          if (state !== 'evicted') continue
+          delete bikes[device]
+          for (const id of Object.keys(names)) {
+            if (names[id] === device) delete names[id]
+          }
+        }
+        return msg
+      default:
+        return msg
+    }
+  }
+
+  return { decode }
+}